@@ -1,6 +1,6 @@
 from dotenv import load_dotenv
 import os
-from langchain.agents import create_agent
+import threading
 from langchain_core.messages import SystemMessage
 from models import get_llm
 from tools import tools
@@ -30,9 +30,12 @@ else:
     SYSTEM_PROMPT = BASE_SYSTEM_PROMPT 
 
 _agent_instance = None
+_agent_lock = threading.Lock()
 
 def create_agent_instance():
     """Initialize and return the LangChain agent"""
+    # LangChain's agent stack (langgraph) is only imported when the agent is first built
+    from langchain.agents import create_agent
     llm = get_llm()
     
     agent = create_agent(
@@ -48,5 +51,8 @@ def get_agent_with_history():
     """Get agent instance (singleton pattern)"""
     global _agent_instance
     if _agent_instance is None:
-        _agent_instance = create_agent_instance()
+        # Startup pre-warming builds it in a worker thread while requests may already arrive
+        with _agent_lock:
+            if _agent_instance is None:
+                _agent_instance = create_agent_instance()
     return _agent_instance
\ No newline at end of file
@@ -1,6 +1,12 @@
 # Controllers module - business logic separated from routes
-from controllers.ask import process_query
+from controllers.ask import process_query, stream_query
 from controllers.history import get_conversation_history
+from controllers.tool_calls import stream_tool_calls
+from controllers.jobs import submit_job, get_job_status
+from controllers.batch import process_batch
+from controllers.cache import get_response_cache_stats
 
-__all__ = ["process_query", "get_conversation_history"]
+__all__ = ["process_query", "stream_query", "get_conversation_history", "stream_tool_calls",
+           "submit_job", "get_job_status", "process_batch",
+           "get_response_cache_stats"]
 
@@ -1,12 +1,111 @@
+import json
 import uuid
-from typing import Optional
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from agents import get_agent_with_history, SYSTEM_PROMPT
-from storage import memory_store
-from utils.logger import log_conversation, set_request_id
+from typing import Optional, AsyncIterator
+from agents import get_agent_with_history
+from controllers.context import build_context, schedule_summary_update
+from models import get_model_name
+from storage import memory_store, session_queue, response_cache, semantic_memory
+from storage.session_queue import StaleTurnError
+from storage.response_cache import RESPONSE_CACHE_ENABLED, SIDE_EFFECT_TOOLS, conversation_hash
+from utils.logger import log_conversation, logger, set_request_id, set_session_id, track_tools_used
+from utils.executor import run_blocking
 
 
-def process_query(session_id: str, query: str, request_id: Optional[str] = None) -> tuple[str, str, str]:
+async def build_messages(session_id: str, query: str, history: Optional[str] = None) -> tuple[list, dict]:
+    """
+    Build the agent input: system prompt, history within the token budget and the current query.
+    
+    Args:
+        session_id: Session identifier
+        query: User query string
+        history: History strategy, "recent" or "relevant" (default CONTEXT_HISTORY_STRATEGY)
+        
+    Returns:
+        Tuple of (LangChain messages, context stats from controllers.context.build_context)
+    """
+    messages, context = await build_context(session_id, query, history)
+    logger.debug(
+        "Context for session %s: %s/%s messages, %s tokens sent, %s saved", session_id,
+        context["sent_messages"], context["history_messages"], context["sent_tokens"], context["saved_tokens"],
+    )
+    return messages, context
+
+
+async def store_conversation(session_id: str, query: str, response: str, request_id: str, fence_token: Optional[int] = None):
+    """Store the user query and agent response in Redis if available (with request_id in metadata) and index them for recall"""
+    if memory_store:
+        try:
+            # One atomic write; rejected if a later turn took over the session (our lease expired)
+            await memory_store.aadd_turn(session_id, query, response, metadata={"request_id": request_id},
+                                         fence_token=fence_token)
+            # Messages that no longer fit the token budget get folded into the rolling summary
+            schedule_summary_update(session_id)
+        except StaleTurnError as e:
+            log_conversation(session_id, query, response, error=f"Turn not stored: {e}")
+            return
+        except Exception as e:
+            log_conversation(session_id, query, response, error=f"Redis storage error: {e}")
+    
+    if semantic_memory:
+        try:
+            # Embedding and the flock-protected append are blocking; keep them off the event loop
+            await run_blocking(semantic_memory.add_turn, session_id, query, response, request_id)
+        except Exception as e:
+            print(f"[DEBUG] Failed to index turn for recall: {e}")
+
+
+async def finish_request(request_id: str):
+    """Mark the request as finished so live tool-call subscribers can close"""
+    if memory_store:
+        try:
+            await memory_store.amark_request_done(request_id)
+        except Exception as e:
+            print(f"[DEBUG] Failed to mark request {request_id} as done: {e}")
+
+
+def response_cache_key(messages: list, use_cache: Optional[bool] = None) -> Optional[str]:
+    """Return the response cache key for an agent input, or None when caching is off for this request"""
+    if not response_cache:
+        return None
+    enabled = RESPONSE_CACHE_ENABLED if use_cache is None else use_cache
+    return conversation_hash(get_model_name(), messages) if enabled else None
+
+
+async def get_cached_response(cache_key: Optional[str]) -> Optional[str]:
+    """Look up a cached response (cache errors count as a miss)"""
+    if not cache_key:
+        return None
+    try:
+        return await response_cache.get(cache_key)
+    except Exception as e:
+        print(f"[DEBUG] Response cache lookup failed: {e}")
+        return None
+
+
+async def cache_response(cache_key: Optional[str], response: str, tools_used: set):
+    """Cache a fresh response unless a side-effecting tool ran while producing it"""
+    if not cache_key:
+        return
+    try:
+        if tools_used & SIDE_EFFECT_TOOLS:
+            await response_cache.record_bypass()
+        else:
+            await response_cache.set(cache_key, response)
+    except Exception as e:
+        print(f"[DEBUG] Response cache store failed: {e}")
+
+
+def extract_response(result) -> str:
+    """Extract the final AI response text from an agent result"""
+    result_messages = result.get("messages", []) if isinstance(result, dict) else []
+    if result_messages:
+        # Get the last message which should be the AI response
+        return result_messages[-1].content
+    return str(result)
+
+
+async def process_query(session_id: str, query: str, request_id: Optional[str] = None,
+                        use_cache: Optional[bool] = None, history: Optional[str] = None) -> tuple[str, str, str]:
     """
     Process a user query and return the response along with session_id and request_id.
     
@@ -14,6 +113,8 @@ def process_query(session_id: str, query: str, request_id: Optional[str] = None)
         session_id: Session identifier
         query: User query string
         request_id: Optional request ID (will be generated if not provided)
+        use_cache: Use the response cache (default: RESPONSE_CACHE_ENABLED)
+        history: History strategy, "recent" or "relevant" (default CONTEXT_HISTORY_STRATEGY)
         
     Returns:
         Tuple of (response, session_id, request_id)
@@ -22,58 +123,131 @@ def process_query(session_id: str, query: str, request_id: Optional[str] = None)
     if not request_id:
         request_id = str(uuid.uuid4())
     
-    # Set request ID in thread-local storage for tool call tracking
+    # Set request ID in the context; tools run in executor threads with a copy of it
     set_request_id(request_id)
+    set_session_id(session_id)
     print(f"[DEBUG] Set request_id: {request_id} for session: {session_id}")
     
-    # Get conversation history (last 50 messages) if Redis is available
-    history = []
-    if memory_store:
-        try:
-            history = memory_store.get_messages(session_id, limit=50)
-        except Exception as e:
-            log_conversation(session_id, query, "", error=f"Redis error: {e}")
-    
-    # Build messages list with system prompt and history
-    messages = []
-    
-    # Always add system message first to maintain context
-    messages.append(SystemMessage(content=SYSTEM_PROMPT))
+    try:
+        # Turns of the same session run strictly one after another
+        async with session_queue.turn(session_id) as fence_token:
+            messages, context = await build_messages(session_id, query, history)
+            
+            # Identical conversations can be answered from the response cache
+            cache_key = response_cache_key(messages, use_cache)
+            response = await get_cached_response(cache_key)
+            
+            if response is None:
+                tools_used = track_tools_used()
+                
+                # Get agent with history context
+                agent = get_agent_with_history()
+                
+                # Invoke agent with full message history
+                result = await agent.ainvoke({"messages": messages})
+                
+                # Extract the response from the agent result
+                response = extract_response(result)
+                
+                await cache_response(cache_key, response, tools_used)
+            
+            await store_conversation(session_id, query, response, request_id, fence_token)
+    finally:
+        await finish_request(request_id)
     
-    # Add conversation history
-    for msg in history:
-        if msg["role"] == "user":
-            messages.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            messages.append(AIMessage(content=msg["content"]))
+    # Log conversation
+    log_conversation(session_id, query, response)
     
-    # Add current query
-    messages.append(HumanMessage(content=query))
+    return response, session_id, request_id
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Format a payload as a single Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_query(session_id: str, query: str, request_id: Optional[str] = None,
+                       use_cache: Optional[bool] = None, history: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Process a user query and stream the agent run as Server-Sent Events.
     
-    # Get agent with history context
-    agent = get_agent_with_history()
+    Emits, in order: a `start` event with the identifiers, `token` events for every
+    LLM content chunk, `tool_start`/`tool_end` events around each tool call, and a
+    final `message` event (or `error` event) once the agent loop has finished.
     
-    # Invoke agent with full message history
-    result = agent.invoke({"messages": messages})
+    Args:
+        session_id: Session identifier
+        query: User query string
+        request_id: Optional request ID (will be generated if not provided)
+        use_cache: Use the response cache (default: RESPONSE_CACHE_ENABLED)
+        history: History strategy, "recent" or "relevant" (default CONTEXT_HISTORY_STRATEGY)
+        
+    Yields:
+        SSE-formatted strings
+    """
+    if not request_id:
+        request_id = str(uuid.uuid4())
     
-    # Extract the response from the agent result
-    result_messages = result.get("messages", [])
-    if result_messages:
-        # Get the last message which should be the AI response
-        response = result_messages[-1].content
-    else:
-        response = str(result)
+    # Tools run in executor threads with a copy of this context, so they still see the request ID
+    set_request_id(request_id)
+    set_session_id(session_id)
+    yield format_sse("start", {"session_id": session_id, "request_id": request_id})
     
-    # Store conversation in Redis if available (with request_id in metadata)
-    if memory_store:
-        try:
-            memory_store.add_message(session_id, "user", query, metadata={"request_id": request_id})
-            memory_store.add_message(session_id, "assistant", response, metadata={"request_id": request_id})
-        except Exception as e:
-            log_conversation(session_id, query, response, error=f"Redis storage error: {e}")
+    try:
+        # Turns of the same session run strictly one after another
+        async with session_queue.turn(session_id) as fence_token:
+            messages, context = await build_messages(session_id, query, history)
+            cache_key = response_cache_key(messages, use_cache)
+            response = await get_cached_response(cache_key)
+            if response is not None:
+                await store_conversation(session_id, query, response, request_id, fence_token)
+                yield format_sse("message", {
+                    "response": response, "session_id": session_id, "request_id": request_id, "cached": True,
+                    "context": context,
+                })
+                return
+            
+            tools_used = track_tools_used()
+            agent = get_agent_with_history()
+            
+            async for event in agent.astream_events({"messages": messages}, version="v2"):
+                kind = event["event"]
+                
+                if kind == "on_chat_model_stream":
+                    content = event["data"]["chunk"].content
+                    if content:
+                        yield format_sse("token", {"content": content})
+                elif kind == "on_tool_start":
+                    yield format_sse("tool_start", {
+                        "run_id": event["run_id"],
+                        "tool_name": event["name"],
+                        "input": event["data"].get("input"),
+                    })
+                elif kind == "on_tool_end":
+                    output = event["data"].get("output")
+                    yield format_sse("tool_end", {
+                        "run_id": event["run_id"],
+                        "tool_name": event["name"],
+                        "output": getattr(output, "content", output),
+                    })
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # End of the root graph run carries the final agent state
+                    response = extract_response(event["data"].get("output"))
+            
+            if response is None:
+                response = ""
+            
+            await cache_response(cache_key, response, tools_used)
+            await store_conversation(session_id, query, response, request_id, fence_token)
+    except Exception as e:
+        log_conversation(session_id, query, "", error=str(e))
+        yield format_sse("error", {"error": str(e), "session_id": session_id, "request_id": request_id})
+        return
+    finally:
+        await finish_request(request_id)
     
-    # Log conversation
     log_conversation(session_id, query, response)
     
-    return response, session_id, request_id
-
+    yield format_sse("message", {
+        "response": response, "session_id": session_id, "request_id": request_id, "context": context
+    })
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+import uuid
+from typing import AsyncIterator, List, Optional
+from controllers.ask import process_query
+from middleware.admission import admit_item
+from utils.cuid import generate_cuid
+
+# Upper bound for per-batch concurrency, whatever the client asks for
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+# Default per-item timeout in seconds
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT", 300))
+# Max items per batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
+
+
+async def process_batch(
+    items: List[dict],
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    api_key: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Run independent queries through process_query with bounded concurrency.
+    
+    Each item is admitted like a single /api/v1/chat request when it starts: it takes
+    tokens from its session and API key buckets and an in-flight slot, and fails with
+    an error line instead of running when over a limit.
+    
+    Args:
+        items: Dicts with query and optional session_id/request_id/use_cache/history
+        concurrency: Max queries in flight (capped at BATCH_MAX_CONCURRENCY)
+        timeout: Per-item timeout in seconds (default BATCH_ITEM_TIMEOUT)
+        api_key: Rate limit bucket ID of the client (see middleware.admission.client_key)
+    
+    Yields:
+        One NDJSON line per item, in completion order. Each line carries the item's
+        index in the request plus either response or error.
+    """
+    concurrency = max(1, min(concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    timeout = timeout or BATCH_ITEM_TIMEOUT
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run_item(index: int, item: dict) -> dict:
+        session_id = item.get("session_id") or generate_cuid()
+        request_id = item.get("request_id") or str(uuid.uuid4())
+        result = {"index": index, "session_id": session_id, "request_id": request_id}
+        
+        async with semaphore:
+            release, rejected = await admit_item(session_id, api_key)
+            if rejected:
+                result["error"] = rejected
+                return result
+            try:
+                response, _, _ = await asyncio.wait_for(
+                    process_query(session_id, item["query"], request_id=request_id, use_cache=item.get("use_cache"),
+                                  history=item.get("history")),
+                    timeout=timeout,
+                )
+                result["response"] = response
+            except asyncio.TimeoutError:
+                result["error"] = f"Timed out after {timeout}s"
+            except Exception as e:
+                result["error"] = str(e)
+            finally:
+                release()
+        return result
+    
+    tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        # Client went away or the generator was closed early: stop outstanding work
+        for task in tasks:
+            task.cancel()
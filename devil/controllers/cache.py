@@ -0,0 +1,42 @@
+from storage import response_cache, memory_store, tool_cache
+
+
+async def get_response_cache_stats() -> dict:
+    """
+    Get response cache statistics.
+    
+    Returns:
+        Dictionary with hits, misses, stores, bypassed, evictions, hit_rate and entries
+    """
+    if not response_cache:
+        raise ValueError("Redis not available")
+    
+    return await response_cache.stats()
+
+
+def get_history_cache_stats() -> dict:
+    """
+    Get history cache statistics for this worker process.
+    
+    Returns:
+        Dictionary with hits, misses, bypassed, fills, write_throughs, invalidations,
+        evictions, hit_rate, entries, messages, approx_bytes and the configured limits
+    """
+    if not memory_store or memory_store.history_cache is None:
+        raise ValueError("History cache disabled")
+    
+    return memory_store.history_cache.stats()
+
+
+def get_tool_cache_stats() -> dict:
+    """
+    Get tool result cache statistics for this worker process.
+    
+    Returns:
+        Dictionary with hits, revalidated, misses, stores, redis_hits, evictions, errors,
+        hit_rate, entries, approx_bytes and the configured limits
+    """
+    if tool_cache is None:
+        raise ValueError("Tool cache disabled")
+    
+    return tool_cache.stats()
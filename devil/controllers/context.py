@@ -0,0 +1,390 @@
+"""
+Token-budgeted context assembly with a rolling summary of older history.
+
+The last CONTEXT_HISTORY_MESSAGES messages are fetched as before (through the
+history cache, which also memoizes their token counts). The newest of them that
+fit in CONTEXT_TOKEN_BUDGET are sent as they are; any single message is first cut
+to CONTEXT_MESSAGE_MAX_TOKENS (head and tail kept), so one pasted log cannot crowd
+out the rest of the conversation.
+
+Messages that no longer fit are represented by a rolling summary stored per
+session (MemoryStore.get_summary). After each turn, only the messages that dropped
+out of the window since the last update are folded into the stored summary, so it
+is never regenerated from scratch. Folding runs after the response is stored and
+never delays a request; until it catches up, the newest dropped messages are left
+out of the context.
+
+History strategies (CONTEXT_HISTORY_STRATEGY, or `history` per request):
+    recent    the newest messages that fit the budget
+    relevant  the last CONTEXT_RECENT_TURNS turns verbatim plus the up to
+              CONTEXT_RELEVANT_TURNS older turns (out of the last
+              CONTEXT_RELEVANT_POOL_MESSAGES messages) that best match the query,
+              scored locally with BM25 and weighted towards recent turns
+"""
+import asyncio
+import math
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from agents import SYSTEM_PROMPT
+from storage import memory_store
+from storage.text_index import bm25_scores, term_frequencies, tokenize
+from utils.logger import log_conversation, logger
+from utils.tokens import count_message_tokens, count_tokens, truncate_tokens
+
+# Messages fetched per request (the budget decides how many are sent)
+CONTEXT_HISTORY_MESSAGES = int(os.getenv("CONTEXT_HISTORY_MESSAGES", 50))
+# Tokens of history and summary sent per request (0 sends all fetched messages unchanged)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 8000))
+# Longer messages are cut to their head and tail
+CONTEXT_MESSAGE_MAX_TOKENS = int(os.getenv("CONTEXT_MESSAGE_MAX_TOKENS", 2000))
+# Summarize messages that no longer fit instead of dropping them
+CONTEXT_SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "true").lower() == "true"
+# Size cap of the rolling summary; reserved in the budget once history no longer fits
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", 800))
+# Tokens of new messages folded into the summary per LLM call
+CONTEXT_SUMMARY_BATCH_TOKENS = int(os.getenv("CONTEXT_SUMMARY_BATCH_TOKENS", 6000))
+
+# Default history strategy: "recent" or "relevant" (see module docstring)
+CONTEXT_HISTORY_STRATEGY = os.getenv("CONTEXT_HISTORY_STRATEGY", "recent").lower()
+# Messages searched for relevant turns by the "relevant" strategy
+CONTEXT_RELEVANT_POOL_MESSAGES = int(os.getenv("CONTEXT_RELEVANT_POOL_MESSAGES", 400))
+# Latest turns always sent verbatim by the "relevant" strategy
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", 3))
+# Older turns added by relevance (only those sharing terms with the query)
+CONTEXT_RELEVANT_TURNS = int(os.getenv("CONTEXT_RELEVANT_TURNS", 5))
+# Share of a turn's score given to recency (the rest is lexical relevance)
+CONTEXT_RECENCY_WEIGHT = float(os.getenv("CONTEXT_RECENCY_WEIGHT", 0.3))
+# Turns after which the recency bonus halves
+CONTEXT_RECENCY_HALF_LIFE = float(os.getenv("CONTEXT_RECENCY_HALF_LIFE", 20))
+
+HISTORY_STRATEGIES = ("recent", "relevant")
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an AI agent with shell access.
+Update the summary with the new messages. Keep facts, decisions, file paths, commands, errors and open tasks; drop small talk.
+Write at most {max_words} words as plain prose or short bullets. Reply with the updated summary only."""
+
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+
+# (message, content as sent, tokens as sent, tokens of the full message)
+Counted = Tuple[Dict, str, int, int]
+
+_stats = {"requests": 0, "history_tokens": 0, "sent_tokens": 0, "saved_tokens": 0, "truncated_messages": 0,
+          "relevant_turns": 0, "summary_updates": 0, "summarized_messages": 0, "summary_failures": 0}
+# Running summary updates by session, so a session is never folded twice at once
+_summary_tasks: Dict[str, asyncio.Task] = {}
+_summary_llm = None
+
+
+def with_token_counts(history: List[Dict]) -> List[Counted]:
+    """Count tokens of stored messages (cached with the history, see MemoryStore.aget_history)"""
+    counted = []
+    for message in history:
+        if message["role"] not in ("user", "assistant"):
+            continue
+        content = truncate_tokens(message["content"], CONTEXT_MESSAGE_MAX_TOKENS)
+        full_tokens = count_message_tokens(message["content"])
+        tokens = full_tokens if content is message["content"] else count_message_tokens(content)
+        counted.append((message, content, tokens, full_tokens))
+    return counted
+
+
+def _timestamp_ms(message: Dict) -> int:
+    try:
+        return int(datetime.fromisoformat(message["timestamp"]).timestamp() * 1000)
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+
+def select_window(history: List[Counted], summary: Optional[Dict]) -> int:
+    """
+    Pick the messages sent as they are.
+    
+    Args:
+        history: Messages with token counts, oldest first
+        summary: Stored rolling summary, if any
+    
+    Returns:
+        Index of the oldest message sent; older ones are left to the summary
+    """
+    if not CONTEXT_TOKEN_BUDGET:
+        return 0
+    summary_tokens = count_message_tokens(summary["summary"]) if summary else 0
+    if sum(tokens for _, _, tokens, _ in history) + summary_tokens <= CONTEXT_TOKEN_BUDGET:
+        return 0
+    
+    # Reserve the summary's cap rather than its current size, so the window does not
+    # move each time the summary grows
+    remaining = CONTEXT_TOKEN_BUDGET - (CONTEXT_SUMMARY_MAX_TOKENS if CONTEXT_SUMMARY_ENABLED else 0)
+    start = len(history)
+    while start > 0 and history[start - 1][2] <= remaining:
+        start -= 1
+        remaining -= history[start][2]
+    return start
+
+
+def _unsummarized(history: List[Counted], start: int, summary: Optional[Dict]) -> List[Counted]:
+    """Messages before the window that the summary does not cover yet"""
+    dropped = history[:start]
+    if not summary:
+        return dropped
+    for position, (message, _, _, _) in enumerate(dropped):
+        if message.get("id") == summary["through_id"]:
+            return dropped[position + 1:]
+    # The last summarized message is no longer fetched; fall back to timestamps
+    return [item for item in dropped if _timestamp_ms(item[0]) > summary["through_ms"]]
+
+
+def with_counts_and_terms(history: List[Dict]) -> list:
+    """with_token_counts plus the term frequencies of the same messages (cached with the history)"""
+    terms = [term_frequencies(message["content"])[0] for message in history if message["role"] in ("user", "assistant")]
+    return [with_token_counts(history), terms]
+
+
+def _turns(history: List[Counted]) -> List[List[int]]:
+    """Group message positions into turns, each starting at a user message"""
+    turns = []
+    for position, (message, _, _, _) in enumerate(history):
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(position)
+    return turns
+
+
+def score_turns(turns: List[List[int]], terms: List[Dict[str, int]], query: str) -> List[float]:
+    """
+    Score turns against a query: BM25 relevance scaled to [0, 1], blended with recency.
+    
+    Args:
+        turns: Message positions per turn, oldest first
+        terms: Term frequencies per message position
+        query: User query string
+    
+    Returns:
+        Score per turn; 0 for turns sharing no term with the query
+    """
+    query_terms = set(tokenize(query))
+    postings: Dict[str, Dict[int, float]] = {term: {} for term in query_terms}
+    lengths = {}
+    for number, turn in enumerate(turns):
+        lengths[number] = sum(sum(terms[position].values()) for position in turn)
+        for position in turn:
+            for term in query_terms.intersection(terms[position]):
+                postings[term][number] = postings[term].get(number, 0) + terms[position][term]
+    
+    relevance = bm25_scores(
+        {term: docs for term, docs in postings.items() if docs},
+        lengths,
+        len(turns),
+        sum(lengths.values()) / len(turns) if turns else 0,
+        range(len(turns)),
+    )
+    best = max(relevance.values(), default=0)
+    if not best:
+        return [0.0] * len(turns)
+    scores = []
+    for number in range(len(turns)):
+        if not relevance[number]:
+            scores.append(0.0)
+            continue
+        recency = math.pow(0.5, (len(turns) - 1 - number) / CONTEXT_RECENCY_HALF_LIFE)
+        scores.append((1 - CONTEXT_RECENCY_WEIGHT) * relevance[number] / best + CONTEXT_RECENCY_WEIGHT * recency)
+    return scores
+
+
+def select_relevant(history: List[Counted], terms: List[Dict[str, int]], query: str,
+                    summary: Optional[Dict]) -> Tuple[List[int], int]:
+    """
+    Pick the messages sent by the "relevant" strategy.
+    
+    The last CONTEXT_RECENT_TURNS turns come first (newest first, while they fit the
+    budget), then the best scoring older turns that still fit.
+    
+    Returns:
+        Tuple of (message positions to send in chronological order, relevant turns added)
+    """
+    turns = _turns(history)
+    recent_count = min(CONTEXT_RECENT_TURNS, len(turns))
+    older = turns[:len(turns) - recent_count]
+    
+    remaining = math.inf
+    if CONTEXT_TOKEN_BUDGET:
+        remaining = CONTEXT_TOKEN_BUDGET - (count_message_tokens(summary["summary"]) if summary else 0)
+    
+    chosen = []
+    for turn in reversed(turns[len(turns) - recent_count:]):
+        cost = sum(history[position][2] for position in turn)
+        if cost > remaining:
+            break
+        chosen.extend(turn)
+        remaining -= cost
+    
+    added = 0
+    scores = score_turns(older, terms, query)
+    ranked = sorted((number for number in range(len(older)) if scores[number]), key=lambda n: -scores[n])
+    for number in ranked[:CONTEXT_RELEVANT_TURNS]:
+        cost = sum(history[position][2] for position in older[number])
+        if cost <= remaining:
+            chosen.extend(older[number])
+            remaining -= cost
+            added += 1
+    return sorted(chosen), added
+
+
+async def build_context(session_id: str, query: str, strategy: Optional[str] = None) -> Tuple[list, Dict]:
+    """
+    Build the agent input within the token budget.
+    
+    Args:
+        session_id: Session identifier
+        query: User query string
+        strategy: History strategy, "recent" or "relevant" (default CONTEXT_HISTORY_STRATEGY)
+    
+    Returns:
+        Tuple of (LangChain messages, context stats: messages and tokens fetched and sent,
+        tokens saved against sending the last CONTEXT_HISTORY_MESSAGES messages unchanged)
+    
+    Raises:
+        ValueError: Unknown strategy
+    """
+    strategy = (strategy or CONTEXT_HISTORY_STRATEGY).lower()
+    if strategy not in HISTORY_STRATEGIES:
+        raise ValueError(f"Unknown history strategy '{strategy}' (expected {' or '.join(HISTORY_STRATEGIES)})")
+    limit = CONTEXT_RELEVANT_POOL_MESSAGES if strategy == "relevant" else CONTEXT_HISTORY_MESSAGES
+    
+    history: List[Counted] = []
+    terms: List[Dict[str, int]] = []
+    summary = None
+    if memory_store:
+        try:
+            if strategy == "relevant":
+                history, terms = await memory_store.aget_history(session_id, limit=limit, view=with_counts_and_terms)
+            else:
+                history = await memory_store.aget_history(session_id, limit=limit, view=with_token_counts)
+            if CONTEXT_SUMMARY_ENABLED:
+                summary = await memory_store.aget_summary(session_id)
+        except Exception as e:
+            log_conversation(session_id, query, "", error=f"Redis error: {e}")
+    
+    relevant_turns = 0
+    if strategy == "relevant":
+        positions, relevant_turns = select_relevant(history, terms, query, summary)
+        kept = [history[position] for position in positions]
+    else:
+        kept = history[select_window(history, summary):]
+    
+    messages = [SystemMessage(content=SYSTEM_PROMPT)]
+    sent_tokens = 0
+    if summary and (len(kept) < len(history) or len(history) == limit):
+        # Separate from the system prompt, which then stays a stable prompt-cache prefix
+        messages.append(SystemMessage(content=SUMMARY_HEADER + summary["summary"]))
+        sent_tokens += count_message_tokens(messages[-1].content)
+    for message, content, tokens, _ in kept:
+        messages.append(HumanMessage(content=content) if message["role"] == "user" else AIMessage(content=content))
+        sent_tokens += tokens
+    messages.append(HumanMessage(content=query))
+    
+    # Baseline: what was sent before budgeting, the last CONTEXT_HISTORY_MESSAGES messages in full
+    history_tokens = sum(full_tokens for _, _, _, full_tokens in history[-CONTEXT_HISTORY_MESSAGES:])
+    stats = {
+        "strategy": strategy,
+        "history_messages": len(history),
+        "sent_messages": len(kept),
+        "relevant_turns": relevant_turns,
+        "truncated_messages": sum(1 for _, _, tokens, full_tokens in kept if tokens != full_tokens),
+        "summarized_messages": summary["messages"] if summary else 0,
+        "history_tokens": history_tokens,
+        "sent_tokens": sent_tokens,
+        "saved_tokens": history_tokens - sent_tokens,
+    }
+    _stats["requests"] += 1
+    for field in ("history_tokens", "sent_tokens", "saved_tokens", "truncated_messages", "relevant_turns"):
+        _stats[field] += stats[field]
+    return messages, stats
+
+
+def _get_summary_llm():
+    global _summary_llm
+    if _summary_llm is None:
+        from models import get_llm
+        _summary_llm = get_llm()
+    return _summary_llm
+
+
+async def _fold(summary: str, batch: List[Counted]) -> str:
+    """Fold one batch of messages into the summary with a single LLM call"""
+    transcript = "\n\n".join(f"{message['role']}: {content}" for message, content, _, _ in batch)
+    response = await _get_summary_llm().ainvoke([
+        SystemMessage(content=SUMMARY_PROMPT.format(max_words=CONTEXT_SUMMARY_MAX_TOKENS * 3 // 4)),
+        HumanMessage(content=f"Current summary:\n{summary or '(none yet)'}\n\nNew messages:\n{transcript}"),
+    ])
+    return truncate_tokens(response.content.strip(), CONTEXT_SUMMARY_MAX_TOKENS)
+
+
+async def update_summary(session_id: str):
+    """Fold messages that dropped out of the context window into the session's rolling summary"""
+    history = await memory_store.aget_history(session_id, limit=CONTEXT_HISTORY_MESSAGES, view=with_token_counts)
+    summary = await memory_store.aget_summary(session_id)
+    pending = _unsummarized(history, select_window(history, summary), summary)
+    if not pending:
+        return
+    
+    text = summary["summary"] if summary else ""
+    batch, batch_tokens = [], 0
+    for item in pending:
+        if batch and batch_tokens + item[2] > CONTEXT_SUMMARY_BATCH_TOKENS:
+            text = await _fold(text, batch)
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += item[2]
+    text = await _fold(text, batch)
+    
+    last = pending[-1][0]
+    stored = await memory_store.aset_summary(session_id, {
+        "summary": text,
+        "through_id": last.get("id"),
+        "through_ms": _timestamp_ms(last),
+        "messages": (summary["messages"] if summary else 0) + len(pending),
+        "tokens": count_tokens(text),
+        "updated_at": datetime.now().isoformat(),
+    })
+    if stored:
+        _stats["summary_updates"] += 1
+        _stats["summarized_messages"] += len(pending)
+    logger.debug("Folded %s messages into the summary of session %s", len(pending), session_id)
+
+
+async def _run_summary_update(session_id: str):
+    try:
+        await update_summary(session_id)
+    except Exception as e:
+        _stats["summary_failures"] += 1
+        print(f"[DEBUG] Failed to update summary for session {session_id}: {e}")
+    finally:
+        _summary_tasks.pop(session_id, None)
+
+
+def schedule_summary_update(session_id: str):
+    """Update the session's rolling summary in the background (no-op if one is running)"""
+    if not memory_store or not CONTEXT_SUMMARY_ENABLED or not CONTEXT_TOKEN_BUDGET:
+        return
+    if session_id in _summary_tasks:
+        return
+    _summary_tasks[session_id] = asyncio.create_task(_run_summary_update(session_id))
+
+
+def get_context_stats() -> Dict:
+    """
+    Get context budgeting counters for this worker process.
+    
+    Returns:
+        Dictionary with requests, history/sent/saved token totals, truncated messages,
+        summary updates, summarized messages, summary failures and the configured budget
+    """
+    return {
+        **_stats,
+        "summaries_running": len(_summary_tasks),
+        "token_budget": CONTEXT_TOKEN_BUDGET,
+        "summary_max_tokens": CONTEXT_SUMMARY_MAX_TOKENS,
+    }
@@ -1,24 +1,70 @@
+import hashlib
+from typing import Optional
 from storage import memory_store
 
 
-def get_conversation_history(session_id: str, limit: int = 50) -> dict:
+def history_etag(version: int, limit: int, before: Optional[str] = None, after: Optional[str] = None) -> str:
     """
-    Get conversation history for a session.
+    ETag of one history page: the session's version plus a hash of the page parameters,
+    so a tag cached for one page never validates another page of the same version
+    """
+    params = hashlib.sha1(f"{limit}\0{before or ''}\0{after or ''}".encode("utf-8")).hexdigest()[:12]
+    return f'"{version}-{params}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value matches an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+
+async def get_history_version(session_id: str) -> int:
+    """
+    Get the version of a session's history without reading any messages.
+    
+    Args:
+        session_id: Session identifier
+    
+    Returns:
+        Version number (changes whenever messages are added)
+    """
+    if not memory_store:
+        raise ValueError("Redis not available")
+    
+    return await memory_store.aget_history_version(session_id)
+
+
+async def get_conversation_history(session_id: str, limit: int = 50, before: Optional[str] = None,
+                                   after: Optional[str] = None) -> Optional[dict]:
+    """
+    Get conversation history for a session, one page at a time.
     
     Args:
         session_id: Session identifier
         limit: Maximum number of messages to retrieve
-        
+        before: Page backwards from this message ID (older_cursor of the previous page)
+        after: Page forwards from this message ID (newer_cursor of the previous page)
+    
     Returns:
-        Dictionary with session_id, messages, and count
+        Dictionary with session_id, messages, count, version and the older/newer cursors,
+        or None if the cursor message is not in the session
     """
     if not memory_store:
         raise ValueError("Redis not available")
     
-    messages = memory_store.get_messages(session_id, limit=limit)
+    page = await memory_store.aget_messages_page(session_id, limit=limit, before=before, after=after)
+    if page is None:
+        return None
+    
+    messages = page["messages"]
     return {
         "session_id": session_id,
         "messages": messages,
-        "count": len(messages)
+        "count": len(messages),
+        "version": page["version"],
+        # Pass as `before` / `after` to fetch the adjacent page; None at either end
+        "older_cursor": messages[0].get("id") if page["has_older"] and messages else None,
+        "newer_cursor": messages[-1].get("id") if page["has_newer"] and messages else None,
     }
-
@@ -0,0 +1,43 @@
+import uuid
+from typing import Optional
+from storage import job_queue
+
+
+async def submit_job(session_id: str, query: str, request_id: Optional[str] = None,
+                     use_cache: Optional[bool] = None, history: Optional[str] = None) -> dict:
+    """
+    Enqueue a query for the background worker fleet.
+    
+    Args:
+        session_id: Session identifier
+        query: User query string
+        request_id: Optional request ID (will be generated if not provided)
+        use_cache: Use the response cache (default: RESPONSE_CACHE_ENABLED)
+        history: History strategy, "recent" or "relevant" (default CONTEXT_HISTORY_STRATEGY)
+        
+    Returns:
+        Job status record (status is "queued" for a new job)
+    """
+    if not job_queue:
+        raise ValueError("Redis not available")
+    
+    if not request_id:
+        request_id = str(uuid.uuid4())
+    
+    return await job_queue.enqueue(request_id, session_id, query, use_cache=use_cache, history=history)
+
+
+async def get_job_status(request_id: str) -> Optional[dict]:
+    """
+    Get status and result of a background job.
+    
+    Args:
+        request_id: Request identifier returned by submit_job
+        
+    Returns:
+        Job status record, or None if the job is unknown or expired
+    """
+    if not job_queue:
+        raise ValueError("Redis not available")
+    
+    return await job_queue.get_job(request_id)
@@ -0,0 +1,11 @@
+def get_llm_stats() -> dict:
+    """
+    Get LLM endpoint pool statistics for this worker process.
+    
+    Returns:
+        Dictionary with calls, failovers, hedges, hedge_wins, cheap_routed, failures and,
+        per endpoint, requests, errors, timeouts, error_rate, latency and p95 in ms
+    """
+    # Imported here so that loading the routes does not pull in langchain_openai
+    from models.pool import get_pool_stats
+    return get_pool_stats()
@@ -0,0 +1,39 @@
+from storage import async_redis_client, memory_store
+from storage.memory import RedisMemoryStore
+from storage.retention import read_stats
+from utils.executor import run_blocking
+
+
+def _redis_store() -> RedisMemoryStore:
+    if not isinstance(memory_store, RedisMemoryStore):
+        raise ValueError("Redis not available")
+    return memory_store
+
+
+async def get_retention_stats() -> dict:
+    """
+    Get the results and usage totals of the last retention pass.
+    
+    Returns:
+        Dictionary with last_run (moved sessions, messages, bytes, dropped tool outputs),
+        usage (Redis keys and bytes per key family, cold archive totals from that pass)
+        and cold (current cold archive totals)
+    """
+    store = _redis_store()
+    stats = await read_stats(async_redis_client)
+    stats["cold"] = await run_blocking(store.cold_archive.total_usage)
+    return stats
+
+
+async def get_session_usage(session_id: str) -> dict:
+    """
+    Get the bytes a session uses in Redis and in the cold archive.
+    
+    Args:
+        session_id: Session identifier
+    
+    Returns:
+        Dictionary with redis_bytes per key family, cold (messages, bytes, raw_bytes) and total_bytes
+    """
+    store = _redis_store()
+    return await run_blocking(store.session_usage, session_id)
@@ -1,13 +1,26 @@
-from storage import memory_store
-from typing import List, Dict
+from storage import memory_store, session_queue
+from storage.session_queue import SESSION_QUEUE_MAX_DEPTH
+from typing import Dict, Optional
 
-def get_all_sessions() -> List[Dict]:
-    """Get all sessions with session_id and last_message"""
+async def get_all_sessions(cursor: Optional[str] = None, limit: int = 50) -> Dict:
+    """Get a page of sessions (session_id, last_message, last_activity), most recently active first"""
     if not memory_store:
-        return []
+        return {"sessions": [], "next_cursor": None}
     
     try:
-        return memory_store.get_all_sessions()
+        sessions, next_cursor = await memory_store.alist_sessions(cursor=cursor, limit=limit)
+        return {"sessions": sessions, "next_cursor": next_cursor}
+    except ValueError:
+        # Malformed cursor
+        raise
     except Exception as e:
         raise Exception(f"Failed to retrieve sessions: {str(e)}")
 
+
+async def get_session_queue(session_id: str) -> Dict:
+    """Get queue depth (running + waiting turns) for a session"""
+    return {
+        "session_id": session_id,
+        "depth": await session_queue.depth(session_id),
+        "max_depth": SESSION_QUEUE_MAX_DEPTH
+    }
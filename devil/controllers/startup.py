@@ -0,0 +1,112 @@
+"""
+Startup timing and background pre-warming of the API process.
+
+main.py records how long importing the app took. Heavy dependencies are no
+longer imported by it: the agent stack (langchain, langgraph, langchain_openai)
+loads when the agent is first built and each tool module on the tool's first
+call. The lifespan hook then runs prewarm() in the background so the first
+request does not pay for those either:
+
+    agent      build the agent (imports the agent stack and compiles the graph)
+    tools      import every tool module (ddgs, bs4, requests, ...)
+    tokenizer  load the tiktoken encoding used for context budgeting
+    llm        open a connection to every LLM endpoint (TLS handshake included)
+    storage    open a pooled async Redis connection and the history cache subscription
+
+Requests are served meanwhile; one arriving early simply does the remaining work
+itself. For a per-module breakdown of import time, run `python -X importtime main.py`.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from utils.executor import run_blocking
+from utils.logger import logger
+
+# Build the agent and open connections in the background after startup
+STARTUP_PREWARM = os.getenv("STARTUP_PREWARM", "true").lower() == "true"
+
+_stats: Dict[str, Any] = {
+    "import_ms": None,
+    "prewarm": "disabled" if not STARTUP_PREWARM else "pending",
+    "prewarm_ms": None,
+    "steps_ms": {},
+    "errors": {},
+}
+
+
+def record_import_time(seconds: float):
+    """Record how long importing the app took"""
+    _stats["import_ms"] = round(seconds * 1000, 1)
+    logger.info(f"App imported in {_stats['import_ms']} ms")
+
+
+async def _step(name: str, warm: Callable[[], Awaitable]):
+    start = time.perf_counter()
+    try:
+        await warm()
+    except Exception as e:
+        _stats["errors"][name] = str(e)
+        print(f"[DEBUG] Prewarm step {name} failed: {e}")
+    _stats["steps_ms"][name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+async def _warm_agent():
+    from agents import get_agent_with_history
+    await run_blocking(get_agent_with_history)
+
+
+async def _warm_tools():
+    from tools import preload
+    await run_blocking(preload)
+
+
+async def _warm_tokenizer():
+    from utils.tokens import count_tokens
+    await run_blocking(count_tokens, "prewarm")
+
+
+async def _warm_llm():
+    from models.pool import get_pool
+    await get_pool().prewarm()
+
+
+async def _warm_storage():
+    from storage import memory_store
+    if memory_store is not None:
+        await memory_store.awarm()
+
+
+async def prewarm():
+    """Pay the first request's one-off costs ahead of time, recording each step's duration"""
+    _stats["prewarm"] = "running"
+    start = time.perf_counter()
+    # The agent first: it imports what the LLM step needs
+    await _step("agent", _warm_agent)
+    await asyncio.gather(
+        _step("tools", _warm_tools),
+        _step("tokenizer", _warm_tokenizer),
+        _step("llm", _warm_llm),
+        _step("storage", _warm_storage),
+    )
+    _stats["prewarm_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    _stats["prewarm"] = "done"
+    logger.info(f"Prewarm finished in {_stats['prewarm_ms']} ms: {_stats['steps_ms']}")
+
+
+def start_prewarm() -> Optional[asyncio.Task]:
+    """Run prewarm() as a background task unless STARTUP_PREWARM is off"""
+    if not STARTUP_PREWARM:
+        return None
+    return asyncio.create_task(prewarm())
+
+
+def get_startup_stats() -> dict:
+    """
+    Get startup timing of this worker process.
+    
+    Returns:
+        Dictionary with import_ms, prewarm (disabled, pending, running or done),
+        prewarm_ms, per-step durations (steps_ms) and errors by step
+    """
+    return {**_stats, "steps_ms": dict(_stats["steps_ms"]), "errors": dict(_stats["errors"])}
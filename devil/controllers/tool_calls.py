@@ -0,0 +1,70 @@
+import json
+import time
+from typing import AsyncIterator
+from storage import memory_store
+from controllers.ask import format_sse
+
+# Seconds between keep-alive comments while waiting for tool events
+KEEPALIVE_INTERVAL = 15
+# Give up on a subscription that has seen no events for this long (seconds)
+SUBSCRIPTION_IDLE_TIMEOUT = 30 * 60
+
+
+async def stream_tool_calls(request_id: str) -> AsyncIterator[str]:
+    """
+    Stream tool-call events for a request as Server-Sent Events.
+    
+    Subscribes to the request's Redis channel first, then sends a `snapshot` of the
+    tool calls stored so far, followed by live `tool_start`/`tool_call` deltas and a
+    final `done` event. Tool calls already in the snapshot are not sent again.
+    
+    Args:
+        request_id: Request identifier
+        
+    Yields:
+        SSE-formatted strings
+    """
+    if not memory_store:
+        raise ValueError("Redis not available")
+    
+    # Subscribe before reading the snapshot so no event can fall in between
+    pubsub = await memory_store.asubscribe_tool_events(request_id)
+    try:
+        tool_calls = await memory_store.aget_tool_calls(request_id)
+        seen = len(tool_calls)
+        yield format_sse("snapshot", {"request_id": request_id, "tool_calls": tool_calls})
+        
+        if await memory_store.ais_request_done(request_id):
+            yield format_sse("done", {"request_id": request_id})
+            return
+        
+        last_event = time.monotonic()
+        last_send = last_event
+        while True:
+            message = await pubsub.get_message(timeout=1.0)
+            now = time.monotonic()
+            
+            if message is None:
+                if now - last_event > SUBSCRIPTION_IDLE_TIMEOUT:
+                    return
+                if now - last_send > KEEPALIVE_INTERVAL:
+                    last_send = now
+                    yield ": keep-alive\n\n"
+                continue
+            
+            last_event = last_send = now
+            event = json.loads(message["data"])
+            event_type = event.pop("type", "tool_call")
+            
+            if event_type == "done":
+                yield format_sse("done", {"request_id": request_id})
+                return
+            if event_type == "tool_call":
+                # Skip calls that were already part of the snapshot
+                if event.get("index", seen + 1) <= seen:
+                    continue
+                seen = max(seen, event.get("index", seen + 1))
+            
+            yield format_sse(event_type, event)
+    finally:
+        await pubsub.aclose()
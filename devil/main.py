@@ -1,8 +1,16 @@
+import time
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from routes import router
 from middleware.logging_filter import setup_tool_calls_log_filter
+from middleware.admission import AdmissionControlMiddleware
+from controllers.startup import record_import_time, start_prewarm
+
+record_import_time(time.perf_counter() - _import_started)
 
 # Load env
 load_dotenv()
@@ -10,7 +18,20 @@ load_dotenv()
 # Setup logging filter to suppress tool-calls endpoint logs
 setup_tool_calls_log_filter()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the agent and open LLM/Redis connections without delaying startup
+    prewarm_task = start_prewarm()
+    yield
+    if prewarm_task is not None:
+        prewarm_task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Rate limiting and in-flight cap (added before CORS so 429s still carry CORS headers)
+app.add_middleware(AdmissionControlMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -22,6 +43,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the UI read history ETags for conditional requests
+    expose_headers=["ETag"],
 )
 
 # Register routes
@@ -0,0 +1,111 @@
+"""
+Maintenance commands for the agent's Redis data.
+
+    python manage.py backfill-sessions
+    python manage.py backfill-search
+    python manage.py hash-tag-keys
+    python manage.py migrate-storage
+    python manage.py retention
+"""
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def backfill_sessions(args):
+    """Build the sessions sorted set and preview hash from existing conversations"""
+    from storage import memory_store
+    
+    if not memory_store:
+        raise SystemExit("Redis not available")
+    
+    count = memory_store.backfill_session_index()
+    print(f"Indexed {count} sessions")
+
+
+def backfill_search(args):
+    """Build the keyword search index from existing conversations"""
+    from storage import memory_store
+    
+    if not memory_store:
+        raise SystemExit("Redis not available")
+    
+    count = memory_store.backfill_search_index()
+    print(f"Indexed {count} sessions for search")
+
+
+def hash_tag_keys(args):
+    """Rename existing Redis keys to hash-tagged names (run with REDIS_HASH_TAGS=true before moving to a cluster)"""
+    from storage import memory_store, session_queue
+    from storage.memory import RedisMemoryStore
+    
+    if not isinstance(memory_store, RedisMemoryStore):
+        raise SystemExit("Redis not available")
+    
+    try:
+        count = memory_store.hash_tag_keys([session_queue.lock_key, session_queue.depth_key])
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"Renamed {count} keys")
+
+
+def migrate_storage(args):
+    """Rewrite stored messages and tool calls in the STORAGE_FORMAT encoding (json by default)"""
+    from storage import memory_store
+    from storage.memory import RedisMemoryStore
+    from storage.serialization import STORAGE_FORMAT
+    
+    if not isinstance(memory_store, RedisMemoryStore):
+        raise SystemExit("Redis not available")
+    
+    totals = memory_store.migrate_encoding()
+    print(f"Rewrote {totals['values']} values in {totals['keys']} keys as {STORAGE_FORMAT}")
+
+
+def retention(args):
+    """Run one retention pass now (trim, archive, drop old tool outputs; see storage/retention.py)"""
+    import asyncio
+    from storage import memory_store, session_queue
+    from storage.memory import RedisMemoryStore
+    from storage.retention import RetentionWorker
+    
+    if not isinstance(memory_store, RedisMemoryStore):
+        raise SystemExit("Redis not available")
+    
+    results = asyncio.run(RetentionWorker(memory_store, session_queue).run_once())
+    if results is None:
+        raise SystemExit("Another retention pass is running")
+    print(
+        f"Archived {results['archived_sessions']} sessions and trimmed {results['trimmed_sessions']} "
+        f"({results['archived_messages']} messages, {results['archived_bytes']} bytes on disk), "
+        f"dropped {results['tool_outputs_dropped']} tool outputs, pruned {results['search_docs_pruned']} search docs "
+        f"and {results['sessions_pruned']} expired sessions, "
+        f"expired {results['cold_segments_expired']} cold segments ({results['cold_messages_expired']} messages)"
+    )
+
+
+COMMANDS = {
+    "backfill-sessions": backfill_sessions,
+    "backfill-search": backfill_search,
+    "hash-tag-keys": hash_tag_keys,
+    "migrate-storage": migrate_storage,
+    "retention": retention,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("backfill-sessions", help=backfill_sessions.__doc__)
+    subparsers.add_parser("backfill-search", help=backfill_search.__doc__)
+    subparsers.add_parser("hash-tag-keys", help=hash_tag_keys.__doc__)
+    subparsers.add_parser("migrate-storage", help=migrate_storage.__doc__)
+    subparsers.add_parser("retention", help=retention.__doc__)
+    
+    args = parser.parse_args()
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import json
+import math
+import os
+from typing import Callable, Dict, Optional, Tuple
+from starlette.responses import JSONResponse
+from utils.logger import logger
+
+# Max agent runs in flight in each worker process (not fleet-wide); requests beyond this get 429 immediately.
+# It bounds this process's event loop and Redis pool; limit the fleet with RATE_LIMIT_GLOBAL_RPS.
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", 64))
+
+# Endpoints that start LLM work and are therefore rate limited. /api/v1/chat/batch is
+# not listed: process_batch admits each item with admit_item instead.
+RATE_LIMITED_PATHS = {"/api/v1/chat", "/api/v1/chat/stream", "/api/v1/jobs"}
+# Endpoints that run the agent inside this worker and count against LLM_MAX_INFLIGHT
+INFLIGHT_PATHS = {"/api/v1/chat", "/api/v1/chat/stream"}
+
+
+class ProcessInflightLimiter:
+    """
+    Non-blocking counter of agent requests running in this process.
+    
+    Deliberately per process: it protects this event loop and its Redis connection
+    pool, which is sized from the same limit. The fleet-wide in-flight total is
+    this limit times the number of worker processes.
+    """
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.inflight = 0
+    
+    def try_acquire(self) -> bool:
+        if self.inflight >= self.limit:
+            return False
+        self.inflight += 1
+        return True
+    
+    def release(self):
+        self.inflight -= 1
+
+
+process_inflight_limiter = ProcessInflightLimiter(LLM_MAX_INFLIGHT)
+
+
+def client_key(headers: Dict[str, str], client_host: Optional[str]) -> Optional[str]:
+    """API key bucket ID: X-API-Key, bearer token, or client IP when neither is sent (lower-cased header names)"""
+    api_key = headers.get("x-api-key")
+    if not api_key and headers.get("authorization", "").lower().startswith("bearer "):
+        api_key = headers["authorization"][7:]
+    if not api_key and client_host:
+        api_key = f"ip:{client_host}"
+    return api_key
+
+
+async def check_rate_limit(session_id: Optional[str], api_key: Optional[str]) -> float:
+    """Take a token from every applicable bucket; seconds to wait if over a limit, else 0 (fails open)"""
+    from storage import rate_limiter
+    
+    if not rate_limiter:
+        return 0.0
+    try:
+        return await rate_limiter.check(session_id, api_key)
+    except Exception as e:
+        logger.error(f"[ADMISSION] Rate limiter unavailable, admitting request: {e}")
+        return 0.0
+
+
+async def admit_item(session_id: Optional[str], api_key: Optional[str]) -> Tuple[Optional[Callable[[], None]], Optional[str]]:
+    """
+    Admit one agent run that bypasses the middleware (a batch item).
+    
+    Returns:
+        (release, None) when admitted; call release once the run finished.
+        (None, reason) when a rate limit or the in-flight cap rejects it.
+    """
+    retry_after = await check_rate_limit(session_id, api_key)
+    if retry_after > 0:
+        return None, f"Rate limit exceeded, retry after {max(1, math.ceil(retry_after))}s"
+    if not process_inflight_limiter.try_acquire():
+        return None, "Too many requests in flight on this worker"
+    return process_inflight_limiter.release, None
+
+
+async def _buffer_body(receive):
+    """Read the whole request body and return it with a receive callable that replays it"""
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    body = b"".join(chunks)
+    
+    replayed = False
+    
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+    
+    return body, replay
+
+
+def _session_id_from_body(body: bytes):
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return None
+    return payload.get("session_id") if isinstance(payload, dict) else None
+
+
+class AdmissionControlMiddleware:
+    """
+    Fail-fast admission control for endpoints that start LLM work.
+    
+    Each request takes a token from its session bucket, its API key bucket (X-API-Key,
+    bearer token, or client IP when neither is sent) and the optional global bucket in
+    Redis. Agent-running requests must also fit under the per-process in-flight cap.
+    Anything over a limit gets 429 with Retry-After right away instead of queueing
+    until it times out. Redis errors fail open. Batch requests are admitted item by
+    item in process_batch (admit_item), so a batch cannot bypass either limit.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in RATE_LIMITED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        
+        session_id = headers.get("x-session-id")
+        if not session_id:
+            # The UI sends the session in the JSON body; peek at it and replay it downstream
+            body, receive = await _buffer_body(receive)
+            session_id = _session_id_from_body(body)
+        
+        api_key = client_key(headers, scope["client"][0] if scope.get("client") else None)
+        
+        retry_after = await check_rate_limit(session_id, api_key)
+        if retry_after > 0:
+            await self._reject(scope, receive, send, "Rate limit exceeded", retry_after)
+            return
+        
+        counts_inflight = scope["path"] in INFLIGHT_PATHS
+        if counts_inflight and not process_inflight_limiter.try_acquire():
+            await self._reject(scope, receive, send, "Too many requests in flight on this worker", 1)
+            return
+        
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if counts_inflight:
+                process_inflight_limiter.release()
+    
+    async def _reject(self, scope, receive, send, reason: str, retry_after: float):
+        response = JSONResponse(
+            {"detail": reason},
+            status_code=429,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
@@ -1,22 +1,25 @@
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 
 load_dotenv()
 
+def get_model_name() -> str:
+    """
+    Get the configured model name (all pool models when LLM_POOL_CONFIG is set).
+    """
+    if os.getenv("LLM_POOL_CONFIG"):
+        from models.pool import get_pool
+        return ",".join(sorted({endpoint.model for endpoint in get_pool().endpoints}))
+    return os.getenv("LLM_MODEL") or ""
+
 def get_llm():
     """
     Get LLM instance based on configuration.
-    """
-    model_name = os.getenv("LLM_MODEL")
-    api_key = os.getenv("LLM_API_KEY")
-    temperature = 0
-    base_url = os.getenv("LLM_BASE_URL")
     
-    return ChatOpenAI(
-        model=model_name,
-        temperature=temperature,
-        openai_api_key=api_key,
-        openai_api_base=base_url,
-    )
-
+    Calls go through the process-wide endpoint pool (models.pool), which routes,
+    fails over and hedges across the endpoints of LLM_POOL_CONFIG, or uses the
+    single LLM_MODEL / LLM_BASE_URL endpoint without one. The pool module (and
+    with it langchain_openai) is imported on first use to keep startup fast.
+    """
+    from models.pool import PooledChatModel
+    return PooledChatModel()
@@ -0,0 +1,532 @@
+"""
+Pool of OpenAI-compatible chat endpoints behind one LangChain chat model.
+
+LLM_POOL_CONFIG points to a JSON file listing the endpoints:
+
+    [
+        {"name": "primary", "model": "gpt-4o", "base_url": "https://...", "api_key_env": "LLM_API_KEY", "weight": 2},
+        {"name": "backup", "model": "gpt-4o", "base_url": "https://...", "api_key_env": "BACKUP_API_KEY"},
+        {"name": "mini", "model": "gpt-4o-mini", "base_url": "https://...", "tier": "cheap"}
+    ]
+
+Optional fields: api_key (instead of api_key_env), weight (1), tier ("default"
+or "cheap") and timeout (LLM_POOL_TIMEOUT). Without a config file the pool has a
+single endpoint built from LLM_MODEL / LLM_API_KEY / LLM_BASE_URL.
+
+Routing: each call picks an endpoint of its tier at random, weighted by
+weight / (EWMA latency * (1 + LLM_POOL_ERROR_PENALTY * EWMA error rate)), so slow
+or failing endpoints get less traffic without being starved of samples. After
+LLM_POOL_EJECT_AFTER consecutive failures an endpoint is skipped for
+LLM_POOL_EJECT_SECONDS unless nothing else is left.
+
+Failover: connection errors, timeouts and 408/409/429/5xx responses move the call
+to the next endpoint, up to LLM_POOL_MAX_ATTEMPTS attempts. Anything else (other
+4xx, errors raised while handling a response) is raised at once: another endpoint
+would fail the same way. Streams fail over only until the first chunk arrives.
+
+Hedging (LLM_HEDGE_ENABLED): when an attempt has not answered (or, for streams,
+produced its first chunk) after the endpoint's p95 latency, a duplicate goes to
+the next endpoint and the first to answer wins; the other is cancelled. Every
+attempt (failovers and hedges included) can be hedged once.
+
+Cheap tier (LLM_CHEAP_ROUTING, used when "cheap" endpoints exist): calls without
+tools (e.g. summary folding) and the first step of a session's first turn with a
+short query go to cheap endpoints, falling back to the default tier on failure.
+
+Stats are per process (get_pool_stats).
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import openai
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_openai import ChatOpenAI
+from utils.tokens import count_tokens
+
+# JSON file listing the pool's endpoints (see module docstring); unset uses LLM_MODEL / LLM_BASE_URL
+LLM_POOL_CONFIG = os.getenv("LLM_POOL_CONFIG", "")
+# Seconds an attempt may take (for streams: until the first chunk) before failing over
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", 120))
+# Attempts per call across endpoints (an endpoint is retried when fewer are available)
+LLM_POOL_MAX_ATTEMPTS = int(os.getenv("LLM_POOL_MAX_ATTEMPTS", 3))
+# Base delay before retrying an endpoint already tried in the same call (doubles each time)
+LLM_POOL_RETRY_BACKOFF = float(os.getenv("LLM_POOL_RETRY_BACKOFF", 0.5))
+# Weight of the newest sample in the latency and error-rate EWMAs
+LLM_POOL_EWMA_ALPHA = float(os.getenv("LLM_POOL_EWMA_ALPHA", 0.2))
+# How strongly the error rate lowers an endpoint's share of traffic
+LLM_POOL_ERROR_PENALTY = float(os.getenv("LLM_POOL_ERROR_PENALTY", 4))
+# Consecutive failures after which an endpoint is skipped, and for how long
+LLM_POOL_EJECT_AFTER = int(os.getenv("LLM_POOL_EJECT_AFTER", 3))
+LLM_POOL_EJECT_SECONDS = float(os.getenv("LLM_POOL_EJECT_SECONDS", 30))
+# Send a duplicate request to another endpoint once an attempt exceeds its p95 latency
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+# Lower bound of the hedge delay in seconds
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 1.0))
+# Latency samples needed before an endpoint's p95 is trusted for hedging
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+# Route tool-less calls and short first-turn queries to "cheap" endpoints
+LLM_CHEAP_ROUTING = os.getenv("LLM_CHEAP_ROUTING", "true").lower() == "true"
+# Longest first-turn query (tokens) still considered simple
+LLM_CHEAP_MAX_QUERY_TOKENS = int(os.getenv("LLM_CHEAP_MAX_QUERY_TOKENS", 64))
+
+# Latency samples kept per endpoint for the p95
+LATENCY_WINDOW = 200
+
+# Call kinds with separate latency stats: full responses, and first chunk of streams
+KINDS = ("generate", "stream")
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether another attempt (on another endpoint) can succeed where this one failed"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 409, 429)
+    # APITimeoutError is an APIConnectionError
+    return isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError))
+
+
+class Endpoint:
+    """One model on one OpenAI-compatible endpoint, with its health stats"""
+    
+    def __init__(self, name: str, model: str, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 weight: float = 1.0, tier: str = "default", timeout: float = LLM_POOL_TIMEOUT):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.weight = weight
+        self.tier = tier
+        self.timeout = timeout
+        # Failover and retries are handled by the pool
+        self.llm = ChatOpenAI(
+            model=model,
+            temperature=0,
+            openai_api_key=api_key,
+            openai_api_base=base_url,
+            timeout=timeout,
+            max_retries=0,
+        )
+        self.lock = threading.Lock()
+        self.latency: Dict[str, Optional[float]] = {kind: None for kind in KINDS}
+        self.samples: Dict[str, deque] = {kind: deque(maxlen=LATENCY_WINDOW) for kind in KINDS}
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+    
+    def ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+    
+    def started(self):
+        with self.lock:
+            self.inflight += 1
+            self.requests += 1
+    
+    def succeeded(self, kind: str, seconds: float):
+        with self.lock:
+            self.inflight -= 1
+            previous = self.latency[kind]
+            self.latency[kind] = seconds if previous is None else (
+                LLM_POOL_EWMA_ALPHA * seconds + (1 - LLM_POOL_EWMA_ALPHA) * previous
+            )
+            self.samples[kind].append(seconds)
+            self.error_rate *= 1 - LLM_POOL_EWMA_ALPHA
+            self.consecutive_failures = 0
+    
+    def failed(self, timeout: bool = False):
+        with self.lock:
+            self.inflight -= 1
+            self.errors += 1
+            self.timeouts += timeout
+            self.error_rate = LLM_POOL_EWMA_ALPHA + (1 - LLM_POOL_EWMA_ALPHA) * self.error_rate
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= LLM_POOL_EJECT_AFTER:
+                self.ejected_until = time.monotonic() + LLM_POOL_EJECT_SECONDS
+    
+    def released(self):
+        """Attempt abandoned (cancelled hedge or client disconnect): neither success nor failure"""
+        with self.lock:
+            self.inflight -= 1
+    
+    def p95(self, kind: str) -> Optional[float]:
+        samples = sorted(self.samples[kind])
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            latency = {kind: round(value * 1000, 1) if value is not None else None for kind, value in self.latency.items()}
+            p95 = {kind: round(value * 1000, 1) if value is not None else None
+                   for kind, value in ((kind, self.p95(kind)) for kind in KINDS)}
+            return {
+                "name": self.name,
+                "model": self.model,
+                "tier": self.tier,
+                "weight": self.weight,
+                "inflight": self.inflight,
+                "requests": self.requests,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "error_rate": round(self.error_rate, 4),
+                "latency_ms": latency["generate"],
+                "p95_ms": p95["generate"],
+                "first_chunk_latency_ms": latency["stream"],
+                "first_chunk_p95_ms": p95["stream"],
+                "consecutive_failures": self.consecutive_failures,
+                "ejected_for_s": round(max(0.0, self.ejected_until - time.monotonic()), 1),
+            }
+
+
+def load_endpoints(path: str = LLM_POOL_CONFIG) -> List[Endpoint]:
+    """Endpoints from the pool config file, or the single LLM_MODEL endpoint without one"""
+    if not path:
+        return [Endpoint(
+            name="default",
+            model=os.getenv("LLM_MODEL") or "",
+            base_url=os.getenv("LLM_BASE_URL"),
+            api_key=os.getenv("LLM_API_KEY"),
+        )]
+    
+    with open(path) as f:
+        config = json.load(f)
+    endpoints = []
+    for index, entry in enumerate(config):
+        api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", "LLM_API_KEY"))
+        endpoints.append(Endpoint(
+            name=entry.get("name") or f"endpoint-{index}",
+            model=entry["model"],
+            base_url=entry.get("base_url"),
+            api_key=api_key,
+            weight=float(entry.get("weight", 1)),
+            tier=entry.get("tier", "default"),
+            timeout=float(entry.get("timeout", LLM_POOL_TIMEOUT)),
+        ))
+    if not endpoints:
+        raise ValueError(f"LLM pool config {path} lists no endpoints")
+    return endpoints
+
+
+class LLMPool:
+    """Endpoint selection, failover and hedging shared by every PooledChatModel of a process"""
+    
+    def __init__(self, endpoints: List[Endpoint]):
+        self.endpoints = endpoints
+        self.has_cheap_tier = any(endpoint.tier == "cheap" for endpoint in endpoints)
+        self._stats = {"calls": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0, "cheap_routed": 0, "failures": 0}
+    
+    def tier_for(self, messages: List[BaseMessage], tools_bound: bool) -> str:
+        """Tier of a call: "cheap" for tool-less calls and simple first turns, else "default" """
+        if not (LLM_CHEAP_ROUTING and self.has_cheap_tier):
+            return "default"
+        if not tools_bound:
+            return "cheap"
+        if any(isinstance(message, AIMessage) for message in messages):
+            return "default"
+        queries = [message for message in messages if isinstance(message, HumanMessage)]
+        if len(queries) == 1 and count_tokens(str(queries[0].content)) <= LLM_CHEAP_MAX_QUERY_TOKENS:
+            return "cheap"
+        return "default"
+    
+    def _score(self, endpoint: Endpoint, kind: str, fallback_latency: float) -> float:
+        latency = max(endpoint.latency[kind] or fallback_latency, 0.001)
+        return endpoint.weight / (latency * (1 + LLM_POOL_ERROR_PENALTY * endpoint.error_rate))
+    
+    def order(self, tier: str, kind: str) -> List[Endpoint]:
+        """
+        Endpoints in the order a call tries them.
+        
+        Healthy endpoints of the tier come first in a weighted-random order, then
+        healthy endpoints of other tiers, then ejected ones (best score first).
+        """
+        now = time.monotonic()
+        known = [endpoint.latency[kind] for endpoint in self.endpoints if endpoint.latency[kind] is not None]
+        # Endpoints without samples score like the fastest known one, so they get tried
+        fallback = min(known) if known else 1.0
+        scores = {endpoint.name: self._score(endpoint, kind, fallback) for endpoint in self.endpoints}
+        
+        preferred = [e for e in self.endpoints if e.tier == tier and not e.ejected(now)]
+        ordered = []
+        while preferred:
+            chosen = random.choices(preferred, weights=[scores[e.name] for e in preferred])[0]
+            preferred.remove(chosen)
+            ordered.append(chosen)
+        others = [e for e in self.endpoints if e.tier != tier and not e.ejected(now)]
+        ejected = [e for e in self.endpoints if e.ejected(now)]
+        for group in (others, ejected):
+            ordered.extend(sorted(group, key=lambda e: scores[e.name], reverse=True))
+        return ordered
+    
+    def _attempts(self, endpoints: List[Endpoint]) -> Iterator[Endpoint]:
+        for attempt in range(max(1, LLM_POOL_MAX_ATTEMPTS)):
+            yield endpoints[attempt % len(endpoints)]
+    
+    def _hedge_delay(self, endpoint: Endpoint, kind: str) -> Optional[float]:
+        if not LLM_HEDGE_ENABLED or len(endpoint.samples[kind]) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return max(LLM_HEDGE_MIN_DELAY, endpoint.p95(kind))
+    
+    async def _attempt(self, endpoint: Endpoint, kind: str, call: Callable, retry: int):
+        if retry:
+            await asyncio.sleep(LLM_POOL_RETRY_BACKOFF * 2 ** (retry - 1))
+        endpoint.started()
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(call(endpoint), endpoint.timeout)
+        except asyncio.TimeoutError:
+            endpoint.failed(timeout=True)
+            raise
+        except asyncio.CancelledError:
+            endpoint.released()
+            raise
+        except Exception as e:
+            if _is_retryable(e):
+                endpoint.failed()
+            else:
+                endpoint.released()
+            raise
+        endpoint.succeeded(kind, time.monotonic() - start)
+        return result
+    
+    async def acall(self, tier: str, kind: str, call: Callable, discard: Optional[Callable] = None):
+        """
+        Run `call(endpoint)` with failover and optional hedging.
+        
+        Args:
+            tier: Preferred tier
+            kind: "generate" or "stream" (which latency stats apply)
+            call: Coroutine function of the endpoint
+            discard: Coroutine function cleaning up the result of an attempt that lost a race
+        
+        Returns:
+            Result of the first successful attempt
+        """
+        self._stats["calls"] += 1
+        if tier == "cheap":
+            self._stats["cheap_routed"] += 1
+        attempts = self._attempts(self.order(tier, kind))
+        tried: Dict[str, int] = {}
+        pending: Dict[asyncio.Task, Endpoint] = {}
+        # Attempts already hedged, and the hedges themselves
+        hedged: set = set()
+        hedges: set = set()
+        last_error: Optional[BaseException] = None
+        
+        def launch() -> Optional[asyncio.Task]:
+            endpoint = next(attempts, None)
+            if endpoint is None:
+                return None
+            retry = tried.get(endpoint.name, 0)
+            tried[endpoint.name] = retry + 1
+            task = asyncio.ensure_future(self._attempt(endpoint, kind, call, retry))
+            pending[task] = endpoint
+            return task
+        
+        launch()
+        try:
+            while pending:
+                delay = None
+                current = next(iter(pending))
+                if len(pending) == 1 and current not in hedged:
+                    delay = self._hedge_delay(pending[current], kind)
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Launched or not (nothing left to hedge with), stop waiting for the delay
+                    hedged.add(current)
+                    hedge = launch()
+                    if hedge is not None:
+                        hedges.add(hedge)
+                        self._stats["hedges"] += 1
+                    continue
+                
+                winner = None
+                for task in done:
+                    endpoint = pending.pop(task)
+                    if task.exception() is None:
+                        if winner is None:
+                            winner = task
+                        elif discard is not None:
+                            await discard(task.result())
+                        continue
+                    last_error = task.exception()
+                    if not _is_retryable(last_error):
+                        raise last_error
+                    print(f"[DEBUG] LLM endpoint {endpoint.name} failed: {last_error!r}")
+                if winner is not None:
+                    if winner in hedges and pending:
+                        self._stats["hedge_wins"] += 1
+                    return winner.result()
+                # Wait for an in-flight hedge before trying further endpoints
+                if not pending:
+                    if not launch():
+                        break
+                    self._stats["failovers"] += 1
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                results = await asyncio.gather(*pending, return_exceptions=True)
+                if discard is not None:
+                    for result in results:
+                        if not isinstance(result, BaseException):
+                            await discard(result)
+        
+        self._stats["failures"] += 1
+        raise last_error
+    
+    def call(self, tier: str, call: Callable):
+        """Blocking counterpart of acall: failover only, no hedging"""
+        self._stats["calls"] += 1
+        if tier == "cheap":
+            self._stats["cheap_routed"] += 1
+        last_error: Optional[BaseException] = None
+        tried: Dict[str, int] = {}
+        for endpoint in self._attempts(self.order(tier, "generate")):
+            retry = tried.get(endpoint.name, 0)
+            tried[endpoint.name] = retry + 1
+            if last_error is not None:
+                self._stats["failovers"] += 1
+            if retry:
+                time.sleep(LLM_POOL_RETRY_BACKOFF * 2 ** (retry - 1))
+            endpoint.started()
+            start = time.monotonic()
+            try:
+                result = call(endpoint)
+            except Exception as e:
+                if not _is_retryable(e):
+                    endpoint.released()
+                    raise
+                endpoint.failed(timeout=isinstance(e, openai.APITimeoutError))
+                print(f"[DEBUG] LLM endpoint {endpoint.name} failed: {e!r}")
+                last_error = e
+                continue
+            endpoint.succeeded("generate", time.monotonic() - start)
+            return result
+        
+        self._stats["failures"] += 1
+        raise last_error
+    
+    async def prewarm(self):
+        """Open a connection (TLS included) to every endpoint ahead of the first call"""
+        async def warm(endpoint: Endpoint):
+            try:
+                await endpoint.llm.root_async_client.models.list()
+            except Exception as e:
+                # An endpoint without a models listing still leaves the connection open
+                print(f"[DEBUG] LLM endpoint {endpoint.name} prewarm: {e!r}")
+        
+        await asyncio.gather(*(warm(endpoint) for endpoint in self.endpoints))
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "hedging": LLM_HEDGE_ENABLED,
+            "cheap_routing": LLM_CHEAP_ROUTING and self.has_cheap_tier,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
+
+
+_pool: Optional[LLMPool] = None
+_pool_lock = threading.Lock()
+
+
+async def _anext(iterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+def get_pool() -> LLMPool:
+    """The process-wide pool (created on first use)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = LLMPool(load_endpoints())
+    return _pool
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Per-endpoint latency and error stats plus failover/hedge counters of this process"""
+    return get_pool().stats()
+
+
+class PooledChatModel(BaseChatModel):
+    """Chat model that sends each call to an endpoint of the process-wide LLMPool"""
+    
+    @property
+    def _llm_type(self) -> str:
+        return "llm-pool"
+    
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"endpoints": [(endpoint.name, endpoint.model) for endpoint in get_pool().endpoints]}
+    
+    def bind_tools(self, tools, *, tool_choice=None, strict: Optional[bool] = None, **kwargs):
+        """Bind tools in the OpenAI format every endpoint accepts"""
+        formatted = [convert_to_openai_tool(tool, strict=strict) for tool in tools]
+        if tool_choice == "any":
+            tool_choice = "required"
+        elif isinstance(tool_choice, str) and tool_choice not in ("auto", "none", "required"):
+            tool_choice = {"type": "function", "function": {"name": tool_choice}}
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        return self.bind(tools=formatted, **kwargs)
+    
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        pool = get_pool()
+        tier = pool.tier_for(messages, "tools" in kwargs)
+        return pool.call(tier, lambda endpoint: endpoint.llm._generate(messages, stop=stop, **kwargs))
+    
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        pool = get_pool()
+        tier = pool.tier_for(messages, "tools" in kwargs)
+        
+        async def call(endpoint: Endpoint) -> ChatResult:
+            return await endpoint.llm._agenerate(messages, stop=stop, **kwargs)
+        
+        return await pool.acall(tier, "generate", call)
+    
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        pool = get_pool()
+        tier = pool.tier_for(messages, "tools" in kwargs)
+        
+        async def open_stream(endpoint: Endpoint):
+            # Attempts race (and fail over) until their first chunk; the rest is read from the winner
+            iterator = endpoint.llm._astream(messages, stop=stop, **kwargs).__aiter__()
+            try:
+                return iterator, await iterator.__anext__()
+            except StopAsyncIteration:
+                return iterator, None
+            except BaseException:
+                await iterator.aclose()
+                raise
+        
+        async def close_stream(opened):
+            await opened[0].aclose()
+        
+        iterator, chunk = await pool.acall(tier, "stream", open_stream, discard=close_stream)
+        try:
+            while chunk is not None:
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                chunk = await _anext(iterator)
+        finally:
+            await iterator.aclose()
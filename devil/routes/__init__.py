@@ -1,9 +1,21 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from pydantic import BaseModel
-from typing import Optional, List, Dict
-from controllers.ask import process_query
-from controllers.history import get_conversation_history
-from controllers.sessions import get_all_sessions
+from typing import Optional, List, Dict, Literal
+from controllers.ask import process_query, stream_query
+from controllers.history import get_conversation_history, get_history_version, history_etag, etag_matches
+from controllers.sessions import get_all_sessions, get_session_queue
+from controllers.tool_calls import stream_tool_calls
+from controllers.jobs import submit_job, get_job_status
+from controllers.batch import BATCH_MAX_ITEMS, process_batch
+from controllers.cache import get_response_cache_stats, get_history_cache_stats, get_tool_cache_stats
+from controllers.context import get_context_stats
+from controllers.llm import get_llm_stats
+from controllers.startup import get_startup_stats
+from controllers.retention import get_retention_stats, get_session_usage
+from middleware.admission import client_key
+from storage import session_queue
+from storage.session_queue import SessionBusyError
 
 router = APIRouter()
 
@@ -12,6 +24,9 @@ class QueryRequest(BaseModel):
     query: str
     session_id: Optional[str] = None
     request_id: Optional[str] = None
+    use_cache: Optional[bool] = None
+    # History strategy: "recent" or "relevant" (default CONTEXT_HISTORY_STRATEGY)
+    history: Optional[Literal["recent", "relevant"]] = None
 
 
 class QueryResponse(BaseModel):
@@ -20,49 +35,109 @@ class QueryResponse(BaseModel):
     request_id: str
 
 
+class JobResponse(BaseModel):
+    request_id: str
+    session_id: str
+    status: str
+    attempts: int = 0
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+
 class ErrorResponse(BaseModel):
     error: str
 
 
 @router.get("/")
-def home():
+async def home():
     return {"status": "Agent System is running"}
 
 @router.get("/api/v1/health")
-def health():
+async def health():
     return {"status": "Agent System is running"}
 
+@router.get("/api/v1/startup")
+async def startup_stats():
+    """Get this worker's import and pre-warm timings"""
+    return get_startup_stats()
+
 @router.get("/api/v1/history/{session_id}")
-def get_history(session_id: str, limit: int = 100):
-    """Get conversation history for a session"""
+async def get_history(
+    session_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    before: Optional[str] = Query(None, description="older_cursor from the previous page"),
+    after: Optional[str] = Query(None, description="newer_cursor from the previous page"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+):
+    """Get conversation history for a session (cursor-paginated; 304 if the ETag still matches)"""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Pass either before or after, not both")
+    # Clients may reuse their copy but must revalidate it every time
+    headers = {"Cache-Control": "no-cache"}
     try:
-        return get_conversation_history(session_id, limit=limit)
+        if if_none_match:
+            etag = history_etag(await get_history_version(session_id), limit, before, after)
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={**headers, "ETag": etag})
+        
+        history = await get_conversation_history(session_id, limit=limit, before=before, after=after)
     except ValueError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"Message {before or after} not found in session {session_id}")
+    return JSONResponse(history, headers={**headers, "ETag": history_etag(history["version"], limit, before, after)})
 
 
 @router.get("/api/v1/sessions")
-def get_sessions():
-    """Get all sessions with session_id and last_message"""
+async def get_sessions(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=500),
+):
+    """Get sessions with session_id and last_message, most recently active first (paginated)"""
+    try:
+        return await get_all_sessions(cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/v1/sessions/{session_id}/queue")
+async def get_session_queue_depth(session_id: str):
+    """Get the number of running and waiting turns for a session"""
     try:
-        sessions = get_all_sessions()
-        return {"sessions": sessions}
+        return await get_session_queue(session_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/v1/sessions/{session_id}/usage")
+async def session_usage(session_id: str):
+    """Get the bytes a session uses in Redis and in the cold archive"""
+    try:
+        return await get_session_usage(session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/api/v1/tool-calls/{request_id}")
-def get_tool_calls(request_id: str):
-    """Get all tool calls for a specific request ID"""
+async def get_tool_calls(request_id: str, full: bool = Query(False)):
+    """Get all tool calls for a specific request ID (large outputs as previews unless full=true)"""
     try:
         from storage import memory_store
         
         if not memory_store:
             raise HTTPException(status_code=503, detail="Redis not available")
         
-        tool_calls = memory_store.get_tool_calls(request_id)
+        tool_calls = await memory_store.aget_tool_calls(request_id, full=full)
         return {"request_id": request_id, "tool_calls": tool_calls}
     except ValueError as e:
         raise HTTPException(status_code=503, detail=str(e))
@@ -70,8 +145,54 @@ def get_tool_calls(request_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/api/v1/tool-calls/{request_id}/stream")
+async def get_tool_calls_stream(request_id: str):
+    """Stream tool calls for a request as Server-Sent Events (snapshot, then live deltas)"""
+    try:
+        events = stream_tool_calls(request_id)
+        # Prime the generator so a missing Redis surfaces as a proper HTTP error
+        first = await events.__anext__()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def replay():
+        yield first
+        async for event in events:
+            yield event
+    
+    return StreamingResponse(
+        replay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/api/v1/tool-calls/{request_id}/{index}")
+async def get_tool_call(request_id: str, index: int):
+    """Get one tool call (1-based index) with its full, decompressed output"""
+    try:
+        from storage import memory_store
+        
+        if not memory_store:
+            raise HTTPException(status_code=503, detail="Redis not available")
+        
+        tool_call = await memory_store.aget_tool_call(request_id, index)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if tool_call is None:
+        raise HTTPException(status_code=404, detail=f"Tool call {index} not found for request {request_id}")
+    return {"request_id": request_id, "tool_call": tool_call}
+
+
 @router.post("/api/v1/chat", response_model=QueryResponse)
-def ask(request: QueryRequest, x_session_id: Optional[str] = Header(None, alias="X-Session-ID")):
+async def ask(request: QueryRequest, x_session_id: Optional[str] = Header(None, alias="X-Session-ID")):
     """Handle user query and return agent response"""
     from utils.cuid import generate_cuid
     
@@ -86,10 +207,143 @@ def ask(request: QueryRequest, x_session_id: Optional[str] = Header(None, alias=
     request_id = request.request_id
     
     try:
-        response, session_id, request_id = process_query(session_id, request.query, request_id=request_id)
+        response, session_id, request_id = await process_query(session_id, request.query, request_id=request_id, use_cache=request.use_cache,
+                                                               history=request.history)
         return QueryResponse(response=response, session_id=session_id, request_id=request_id)
+    except SessionBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         from utils.logger import log_conversation
         log_conversation(session_id, request.query, "", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/api/v1/chat/stream")
+async def ask_stream(request: QueryRequest, x_session_id: Optional[str] = Header(None, alias="X-Session-ID")):
+    """Handle user query and stream tokens, tool events and the final message as Server-Sent Events"""
+    from utils.cuid import generate_cuid
+    
+    # Use session_id from header or request body, or generate new CUID
+    session_id = x_session_id or request.session_id or generate_cuid()
+    
+    # Reject before opening the stream if the session's queue is already full
+    if await session_queue.is_full(session_id):
+        raise HTTPException(status_code=429, detail=f"Session {session_id} has too many queued turns")
+    
+    return StreamingResponse(
+        stream_query(session_id, request.query, request_id=request.request_id, use_cache=request.use_cache,
+                     history=request.history),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Disable proxy buffering so events flush immediately
+        },
+    )
+
+
+@router.post("/api/v1/chat/batch")
+async def ask_batch(
+    requests: List[QueryRequest],
+    http_request: Request,
+    concurrency: Optional[int] = Query(None, ge=1, description="Max queries in flight"),
+    timeout: Optional[float] = Query(None, gt=0, description="Per-item timeout in seconds"),
+):
+    """Run many independent queries and stream results as NDJSON in completion order"""
+    if not requests:
+        raise HTTPException(status_code=400, detail="No requests provided")
+    if len(requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} requests per batch")
+    
+    api_key = client_key(dict(http_request.headers), http_request.client.host if http_request.client else None)
+    return StreamingResponse(
+        process_batch([r.model_dump() for r in requests], concurrency=concurrency, timeout=timeout, api_key=api_key),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/api/v1/cache/stats")
+async def cache_stats():
+    """Get response cache hit/miss counters and size"""
+    try:
+        return await get_response_cache_stats()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/v1/history-cache/stats")
+async def history_cache_stats():
+    """Get this worker's history cache hit rate and memory use"""
+    try:
+        return get_history_cache_stats()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/api/v1/tool-cache/stats")
+async def tool_cache_stats():
+    """Get this worker's tool result cache hit rate and memory use"""
+    try:
+        return get_tool_cache_stats()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/api/v1/context/stats")
+async def context_stats():
+    """Get this worker's context token budgeting and summary counters"""
+    return get_context_stats()
+
+
+@router.get("/api/v1/llm/stats")
+async def llm_stats():
+    """Get this worker's per-endpoint LLM latency, error and failover stats"""
+    try:
+        return get_llm_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/v1/retention/stats")
+async def retention_stats():
+    """Get the last retention pass and storage usage totals"""
+    try:
+        return await get_retention_stats()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/api/v1/jobs", response_model=JobResponse, status_code=202)
+async def create_job(request: QueryRequest, x_session_id: Optional[str] = Header(None, alias="X-Session-ID")):
+    """Enqueue a query for the background worker fleet and return immediately"""
+    from utils.cuid import generate_cuid
+    
+    # Use session_id from header or request body, or generate new CUID
+    session_id = x_session_id or request.session_id or generate_cuid()
+    
+    try:
+        job = await submit_job(session_id, request.query, request_id=request.request_id,
+                               use_cache=request.use_cache, history=request.history)
+        return JobResponse(**job)
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/v1/jobs/{request_id}", response_model=JobResponse)
+async def get_job(request_id: str):
+    """Get status and result of a background job"""
+    try:
+        job = await get_job_status(request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {request_id} not found")
+    return JobResponse(**job)
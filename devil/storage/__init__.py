@@ -1,12 +1,71 @@
-from storage.redis_client import get_redis_client
-from storage.memory import MemoryStore
+import os
+from storage.redis_client import get_redis_client, get_async_redis_client, get_async_pubsub_client
+from storage.memory import RedisMemoryStore
+from storage.jobs import JobQueue
+from storage.session_queue import SessionQueue
+from storage.response_cache import ResponseCache
+from storage.rate_limit import RateLimiter
+from storage.history_cache import HistoryCache, HISTORY_CACHE_ENABLED
+from storage.cold_archive import ColdArchive
+from storage.tool_cache import ToolCache, TOOL_CACHE_ENABLED, TOOL_CACHE_REDIS
 
-# Initialize Redis client and memory store
+# "redis" (default), "sqlite" (embedded, single node) or "memory" (process-local, for tests)
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "redis").lower()
+
+redis_client = None
+async_redis_client = None
+memory_store = None
+# Job queue, response cache and rate limiter need Redis and stay None on the other backends
+job_queue = None
+response_cache = None
+rate_limiter = None
+
+if MEMORY_BACKEND == "redis":
+    # Initialize Redis clients and memory store
+    try:
+        redis_client = get_redis_client()
+        async_redis_client = get_async_redis_client()
+        memory_store = RedisMemoryStore(redis_client, async_redis_client, get_async_pubsub_client(async_redis_client))
+        # Sessions moved out of Redis by the retention worker (storage/retention.py)
+        memory_store.cold_archive = ColdArchive()
+        job_queue = JobQueue(async_redis_client)
+        response_cache = ResponseCache(async_redis_client)
+        rate_limiter = RateLimiter(async_redis_client)
+    except Exception as e:
+        print(f"Warning: Redis connection failed: {e}. Memory features will be disabled.")
+        redis_client = None
+        async_redis_client = None
+        memory_store = None
+        job_queue = None
+        response_cache = None
+        rate_limiter = None
+elif MEMORY_BACKEND == "sqlite":
+    from storage.sqlite_store import SQLiteMemoryStore
+    memory_store = SQLiteMemoryStore()
+elif MEMORY_BACKEND == "memory":
+    from storage.in_memory_store import InMemoryStore
+    memory_store = InMemoryStore()
+else:
+    raise ValueError(f"Unknown MEMORY_BACKEND '{MEMORY_BACKEND}' (expected redis, sqlite or memory)")
+
+# Per-process cache of recent histories. SQLite is skipped: other processes write the same
+# file and there is no channel to hear about it
+if memory_store is not None and HISTORY_CACHE_ENABLED and MEMORY_BACKEND != "sqlite":
+    memory_store.history_cache = HistoryCache(shared=MEMORY_BACKEND == "redis")
+
+# Results of cacheable tools; the Redis tier is shared by every process
+tool_cache = None
+if TOOL_CACHE_ENABLED:
+    tool_cache = ToolCache(redis_client if TOOL_CACHE_REDIS else None)
+
+# Per-session turn ordering; falls back to in-process locking without Redis
+session_queue = SessionQueue(async_redis_client)
+
+# Local vector index for semantic recall; independent of Redis
+semantic_memory = None
 try:
-    redis_client = get_redis_client()
-    memory_store = MemoryStore(redis_client)
+    from storage.semantic_memory import SemanticMemory, SEMANTIC_MEMORY_ENABLED
+    if SEMANTIC_MEMORY_ENABLED:
+        semantic_memory = SemanticMemory.from_env()
 except Exception as e:
-    print(f"Warning: Redis connection failed: {e}. Memory features will be disabled.")
-    redis_client = None
-    memory_store = None
-
+    print(f"Warning: Semantic memory unavailable: {e}. The recall tool will be disabled.")
@@ -0,0 +1,413 @@
+"""
+Backend-independent MemoryStore interface.
+
+Backends (selected with MEMORY_BACKEND in storage/__init__.py):
+    redis   - RedisMemoryStore (storage/memory.py), shared by all nodes
+    sqlite  - SQLiteMemoryStore (storage/sqlite_store.py), embedded, single node
+    memory  - InMemoryStore (storage/in_memory_store.py), process-local, for tests
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from utils.cuid import generate_cuid
+from utils.executor import run_blocking
+
+# Messages kept in the hot conversation list; older ones move to the archive
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", 50))
+# Archived messages kept per session (oldest are dropped beyond this)
+CONVERSATION_ARCHIVE_MAX_MESSAGES = int(os.getenv("CONVERSATION_ARCHIVE_MAX_MESSAGES", 1000))
+# Days an idle conversation or tool call is kept (the retention worker can archive sooner)
+MEMORY_EXPIRE_DAYS = int(os.getenv("MEMORY_EXPIRE_DAYS", 60))
+
+
+class MemoryStore(ABC):
+    """
+    Conversation history, keyword search, tool-call tracing and live tool events.
+    
+    Backends implement the sync methods, which tools call from worker threads. The
+    `a`-prefixed coroutine twins used by the async request path default to running
+    the sync method in the bounded executor; backends with a native async client
+    override them.
+    """
+    
+    def __init__(self):
+        self.max_messages = CONVERSATION_MAX_MESSAGES
+        self.archive_max_messages = CONVERSATION_ARCHIVE_MAX_MESSAGES
+        # Expiration for conversations and tool calls
+        self.expire_seconds = MEMORY_EXPIRE_DAYS * 24 * 60 * 60
+        # Characters of the last message kept as the session preview
+        self.preview_chars = 200
+        # Optional HistoryCache (storage/history_cache.py) serving aget_history
+        self.history_cache = None
+    
+    def _new_message(self, role: str, content: str, metadata: Optional[Dict] = None) -> Dict:
+        """Build a conversation message with a unique ID"""
+        return {
+            "id": generate_cuid(),
+            "role": role,  # "user" or "assistant"
+            "content": content,
+            "timestamp": datetime.now().isoformat(),
+            "metadata": metadata or {}
+        }
+    
+    def _timestamp_ms(self, message: Dict) -> int:
+        """Message timestamp as epoch milliseconds (now if missing or malformed)"""
+        try:
+            return int(datetime.fromisoformat(message["timestamp"]).timestamp() * 1000)
+        except (KeyError, TypeError, ValueError):
+            return int(time.time() * 1000)
+    
+    def _turn_messages(self, user_content: str, assistant_content: str, metadata: Optional[Dict]) -> List[Dict]:
+        return [
+            self._new_message("user", user_content, metadata),
+            self._new_message("assistant", assistant_content, metadata),
+        ]
+    
+    @abstractmethod
+    def _append(self, session_id: str, messages: List[Dict], fence_token: Optional[int] = None):
+        """
+        Append messages (oldest first) to a session and update its indexes in one write.
+        
+        Raises:
+            StaleTurnError: fence_token is no longer current (backends that track fencing)
+        """
+    
+    def _appended(self, session_id: str, messages: List[Dict]):
+        """Write appended messages through to the history cache"""
+        if self.history_cache is not None:
+            self.history_cache.append(session_id, messages)
+    
+    def add_message(self, session_id: str, role: str, content: str, metadata: Optional[Dict] = None):
+        """Add a message to conversation history"""
+        messages = [self._new_message(role, content, metadata)]
+        self._append(session_id, messages)
+        self._appended(session_id, messages)
+    
+    async def aadd_message(self, session_id: str, role: str, content: str, metadata: Optional[Dict] = None):
+        """Async version of add_message"""
+        await run_blocking(self.add_message, session_id, role, content, metadata)
+    
+    def add_turn(self, session_id: str, user_content: str, assistant_content: str,
+                 metadata: Optional[Dict] = None, fence_token: Optional[int] = None):
+        """
+        Atomically store a user message and the assistant reply.
+        
+        Raises:
+            StaleTurnError: fence_token is no longer current
+        """
+        messages = self._turn_messages(user_content, assistant_content, metadata)
+        self._append(session_id, messages, fence_token)
+        self._appended(session_id, messages)
+    
+    async def aadd_turn(self, session_id: str, user_content: str, assistant_content: str,
+                        metadata: Optional[Dict] = None, fence_token: Optional[int] = None):
+        """Async version of add_turn"""
+        await run_blocking(self.add_turn, session_id, user_content, assistant_content, metadata, fence_token)
+    
+    @abstractmethod
+    def get_messages(self, session_id: str, limit: int = 50) -> List[Dict]:
+        """Get the last N messages of a session in chronological order"""
+    
+    async def aget_messages(self, session_id: str, limit: int = 50) -> List[Dict]:
+        """Async version of get_messages"""
+        return await run_blocking(self.get_messages, session_id, limit)
+    
+    @abstractmethod
+    def get_history_version(self, session_id: str) -> int:
+        """
+        Version of a session's history; changes whenever messages are added.
+        
+        Cheap: never reads message bodies, so it can back conditional requests.
+        """
+    
+    async def aget_history_version(self, session_id: str) -> int:
+        """Async version of get_history_version"""
+        return await run_blocking(self.get_history_version, session_id)
+    
+    @abstractmethod
+    def get_messages_page(self, session_id: str, limit: int = 50, before: Optional[str] = None,
+                          after: Optional[str] = None) -> Optional[Dict]:
+        """
+        One page of a session's history, addressed by message ID cursors.
+        
+        Args:
+            session_id: Session identifier
+            limit: Page size
+            before: Return the messages preceding this message ID
+            after: Return the messages following this message ID (ignored if before is set)
+        
+        Returns:
+            Dict with "messages" (chronological), "version" (as get_history_version, read
+            no later than the messages), "has_older" and "has_newer"; None if the cursor
+            message is not in the session
+        """
+    
+    async def aget_messages_page(self, session_id: str, limit: int = 50, before: Optional[str] = None,
+                                 after: Optional[str] = None) -> Optional[Dict]:
+        """Async version of get_messages_page"""
+        return await run_blocking(self.get_messages_page, session_id, limit, before, after)
+    
+    async def _ensure_history_listener(self):
+        """Start listening for other processes' writes (backends whose cache is shared)"""
+    
+    async def aget_history(self, session_id: str, limit: int = 50,
+                           view: Optional[Callable[[List[Dict]], List]] = None) -> List:
+        """
+        Last N messages of a session, served from the history cache when possible.
+        
+        Args:
+            session_id: Session identifier
+            limit: Number of most recent messages
+            view: Optional module-level function of the messages (e.g. counting their
+                tokens); it runs in the executor and its result is cached with the history
+        
+        Returns:
+            Messages in chronological order, or view(messages)
+        """
+        cache = self.history_cache
+        if cache is None:
+            messages = await self.aget_messages(session_id, limit)
+            return await run_blocking(view, messages) if view else messages
+        
+        await self._ensure_history_listener()
+        cached = cache.get(session_id, limit, view)
+        if cached is not None:
+            messages, result = cached
+            if view is None or result is not None:
+                return result if view else messages
+        else:
+            cache.begin_fill(session_id)
+            messages = None
+            try:
+                messages = await self.aget_messages(session_id, limit)
+            finally:
+                cache.end_fill(session_id, messages, limit)
+            if view is None:
+                return messages
+        
+        # Views such as token counting are CPU-bound; keep them off the event loop
+        result = await run_blocking(view, messages)
+        cache.memoize(session_id, limit, view, messages, result)
+        return list(result)
+    
+    @abstractmethod
+    def get_summary(self, session_id: str) -> Optional[Dict]:
+        """
+        Rolling summary of a session's older messages (see controllers/context.py).
+        
+        Returns:
+            Dict with "summary", "through_id" and "through_ms" (last message folded in),
+            "messages" (count folded in so far) and "tokens"; None if there is none yet
+        """
+    
+    async def aget_summary(self, session_id: str) -> Optional[Dict]:
+        """Async version of get_summary"""
+        return await run_blocking(self.get_summary, session_id)
+    
+    @abstractmethod
+    def set_summary(self, session_id: str, summary: Dict) -> bool:
+        """
+        Store a rolling summary unless one covering later messages is already stored.
+        
+        Returns:
+            Whether the summary was stored
+        """
+    
+    async def aset_summary(self, session_id: str, summary: Dict) -> bool:
+        """Async version of set_summary"""
+        return await run_blocking(self.set_summary, session_id, summary)
+    
+    @abstractmethod
+    def search_messages(self, query: str, session_id: Optional[str] = None, limit: int = 10,
+                        since_ms: Optional[int] = None, until_ms: Optional[int] = None,
+                        match_all: Optional[bool] = None) -> List[Dict]:
+        """
+        Keyword search over messages, best match first.
+        
+        Args:
+            query: Keywords; ANDed unless joined with OR
+            session_id: Session to search, or None to search all sessions
+            limit: Maximum number of results
+            since_ms / until_ms: Optional time window (epoch ms, inclusive)
+            match_all: Override the AND/OR mode parsed from the query
+        
+        Returns:
+            Matching messages with session_id and score added
+        """
+    
+    @abstractmethod
+    def list_sessions(self, cursor: Optional[str] = None, limit: int = 50) -> tuple[List[Dict], Optional[str]]:
+        """
+        Page through sessions by last activity, newest first (ties by session ID, descending).
+        
+        Args:
+            cursor: next_cursor of the previous page (None for the first page)
+            limit: Page size
+        
+        Returns:
+            Tuple of (sessions, next_cursor); next_cursor is None on the last page
+        
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+    
+    async def alist_sessions(self, cursor: Optional[str] = None, limit: int = 50) -> tuple[List[Dict], Optional[str]]:
+        """Async version of list_sessions"""
+        return await run_blocking(self.list_sessions, cursor, limit)
+    
+    @staticmethod
+    def _parse_session_cursor(cursor: Optional[str]) -> Optional[tuple[int, str]]:
+        """(last_activity, session_id) of the last session on the previous page"""
+        if cursor is None:
+            return None
+        last_activity, sep, session_id = cursor.partition(":")
+        if not sep or not last_activity.isdigit():
+            raise ValueError(f"Invalid sessions cursor: {cursor}")
+        return int(last_activity), session_id
+    
+    @staticmethod
+    def _next_session_cursor(sessions: List[Dict], limit: int) -> Optional[str]:
+        """Cursor after the last session of a full page; sessions sharing its timestamp are not skipped"""
+        if len(sessions) < limit:
+            return None
+        return f"{sessions[-1]['last_activity']}:{sessions[-1]['session_id']}"
+    
+    @abstractmethod
+    def add_tool_call(self, request_id: str, tool_name: str, tool_input: str, tool_output: str,
+                      cache: Optional[str] = None) -> Dict:
+        """
+        Store a tool call for a specific request.
+        
+        Args:
+            cache: "hit" or "revalidated" when the output came from the tool result cache
+                (kept in the record as "cache"; omitted otherwise)
+        
+        Returns:
+            The tool call as readers see it by default (preview of large outputs)
+            with its 1-based index
+        """
+    
+    @abstractmethod
+    def get_tool_calls(self, request_id: str, full: bool = False) -> List[Dict]:
+        """
+        Get all tool calls for a specific request in chronological order.
+        
+        Args:
+            request_id: Request identifier
+            full: Return large outputs in full instead of as previews
+        """
+    
+    async def aget_tool_calls(self, request_id: str, full: bool = False) -> List[Dict]:
+        """Async version of get_tool_calls"""
+        return await run_blocking(self.get_tool_calls, request_id, full)
+    
+    @abstractmethod
+    def get_tool_call(self, request_id: str, index: int) -> Optional[Dict]:
+        """Get one tool call (1-based chronological index) with its full output"""
+    
+    async def aget_tool_call(self, request_id: str, index: int) -> Optional[Dict]:
+        """Async version of get_tool_call"""
+        return await run_blocking(self.get_tool_call, request_id, index)
+    
+    def backfill_session_index(self) -> int:
+        """Build the session index from existing data; backends that index on write have nothing to do"""
+        return 0
+    
+    def backfill_search_index(self) -> int:
+        """Build the search index from existing data; backends that index on write have nothing to do"""
+        return 0
+    
+    async def awarm(self):
+        """Open connections and start background listeners ahead of the first request"""
+        await self._ensure_history_listener()
+    
+    @abstractmethod
+    def publish_tool_event(self, request_id: str, event: Dict):
+        """Publish a tool event to the request's live subscribers"""
+    
+    @abstractmethod
+    async def amark_request_done(self, request_id: str):
+        """Record that a request has finished and notify live subscribers"""
+    
+    @abstractmethod
+    async def ais_request_done(self, request_id: str) -> bool:
+        """Check whether a request has already finished"""
+    
+    @abstractmethod
+    async def asubscribe_tool_events(self, request_id: str):
+        """
+        Subscribe to a request's tool events.
+        
+        Returns:
+            Object with `await get_message(timeout=...)` (None on timeout, else a dict
+            whose "data" is the JSON event) and `await aclose()`
+        """
+
+
+class LocalSubscription:
+    """Subscriber side of LocalBroker, mimicking redis.asyncio's PubSub.get_message"""
+    
+    def __init__(self, broker: "LocalBroker", channel: str):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue()
+    
+    def deliver(self, data: str):
+        """Hand a message to the subscriber's event loop (safe from any thread)"""
+        try:
+            self.loop.call_soon_threadsafe(
+                self.queue.put_nowait, {"type": "message", "channel": self.channel, "data": data}
+            )
+        except RuntimeError:
+            # Subscriber's loop is closed
+            self.broker.unsubscribe(self)
+    
+    async def get_message(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+    
+    async def aclose(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """
+    In-process pub/sub for backends without a shared message bus.
+    
+    Publishers may run in tool worker threads; delivery hops onto each subscriber's
+    event loop. Events only reach subscribers in the same process.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[LocalSubscription]] = {}
+    
+    async def subscribe(self, channel: str) -> LocalSubscription:
+        subscription = LocalSubscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription: LocalSubscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+    
+    def publish(self, channel: str, event: Dict):
+        data = json.dumps(event, default=str)
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(data)
@@ -0,0 +1,125 @@
+"""
+Storage codec for large tool outputs.
+
+Small outputs are stored as plain text. Outputs of at least
+TOOL_OUTPUT_COMPRESS_MIN_BYTES are compressed (zstd when the optional
+`zstandard` package is installed, zlib otherwise) and base64-encoded, since the
+Redis clients run with decode_responses=True. Encoded bodies larger than
+TOOL_OUTPUT_CHUNK_BYTES are split into chunks that the caller stores under a
+separate key, so the tool-call list itself stays small.
+
+Encoded records keep a plain-text preview in "output", so readers that only need
+the preview never decompress anything.
+"""
+import base64
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# "zstd" or "zlib"; defaults to zstd when available
+TOOL_OUTPUT_CODEC = os.getenv("TOOL_OUTPUT_CODEC", "zstd" if zstandard else "zlib")
+# Outputs smaller than this are stored uncompressed
+TOOL_OUTPUT_COMPRESS_MIN_BYTES = int(os.getenv("TOOL_OUTPUT_COMPRESS_MIN_BYTES", 2048))
+# Encoded bodies larger than this are split into chunks of this size
+TOOL_OUTPUT_CHUNK_BYTES = int(os.getenv("TOOL_OUTPUT_CHUNK_BYTES", 256 * 1024))
+# Characters of a compressed output kept readable in the record
+TOOL_OUTPUT_PREVIEW_CHARS = int(os.getenv("TOOL_OUTPUT_PREVIEW_CHARS", 500))
+
+# Record fields that only matter for decoding; dropped from previews
+CODEC_FIELDS = ("output_codec", "output_data", "output_chunks", "output_ref")
+
+
+def _codec() -> str:
+    if TOOL_OUTPUT_CODEC == "zstd" and zstandard is None:
+        return "zlib"
+    return TOOL_OUTPUT_CODEC
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    """Compress bytes with the given codec"""
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """Decompress bytes written by compress()"""
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Tool output is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def encode_output(text: str) -> Tuple[Dict, List[str]]:
+    """
+    Encode a tool output for storage.
+    
+    Args:
+        text: Full tool output
+    
+    Returns:
+        Tuple of (fields to merge into the tool-call record, chunks to store separately)
+    """
+    raw = text.encode("utf-8")
+    if len(raw) < TOOL_OUTPUT_COMPRESS_MIN_BYTES:
+        return {"output": text}, []
+    
+    codec = _codec()
+    data = base64.b64encode(compress(raw, codec)).decode("ascii")
+    fields = {
+        "output": text[:TOOL_OUTPUT_PREVIEW_CHARS],
+        "output_codec": codec,
+        "output_size": len(raw),
+    }
+    if len(data) <= TOOL_OUTPUT_CHUNK_BYTES:
+        fields["output_data"] = data
+        return fields, []
+    
+    chunks = [data[i:i + TOOL_OUTPUT_CHUNK_BYTES] for i in range(0, len(data), TOOL_OUTPUT_CHUNK_BYTES)]
+    fields["output_chunks"] = len(chunks)
+    return fields, chunks
+
+
+def is_encoded(record: Dict) -> bool:
+    """Whether a tool-call record holds only a preview of a compressed output"""
+    return "output_codec" in record
+
+
+def decode_output(record: Dict, chunks: Optional[List[str]] = None) -> str:
+    """
+    Full output of an encoded tool-call record.
+    
+    Args:
+        record: Stored tool-call record
+        chunks: Chunks from the record's chunk key, for chunked outputs
+    """
+    data = record.get("output_data") or "".join(chunks or [])
+    return decompress(base64.b64decode(data), record["output_codec"]).decode("utf-8")
+
+
+def preview(record: Dict) -> Dict:
+    """Tool-call record as returned to readers that do not need the full output"""
+    if not is_encoded(record):
+        return record
+    view = {k: v for k, v in record.items() if k not in CODEC_FIELDS}
+    view["truncated"] = True
+    return view
+
+
+def truncate_output(tool_call: Dict) -> Dict:
+    """
+    Preview of a tool call whose full output is stored uncompressed (embedded backends).
+    
+    Matches what preview() returns for an encoded record of the same output.
+    """
+    output = tool_call.get("output") or ""
+    size = len(output.encode("utf-8"))
+    if size < TOOL_OUTPUT_COMPRESS_MIN_BYTES:
+        return tool_call
+    return {**tool_call, "output": output[:TOOL_OUTPUT_PREVIEW_CHARS], "output_size": size, "truncated": True}
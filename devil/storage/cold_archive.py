@@ -0,0 +1,220 @@
+"""
+Cold storage for sessions moved out of Redis by the retention worker.
+
+Layout of the archive directory:
+    segment-{n:06d}.ndjson.gz  gzip members appended back to back; each member holds
+                               one batch of a session's messages, one JSON object per line
+    index.jsonl                one line per member: session_id, segment, offset, length,
+                               count (messages) and raw (uncompressed bytes)
+    lock                       flock target for writers
+
+A member is written (and fsynced) before its index line, so a crash can leave
+unreferenced bytes in a segment but never an index entry pointing at nothing.
+A session's members are read in index order, which is chronological: the
+retention worker always archives a session's oldest remaining messages first.
+
+Readers keep the parsed index in memory and pick up lines appended by other
+processes on their next lookup. Every node serving history reads through to
+the archive, so COLD_ARCHIVE_DIR must be on storage all of them mount (e.g. NFS);
+on a host-local directory, other nodes see archived messages as missing.
+
+Segments whose last write is older than COLD_ARCHIVE_RETENTION_DAYS are deleted
+(expire_segments). Sessions are archived oldest first, so this only ever drops a
+session's oldest archived messages. The index is then rewritten and replaced;
+readers notice the new file and reload it.
+"""
+import fcntl
+import gzip
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+# Must be shared by every node that serves history (see module docstring)
+COLD_ARCHIVE_DIR = os.getenv("COLD_ARCHIVE_DIR", "data/cold_archive")
+# Days archived messages are kept after their segment was last written (0 keeps them forever)
+COLD_ARCHIVE_RETENTION_DAYS = float(os.getenv("COLD_ARCHIVE_RETENTION_DAYS", 365))
+# A new segment file is started once the current one reaches this size
+COLD_SEGMENT_MAX_BYTES = int(os.getenv("COLD_SEGMENT_MAX_BYTES", 64 * 1024 * 1024))
+
+
+class ColdArchive:
+    """Append-only, gzip-compressed NDJSON archive of session messages"""
+    
+    def __init__(self, path: str = COLD_ARCHIVE_DIR, segment_max_bytes: int = COLD_SEGMENT_MAX_BYTES):
+        self.path = path
+        self.segment_max_bytes = segment_max_bytes
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._members: Dict[str, List[Dict]] = {}
+        self._index_offset = 0
+        # Inode of the index file read so far; expire_segments replaces the file
+        self._index_inode = None
+    
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+    
+    def _segment_name(self, number: int) -> str:
+        return f"segment-{number:06d}.ndjson.gz"
+    
+    def _refresh(self):
+        """Load index lines appended since the last call"""
+        index_path = self._file("index.jsonl")
+        try:
+            stat = os.stat(index_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._index_inode:
+            self._members, self._index_offset, self._index_inode = {}, 0, stat.st_ino
+        if stat.st_size == self._index_offset:
+            return
+        with open(index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # Ignore a trailing partial line from a writer that is mid-append
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            self._members.setdefault(entry["session_id"], []).append(entry)
+        self._index_offset += len(complete)
+    
+    def append(self, session_id: str, messages: List[Dict]) -> int:
+        """
+        Archive messages of a session (oldest first, and older than any archived before).
+        
+        Returns:
+            Compressed bytes written
+        """
+        if not messages:
+            return 0
+        raw = "".join(json.dumps(message, ensure_ascii=False) + "\n" for message in messages).encode("utf-8")
+        member = gzip.compress(raw)
+        
+        with open(self._file("lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            segments = sorted(name for name in os.listdir(self.path) if name.startswith("segment-"))
+            number = int(segments[-1][8:14]) if segments else 0
+            segment = self._segment_name(number)
+            if os.path.exists(self._file(segment)) and os.path.getsize(self._file(segment)) >= self.segment_max_bytes:
+                segment = self._segment_name(number + 1)
+            
+            with open(self._file(segment), "ab") as f:
+                offset = f.tell()
+                f.write(member)
+                f.flush()
+                os.fsync(f.fileno())
+            entry = {
+                "session_id": session_id,
+                "segment": segment,
+                "offset": offset,
+                "length": len(member),
+                "count": len(messages),
+                "raw": len(raw),
+            }
+            with open(self._file("index.jsonl"), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return len(member)
+    
+    def _session_members(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            self._refresh()
+            return list(self._members.get(session_id, ()))
+    
+    def count(self, session_id: str) -> int:
+        """Number of archived messages of a session (no disk reads beyond the index)"""
+        return sum(member["count"] for member in self._session_members(session_id))
+    
+    def get_messages(self, session_id: str, limit: int = 0) -> List[Dict]:
+        """
+        Archived messages of a session in chronological order.
+        
+        Args:
+            session_id: Session identifier
+            limit: Return only the newest N messages (0 for all); older members are not read
+        """
+        members = self._session_members(session_id)
+        if limit:
+            # Only decompress the newest members needed to cover the limit
+            needed, start = 0, len(members)
+            while start > 0 and needed < limit:
+                start -= 1
+                needed += members[start]["count"]
+            members = members[start:]
+        
+        messages = []
+        for member in members:
+            try:
+                with open(self._file(member["segment"]), "rb") as f:
+                    f.seek(member["offset"])
+                    data = gzip.decompress(f.read(member["length"]))
+            except FileNotFoundError:
+                # Expired by another process since the index was read
+                continue
+            messages.extend(json.loads(line) for line in data.decode("utf-8").splitlines())
+        return messages[-limit:] if limit else messages
+    
+    def usage(self, session_id: str) -> Dict[str, int]:
+        """Archived messages and bytes (compressed and raw) of a session"""
+        members = self._session_members(session_id)
+        return {
+            "messages": sum(member["count"] for member in members),
+            "bytes": sum(member["length"] for member in members),
+            "raw_bytes": sum(member["raw"] for member in members),
+        }
+    
+    def total_usage(self) -> Dict[str, int]:
+        """Archived sessions, messages and bytes across the whole archive"""
+        with self._lock:
+            self._refresh()
+            members = [member for session in self._members.values() for member in session]
+            sessions = len(self._members)
+        return {
+            "sessions": sessions,
+            "messages": sum(member["count"] for member in members),
+            "bytes": sum(member["length"] for member in members),
+            "raw_bytes": sum(member["raw"] for member in members),
+        }
+    
+    def expire_segments(self, retention_days: float = COLD_ARCHIVE_RETENTION_DAYS) -> Dict[str, int]:
+        """
+        Delete segments last written more than `retention_days` ago (0 keeps everything).
+        
+        The newest segment is always kept, so segment numbers never restart.
+        
+        Returns:
+            Segments and messages deleted
+        """
+        if not retention_days:
+            return {"segments": 0, "messages": 0}
+        cutoff = time.time() - retention_days * 24 * 60 * 60
+        with open(self._file("lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            segments = sorted(name for name in os.listdir(self.path) if name.startswith("segment-"))
+            expired = {name for name in segments[:-1] if os.path.getmtime(self._file(name)) < cutoff}
+            if not expired:
+                return {"segments": 0, "messages": 0}
+            
+            index_path = self._file("index.jsonl")
+            kept, messages = [], 0
+            if os.path.exists(index_path):
+                with open(index_path, "rb") as f:
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            continue
+                        entry = json.loads(line)
+                        if entry["segment"] in expired:
+                            messages += entry["count"]
+                        else:
+                            kept.append(line)
+            # Replace the index before deleting segments, so no index line outlives its segment
+            with open(index_path + ".tmp", "wb") as f:
+                f.writelines(kept)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(index_path + ".tmp", index_path)
+            for name in expired:
+                os.remove(self._file(name))
+        return {"segments": len(expired), "messages": messages}
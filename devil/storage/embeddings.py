@@ -0,0 +1,120 @@
+"""
+Embedding providers for semantic memory.
+
+The default HashingEmbedder runs fully offline: word unigrams, word bigrams and
+character trigrams are hashed into a fixed number of signed buckets (the
+"hashing trick"), weighted with sublinear TF and L2-normalized. It needs no
+vocabulary or model download, and it still matches paraphrases that share stems
+or word fragments, which plain keyword search misses.
+
+Other providers plug in through EMBEDDING_PROVIDER:
+    hashing           - HashingEmbedder (default)
+    openai            - OpenAI-compatible embeddings API (EMBEDDING_MODEL, LLM_API_KEY, LLM_BASE_URL)
+    package.module:fn - any callable returning an object with `dim` and `embed(texts)`
+"""
+import importlib
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from typing import List
+
+import numpy as np
+
+from storage.text_index import STOPWORDS
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "hashing")
+# Vector size of the hashing embedder
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 256))
+# Only the head of long texts (tool outputs, pasted files) is embedded
+EMBEDDING_MAX_CHARS = int(os.getenv("EMBEDDING_MAX_CHARS", 4000))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class Embedder:
+    """Interface of an embedding provider"""
+    
+    # Name stored in the index header; vectors from different embedders are not comparable
+    name = "base"
+    dim = 0
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts.
+        
+        Args:
+            texts: Texts to embed
+        
+        Returns:
+            float32 array of shape (len(texts), dim) with L2-normalized rows
+        """
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """Offline hashed n-gram embedder (see module docstring)"""
+    
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+    
+    def _features(self, text: str) -> Counter:
+        words = [w for w in _WORD_RE.findall(text[:EMBEDDING_MAX_CHARS].lower()) if w not in STOPWORDS]
+        features = Counter(words)
+        features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"<{word}>"
+            features.update(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(str(text)).items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                # Low bits pick the bucket, the top bit the sign, so collisions cancel out on average
+                sign = 1.0 if h & 0x80000000 else -1.0
+                vectors[row, h % self.dim] += sign * (1.0 + math.log(count))
+        return _normalize(vectors)
+
+
+class OpenAIEmbedder(Embedder):
+    """Embeddings from an OpenAI-compatible API (not offline; opt-in)"""
+    
+    def __init__(self):
+        from langchain_openai import OpenAIEmbeddings
+        
+        model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+        self.name = f"openai-{model}"
+        self._client = OpenAIEmbeddings(
+            model=model,
+            openai_api_key=os.getenv("LLM_API_KEY"),
+            openai_api_base=os.getenv("LLM_BASE_URL"),
+        )
+        self.dim = len(self._client.embed_query("dimension probe"))
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self._client.embed_documents([str(t)[:EMBEDDING_MAX_CHARS] for t in texts])
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def get_embedder() -> Embedder:
+    """
+    Get the embedding provider selected by EMBEDDING_PROVIDER.
+    """
+    if EMBEDDING_PROVIDER == "hashing":
+        return HashingEmbedder()
+    if EMBEDDING_PROVIDER == "openai":
+        return OpenAIEmbedder()
+    
+    module_name, _, attr = EMBEDDING_PROVIDER.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory()
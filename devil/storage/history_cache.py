@@ -0,0 +1,222 @@
+"""
+Per-process LRU cache of decoded session histories.
+
+Each chat turn reads the same recent messages as the turn before it. Entries
+hold the last N decoded messages of a session plus "views" derived from them
+(e.g. the token counts computed by controllers.context), so a hit needs no
+round trip, no JSON decoding and no token counting. Views are computed by the
+caller outside the cache lock (MemoryStore.aget_history runs them in the
+executor) and handed back with memoize().
+
+Writes from this process update entries in place (write-through). Writes from
+other processes invalidate them: the Redis backend publishes the session ID on
+HISTORY_INVALIDATION_CHANNEL with every append and each process drops its copy.
+A shared cache only serves hits while that subscription is live, and entries
+also expire after HISTORY_CACHE_TTL in case an invalidation is lost.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Cache recent session histories in each worker process
+HISTORY_CACHE_ENABLED = os.getenv("HISTORY_CACHE_ENABLED", "true").lower() == "true"
+# Max sessions cached per process
+HISTORY_CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", 1000))
+# Approximate memory budget per process (bytes of message content and metadata)
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Seconds an entry is trusted without being rewritten (safety net for lost invalidations)
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", 300))
+
+# Pub/sub channel carrying "{origin} {session_id}" after every append
+HISTORY_INVALIDATION_CHANNEL = "history_invalidate"
+
+# Rough per-message overhead of the decoded dict (keys, timestamp, ID) in bytes
+MESSAGE_OVERHEAD_BYTES = 400
+
+View = Callable[[List[Dict]], List]
+
+
+def _estimate_size(messages: List[Dict]) -> int:
+    # Views reuse the same content strings, so only the decoded messages are counted
+    return sum(len(message.get("content") or "") + MESSAGE_OVERHEAD_BYTES for message in messages)
+
+
+class _Entry:
+    """Last `window` messages of one session (all of them when `complete`)"""
+    
+    def __init__(self, messages: List[Dict], window: int, complete: bool):
+        self.messages = messages
+        self.window = window
+        self.complete = complete
+        self.size = _estimate_size(messages)
+        self.views: Dict[Tuple[View, int], List] = {}
+        self.stored_at = time.monotonic()
+    
+    def covers(self, limit: int) -> bool:
+        return self.complete or len(self.messages) >= limit
+
+
+class HistoryCache:
+    """
+    Bounded LRU of session histories, keyed by session ID.
+    
+    Thread-safe: sync writes run in executor threads while reads run on the event loop.
+    """
+    
+    def __init__(self, max_sessions: int = HISTORY_CACHE_MAX_SESSIONS, max_bytes: int = HISTORY_CACHE_MAX_BYTES,
+                 ttl: float = HISTORY_CACHE_TTL, shared: bool = False):
+        """
+        Args:
+            max_sessions: Max cached sessions
+            max_bytes: Approximate memory budget
+            ttl: Seconds an entry is served before it is refetched
+            shared: Other processes write the same sessions; hits are only served while
+                online (i.e. while the invalidation subscription is live)
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # Identifies this process in invalidation messages so it skips its own writes
+        self.origin = uuid.uuid4().hex
+        self.online = not shared
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        # Sessions being fetched from the store, and those changed meanwhile (their fetch is stale)
+        self._pending: Dict[str, int] = {}
+        self._dirty: set = set()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0, "fills": 0, "write_throughs": 0,
+                       "invalidations": 0, "evictions": 0}
+    
+    def _drop(self, session_id: str) -> bool:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return False
+        self._bytes -= entry.size
+        return True
+    
+    def _store(self, session_id: str, entry: _Entry):
+        self._drop(session_id)
+        self._entries[session_id] = entry
+        self._bytes += entry.size
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            oldest, _ = next(iter(self._entries.items()))
+            self._drop(oldest)
+            self._stats["evictions"] += 1
+    
+    def get(self, session_id: str, limit: int, view: Optional[View] = None) -> Optional[Tuple[List[Dict], Optional[List]]]:
+        """
+        Cached history of a session.
+        
+        Args:
+            session_id: Session identifier
+            limit: Number of most recent messages wanted
+            view: Optional function of the messages whose result is memoized with the entry
+        
+        Returns:
+            (last `limit` messages, memoized view of them or None if not computed yet),
+            or None on a miss
+        """
+        with self._lock:
+            if not self.online:
+                self._stats["bypassed"] += 1
+                return None
+            entry = self._entries.get(session_id)
+            if entry is not None and time.monotonic() - entry.stored_at > self.ttl:
+                self._drop(session_id)
+                entry = None
+            if entry is None or not entry.covers(limit):
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self._stats["hits"] += 1
+            
+            messages = entry.messages[-limit:]
+            result = entry.views.get((view, limit)) if view is not None else None
+            return messages, (list(result) if result is not None else None)
+    
+    def memoize(self, session_id: str, limit: int, view: View, messages: List[Dict], result: List):
+        """Keep a view of messages returned by get() or end_fill(), unless the entry changed since"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.covers(limit) and entry.messages[-limit:] == messages:
+                entry.views[(view, limit)] = result
+    
+    def begin_fill(self, session_id: str):
+        """Mark a store fetch as started; call end_fill() afterwards in all cases"""
+        with self._lock:
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+    
+    def end_fill(self, session_id: str, messages: Optional[List[Dict]] = None, limit: int = 0):
+        """
+        Cache fetched messages unless the session changed while they were being fetched.
+        
+        Args:
+            session_id: Session identifier
+            messages: Result of get_messages(session_id, limit), or None if the fetch failed
+            limit: Limit the messages were fetched with
+        """
+        with self._lock:
+            stale = session_id in self._dirty
+            remaining = self._pending.get(session_id, 1) - 1
+            if remaining > 0:
+                self._pending[session_id] = remaining
+            else:
+                self._pending.pop(session_id, None)
+                self._dirty.discard(session_id)
+            if messages is None or stale or not self.online:
+                return
+            self._store(session_id, _Entry(list(messages), limit, complete=len(messages) < limit))
+            self._stats["fills"] += 1
+    
+    def append(self, session_id: str, messages: List[Dict]):
+        """Write-through of messages just stored by this process"""
+        with self._lock:
+            if session_id in self._pending:
+                self._dirty.add(session_id)
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            combined = entry.messages + messages
+            complete = entry.complete and len(combined) <= entry.window
+            self._store(session_id, _Entry(combined[-entry.window:], entry.window, complete))
+            self._stats["write_throughs"] += 1
+    
+    def invalidate(self, session_id: str):
+        """Drop a session changed by another process"""
+        with self._lock:
+            if session_id in self._pending:
+                self._dirty.add(session_id)
+            if self._drop(session_id):
+                self._stats["invalidations"] += 1
+    
+    def set_online(self, online: bool):
+        """
+        Switch hit serving on or off for a shared cache.
+        
+        Everything cached so far is dropped: invalidations may have been missed while
+        the subscription was down.
+        """
+        with self._lock:
+            self.online = online
+            self._entries.clear()
+            self._bytes = 0
+            self._dirty.update(self._pending)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size of this process's cache"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "messages": sum(len(entry.messages) for entry in self._entries.values()),
+                "approx_bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "online": self.online,
+            }
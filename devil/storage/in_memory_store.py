@@ -0,0 +1,245 @@
+"""
+Process-local MemoryStore for tests and throwaway runs (MEMORY_BACKEND=memory).
+
+Nothing is persisted and nothing is shared between processes. Expiry is not
+enforced; conversations are capped like the other backends.
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from storage.base import MemoryStore, LocalBroker
+from storage.codec import truncate_output
+from storage.text_index import term_frequencies, parse_query, bm25_scores
+
+
+class _SearchIndex:
+    """Postings and BM25 statistics for one scope (a session, or all sessions)"""
+    
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.lengths: Dict[str, int] = {}
+        self.timestamps: Dict[str, int] = {}
+        self.total_length = 0
+    
+    def add(self, doc_id: str, frequencies: Dict[str, int], length: int, timestamp_ms: int):
+        for term, count in frequencies.items():
+            self.postings[term][doc_id] = count
+        self.lengths[doc_id] = length
+        self.timestamps[doc_id] = timestamp_ms
+        self.total_length += length
+    
+    def remove(self, doc_id: str, frequencies: Dict[str, int]):
+        for term in frequencies:
+            self.postings[term].pop(doc_id, None)
+            if not self.postings[term]:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id, 0)
+        self.timestamps.pop(doc_id, None)
+
+
+class InMemoryStore(MemoryStore):
+    """MemoryStore backed by dicts guarded by one lock"""
+    
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._conversations: Dict[str, List[Dict]] = defaultdict(list)
+        self._sessions: Dict[str, Dict] = {}
+        # Messages ever appended per session (history version)
+        self._versions: Dict[str, int] = defaultdict(int)
+        self._indexes: Dict[Optional[str], _SearchIndex] = defaultdict(_SearchIndex)
+        # (session ID, message) of messages still in a conversation, by global doc ID ("{session_id}/{message_id}")
+        self._messages: Dict[str, tuple[str, Dict]] = {}
+        self._summaries: Dict[str, Dict] = {}
+        self._tool_calls: Dict[str, List[Dict]] = defaultdict(list)
+        self._done_requests: Dict[str, float] = {}
+        self._broker = LocalBroker()
+    
+    def _append(self, session_id: str, messages: List[Dict], fence_token: Optional[int] = None):
+        # Turn ordering inside one process is already guaranteed by SessionQueue
+        with self._lock:
+            conversation = self._conversations[session_id]
+            self._versions[session_id] += len(messages)
+            for message in messages:
+                conversation.append(message)
+                self._index(session_id, message, add=True)
+            
+            overflow = len(conversation) - (self.max_messages + self.archive_max_messages)
+            if overflow > 0:
+                for message in conversation[:overflow]:
+                    self._index(session_id, message, add=False)
+                del conversation[:overflow]
+            
+            self._sessions[session_id] = {
+                "session_id": session_id,
+                "last_message": messages[-1]["content"][:self.preview_chars],
+                "last_activity": int(time.time() * 1000),
+            }
+    
+    def _index(self, session_id: str, message: Dict, add: bool):
+        global_id = f"{session_id}/{message['id']}"
+        if add:
+            self._messages[global_id] = (session_id, message)
+        else:
+            self._messages.pop(global_id, None)
+        
+        frequencies, length = term_frequencies(message["content"])
+        if not frequencies:
+            return
+        for scope, doc_id in ((session_id, message["id"]), (None, global_id)):
+            if add:
+                self._indexes[scope].add(doc_id, frequencies, length, self._timestamp_ms(message))
+            else:
+                self._indexes[scope].remove(doc_id, frequencies)
+    
+    def get_messages(self, session_id: str, limit: int = 50) -> List[Dict]:
+        """Get last N messages from conversation history"""
+        with self._lock:
+            return [dict(message) for message in self._conversations.get(session_id, [])[-limit:]]
+    
+    def get_history_version(self, session_id: str) -> int:
+        """Version of a session's history: number of messages ever appended"""
+        with self._lock:
+            return self._versions.get(session_id, 0)
+    
+    def get_messages_page(self, session_id: str, limit: int = 50, before: Optional[str] = None,
+                          after: Optional[str] = None) -> Optional[Dict]:
+        """One page of history by message ID cursor (see MemoryStore.get_messages_page)"""
+        with self._lock:
+            conversation = self._conversations.get(session_id, [])
+            version = self._versions.get(session_id, 0)
+            cursor = before or after
+            if cursor:
+                position = next((i for i, m in enumerate(conversation) if m["id"] == cursor), None)
+                if position is None:
+                    return None
+            else:
+                position = len(conversation)
+            
+            if after and not before:
+                end = min(len(conversation), position + 1 + limit)
+                page, has_older, has_newer = conversation[position + 1:end], True, end < len(conversation)
+            else:
+                start = max(0, position - limit)
+                page, has_older, has_newer = conversation[start:position], start > 0, bool(cursor)
+            return {
+                "messages": [dict(message) for message in page],
+                "version": version,
+                "has_older": has_older,
+                "has_newer": has_newer,
+            }
+    
+    def get_summary(self, session_id: str) -> Optional[Dict]:
+        """Rolling summary of a session's older messages (see MemoryStore.get_summary)"""
+        with self._lock:
+            summary = self._summaries.get(session_id)
+            return dict(summary) if summary else None
+    
+    def set_summary(self, session_id: str, summary: Dict) -> bool:
+        """Store a rolling summary unless a later one is stored (see MemoryStore.set_summary)"""
+        with self._lock:
+            current = self._summaries.get(session_id)
+            if current and current["through_ms"] > summary["through_ms"]:
+                return False
+            self._summaries[session_id] = dict(summary)
+            return True
+    
+    def search_messages(self, query: str, session_id: Optional[str] = None, limit: int = 10,
+                        since_ms: Optional[int] = None, until_ms: Optional[int] = None,
+                        match_all: Optional[bool] = None) -> List[Dict]:
+        """Keyword search over messages, ranked by BM25 (see MemoryStore.search_messages)"""
+        terms, parsed_match_all = parse_query(query)
+        if not terms:
+            return []
+        match_all = parsed_match_all if match_all is None else match_all
+        
+        with self._lock:
+            index = self._indexes.get(session_id)
+            if index is None:
+                return []
+            postings = {term: dict(index.postings.get(term, {})) for term in terms}
+            doc_sets = [set(docs) for docs in postings.values()]
+            candidates = set.intersection(*doc_sets) if match_all else set.union(*doc_sets)
+            candidates = [
+                doc_id for doc_id in candidates
+                if (since_ms is None or index.timestamps[doc_id] >= since_ms)
+                and (until_ms is None or index.timestamps[doc_id] <= until_ms)
+            ]
+            total_docs = len(index.lengths)
+            avg_length = index.total_length / total_docs if total_docs else 1.0
+            scores = bm25_scores(postings, index.lengths, total_docs, avg_length, candidates)
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            
+            results = []
+            for doc_id, score in top:
+                global_id = doc_id if session_id is None else f"{session_id}/{doc_id}"
+                doc_session, message = self._messages[global_id]
+                results.append({**message, "session_id": doc_session, "score": round(score, 4)})
+            return results
+    
+    def list_sessions(self, cursor: Optional[str] = None, limit: int = 50) -> tuple[List[Dict], Optional[str]]:
+        """Page through sessions by last activity, newest first"""
+        after = self._parse_session_cursor(cursor)
+        
+        def position(session: Dict) -> tuple[int, str]:
+            return session["last_activity"], session["session_id"]
+        
+        with self._lock:
+            sessions = [
+                dict(session) for session in self._sessions.values()
+                if after is None or position(session) < after
+            ]
+        sessions = heapq.nlargest(limit, sessions, key=position)
+        return sessions, self._next_session_cursor(sessions, limit)
+    
+    def add_tool_call(self, request_id: str, tool_name: str, tool_input: str, tool_output: str,
+                      cache: Optional[str] = None) -> Dict:
+        """Store a tool call for a specific request and return its preview with its 1-based index"""
+        with self._lock:
+            tool_calls = self._tool_calls[request_id]
+            tool_call = {
+                "tool_name": tool_name,
+                "input": tool_input,
+                "output": tool_output,
+                "timestamp": datetime.now().isoformat(),
+                "index": len(tool_calls) + 1,
+            }
+            if cache:
+                tool_call["cache"] = cache
+            tool_calls.append(tool_call)
+        return truncate_output(tool_call)
+    
+    def get_tool_calls(self, request_id: str, full: bool = False) -> List[Dict]:
+        """Get all tool calls for a specific request"""
+        with self._lock:
+            tool_calls = [dict(call) for call in self._tool_calls.get(request_id, [])]
+        return tool_calls if full else [truncate_output(call) for call in tool_calls]
+    
+    def get_tool_call(self, request_id: str, index: int) -> Optional[Dict]:
+        """Get one tool call (1-based index) with its full output"""
+        with self._lock:
+            tool_calls = self._tool_calls.get(request_id, [])
+            return dict(tool_calls[index - 1]) if 0 < index <= len(tool_calls) else None
+    
+    def publish_tool_event(self, request_id: str, event: Dict):
+        """Publish a tool event to subscribers in this process"""
+        self._broker.publish(request_id, event)
+    
+    async def amark_request_done(self, request_id: str):
+        """Record that a request has finished and notify live subscribers"""
+        with self._lock:
+            self._done_requests[request_id] = time.time()
+        self._broker.publish(request_id, {"type": "done"})
+    
+    async def ais_request_done(self, request_id: str) -> bool:
+        """Check whether a request has already finished"""
+        with self._lock:
+            return request_id in self._done_requests
+    
+    async def asubscribe_tool_events(self, request_id: str):
+        """Subscribe to the request's tool events (this process only)"""
+        return await self._broker.subscribe(request_id)
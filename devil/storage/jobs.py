@@ -0,0 +1,176 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from storage.keys import MULTI_KEY_TRANSACTIONS
+
+# Consumer-group name shared by all agent workers
+JOB_GROUP = os.getenv("JOB_GROUP", "agent-workers")
+# Approximate cap on stream length; acknowledged entries are deleted anyway
+JOB_STREAM_MAXLEN = int(os.getenv("JOB_STREAM_MAXLEN", 100000))
+# Keep job status/result records around for 7 days
+JOB_TTL_SECONDS = 7 * 24 * 60 * 60
+# TTL of a new record until its stream entry is written, so a failed enqueue does not block retries
+JOB_ENQUEUE_TTL_SECONDS = 60
+
+# Create a job record with all its fields unless it exists.
+# KEYS: job hash; ARGV: TTL seconds, then field and value pairs
+# Returns 1 if created, 0 if the job already exists.
+CREATE_JOB_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('hset', KEYS[1], unpack(ARGV, 2))
+redis.call('expire', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class JobQueue:
+    """
+    Background job queue on a Redis Stream with a consumer group.
+    
+    Each job is a stream entry (request_id, session_id, query) plus a status hash
+    `jobs:{request_id}` holding status, attempts, result and timestamps. Workers read
+    through the consumer group and acknowledge entries once the job reached a final
+    state; entries left pending by crashed workers are reclaimed with XAUTOCLAIM.
+    """
+    
+    def __init__(self, async_redis_client):
+        self.redis = async_redis_client
+        self.stream_key = "jobs:stream"
+        self.job_key = "jobs"
+        self.group = JOB_GROUP
+        self._create_script = self.redis.register_script(CREATE_JOB_SCRIPT)
+    
+    def _job_key(self, request_id: str) -> str:
+        return f"{self.job_key}:{request_id}"
+    
+    async def ensure_group(self):
+        """Create the consumer group (and the stream) if it does not exist yet"""
+        try:
+            await self.redis.xgroup_create(self.stream_key, self.group, id="0", mkstream=True)
+        except Exception as e:
+            # BUSYGROUP means another worker created it first
+            if "BUSYGROUP" not in str(e):
+                raise
+    
+    async def enqueue(self, request_id: str, session_id: str, query: str,
+                      use_cache: Optional[bool] = None, history: Optional[str] = None) -> Dict:
+        """
+        Enqueue a job unless one with the same request_id already exists.
+        
+        use_cache and history (see process_query) are added to the stream entry only
+        when set, as "true"/"false" and the strategy name.
+        
+        The record is created complete in one step, so a concurrent duplicate submit
+        never sees a partial one. It gets its full TTL together with the stream entry;
+        if that write fails the record is deleted (or expires after
+        JOB_ENQUEUE_TTL_SECONDS), so a retry with the same request_id enqueues again.
+        
+        Returns:
+            The job status record
+        """
+        key = self._job_key(request_id)
+        record = {
+            "status": "queued",
+            "request_id": request_id,
+            "session_id": session_id,
+            "attempts": 0,
+            "created_at": datetime.now().isoformat(),
+        }
+        args = [JOB_ENQUEUE_TTL_SECONDS]
+        for field, value in record.items():
+            args += [field, value]
+        created = await self._create_script(keys=[key], args=args)
+        if not created:
+            return await self.get_job(request_id)
+        
+        fields = {"request_id": request_id, "session_id": session_id, "query": query}
+        if use_cache is not None:
+            fields["use_cache"] = "true" if use_cache else "false"
+        if history:
+            fields["history"] = history
+        # The stream is another key (another slot in cluster mode), so it cannot join the script
+        pipe = self.redis.pipeline(transaction=MULTI_KEY_TRANSACTIONS)
+        pipe.xadd(
+            self.stream_key,
+            fields,
+            maxlen=JOB_STREAM_MAXLEN,
+            approximate=True,
+        )
+        pipe.expire(key, JOB_TTL_SECONDS)
+        try:
+            await pipe.execute()
+        except Exception:
+            try:
+                await self.redis.delete(key)
+            except Exception as e:
+                print(f"[DEBUG] Failed to delete job {request_id} after a failed enqueue: {e}")
+            raise
+        return await self.get_job(request_id)
+    
+    async def get_job(self, request_id: str) -> Optional[Dict]:
+        """Get the status record of a job, or None if unknown/expired"""
+        job = await self.redis.hgetall(self._job_key(request_id))
+        if not job:
+            return None
+        job["attempts"] = int(job.get("attempts", 0))
+        return job
+    
+    async def read(self, consumer: str, count: int = 1, block_ms: int = 5000) -> List[Tuple[str, Dict]]:
+        """Read new jobs for this consumer, blocking up to block_ms"""
+        response = await self.redis.xreadgroup(
+            self.group, consumer, {self.stream_key: ">"}, count=count, block=block_ms
+        )
+        if not response:
+            return []
+        # [[stream_key, [(entry_id, fields), ...]]]
+        return response[0][1]
+    
+    async def claim_stale(self, consumer: str, min_idle_ms: int, count: int = 1) -> List[Tuple[str, Dict]]:
+        """Take over jobs that have been pending on another consumer for longer than min_idle_ms"""
+        response = await self.redis.xautoclaim(
+            self.stream_key, self.group, consumer, min_idle_time=min_idle_ms, start_id="0-0", count=count
+        )
+        # [next_start_id, [(entry_id, fields), ...], deleted_ids]; deleted entries come back as None fields
+        return [(entry_id, fields) for entry_id, fields in response[1] if fields]
+    
+    async def heartbeat(self, consumer: str, entry_id: str):
+        """Reset the idle time of an in-progress entry so it is not reclaimed while still running"""
+        await self.redis.xclaim(
+            self.stream_key, self.group, consumer, min_idle_time=0, message_ids=[entry_id], justid=True
+        )
+    
+    async def start_attempt(self, request_id: str, consumer: str) -> int:
+        """Mark a job as running and return its attempt number"""
+        key = self._job_key(request_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hincrby(key, "attempts", 1)
+        pipe.hset(key, mapping={
+            "status": "running",
+            "worker": consumer,
+            "started_at": datetime.now().isoformat(),
+        })
+        attempts, _ = await pipe.execute()
+        return attempts
+    
+    async def complete(self, entry_id: str, request_id: str, response: str):
+        """Store the result of a finished job and acknowledge its entry"""
+        await self._finish(entry_id, request_id, {"status": "completed", "result": response})
+    
+    async def fail(self, entry_id: str, request_id: str, error: str):
+        """Mark a job as permanently failed and acknowledge its entry"""
+        await self._finish(entry_id, request_id, {"status": "failed", "error": error})
+    
+    async def retry_later(self, request_id: str, error: str):
+        """Record a failed attempt; the entry stays pending and is reclaimed after the idle timeout"""
+        await self.redis.hset(self._job_key(request_id), mapping={"status": "retrying", "error": error})
+    
+    async def _finish(self, entry_id: str, request_id: str, fields: Dict):
+        key = self._job_key(request_id)
+        pipe = self.redis.pipeline(transaction=MULTI_KEY_TRANSACTIONS)
+        pipe.hset(key, mapping={**fields, "finished_at": datetime.now().isoformat()})
+        pipe.expire(key, JOB_TTL_SECONDS)
+        pipe.xack(self.stream_key, self.group, entry_id)
+        pipe.xdel(self.stream_key, entry_id)
+        await pipe.execute()
@@ -0,0 +1,40 @@
+"""
+Redis key naming shared by the storage classes.
+
+Lua scripts and MULTI/EXEC transactions may only touch keys in one Redis
+Cluster slot. With hash tags enabled (the default when REDIS_MODE=cluster) the
+entity ID in a key is wrapped in braces, e.g. `conversations:{session_id}`.
+All keys of one session (conversation, archive, fence, lock, search index)
+then hash to the same slot, and so do a request's tool-call list and its
+output chunks.
+Global keys updated together share a fixed tag instead: `{sessions}` and
+`{sessions}:previews` (the session index), `{rate_limit}:*` (token buckets).
+
+Enabling hash tags renames keys. Existing standalone data can be converted with
+`python manage.py hash-tag-keys`.
+"""
+import os
+
+# "standalone" (default), "sentinel" or "cluster"
+REDIS_MODE = os.getenv("REDIS_MODE", "standalone").lower()
+CLUSTER_MODE = REDIS_MODE == "cluster"
+REDIS_HASH_TAGS = os.getenv("REDIS_HASH_TAGS", "true" if CLUSTER_MODE else "false").lower() == "true"
+# Cluster cannot run MULTI/EXEC across slots; cross-slot pipelines are sent as plain pipelines there
+MULTI_KEY_TRANSACTIONS = not CLUSTER_MODE
+
+
+def tagged(entity_id: str) -> str:
+    """Entity ID as it appears in key names (wrapped in a hash tag if enabled)"""
+    return f"{{{entity_id}}}" if REDIS_HASH_TAGS else entity_id
+
+
+def untagged(key_part: str) -> str:
+    """Entity ID from its key-name form"""
+    if key_part.startswith("{") and key_part.endswith("}"):
+        return key_part[1:-1]
+    return key_part
+
+
+def entity_key(prefix: str, entity_id: str, *parts: str) -> str:
+    """Key of an entity, e.g. entity_key("conversations", session_id) -> "conversations:{session_id}" """
+    return ":".join([prefix, tagged(entity_id), *parts])
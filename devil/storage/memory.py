@@ -1,90 +1,1431 @@
+import asyncio
+import heapq
 import json
+import time
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional
+from storage.base import MemoryStore
+from storage.keys import MULTI_KEY_TRANSACTIONS, REDIS_HASH_TAGS, entity_key, tagged, untagged
+from storage.session_queue import StaleTurnError
+from storage.text_index import term_frequencies, parse_query, bm25_scores
+from storage.serialization import dumps, loads, encode_message, decode_message, encode_tool_call, decode_tool_call, is_current
+from storage.codec import CODEC_FIELDS, TOOL_OUTPUT_PREVIEW_CHARS, encode_output, decode_output, is_encoded, preview
+from storage.history_cache import HISTORY_CACHE_ENABLED, HISTORY_INVALIDATION_CHANNEL
+from utils.cuid import generate_cuid
+from utils.executor import run_blocking
 
-class MemoryStore:
-    """Store and retrieve conversation history and memory using Redis"""
+# Attempts at reading a history page that appends keep shifting; the last read is returned regardless
+PAGE_READ_ATTEMPTS = 3
+
+# Append messages to a conversation in one atomic step:
+# fencing check, LPUSH, move overflow beyond the cap to the archive list, LTRIM both, EXPIRE.
+# Every message gets the next per-session sequence number (the session version) in the
+# message index, which maps message IDs to positions for cursor pagination.
+# KEYS: conversation, archive, session fence, session version, message index
+# ARGV: expire seconds, hot cap, archive cap, fencing token ('' to skip),
+#       then message ID and message pairs (oldest first)
+# Returns the messages dropped past the archive cap (to remove from the search index),
+# or -1 if the fencing token is stale.
+APPEND_MESSAGES_SCRIPT = """
+if ARGV[4] ~= '' then
+    local current = tonumber(redis.call('get', KEYS[3]) or '0')
+    if current ~= tonumber(ARGV[4]) then
+        return -1
+    end
+end
+
+-- Sessions written before versions existed start counting from their stored messages
+if redis.call('exists', KEYS[4]) == 0 then
+    redis.call('set', KEYS[4], redis.call('llen', KEYS[1]) + redis.call('llen', KEYS[2]))
+end
+
+for i = 5, #ARGV, 2 do
+    local seq = redis.call('incr', KEYS[4])
+    redis.call('zadd', KEYS[5], seq, ARGV[i])
+    redis.call('lpush', KEYS[1], ARGV[i + 1])
+end
+-- Index only what the lists still hold
+redis.call('zremrangebyrank', KEYS[5], 0, -(tonumber(ARGV[2]) + tonumber(ARGV[3])) - 1)
+redis.call('expire', KEYS[4], ARGV[1])
+redis.call('expire', KEYS[5], ARGV[1])
+
+local cap = tonumber(ARGV[2])
+local dropped = {}
+if redis.call('llen', KEYS[1]) > cap then
+    -- Overflow is ordered newest to oldest; push oldest first so the archive keeps that order
+    local overflow = redis.call('lrange', KEYS[1], cap, -1)
+    for i = #overflow, 1, -1 do
+        redis.call('lpush', KEYS[2], overflow[i])
+    end
+    redis.call('ltrim', KEYS[1], 0, cap - 1)
+    dropped = redis.call('lrange', KEYS[2], tonumber(ARGV[3]), -1)
+    redis.call('ltrim', KEYS[2], 0, tonumber(ARGV[3]) - 1)
+    redis.call('expire', KEYS[2], ARGV[1])
+end
+
+redis.call('expire', KEYS[1], ARGV[1])
+return dropped
+"""
+
+# Replace a session's rolling summary unless the stored one covers later messages.
+# KEYS: summary; ARGV: summary JSON, its through_ms, expire seconds
+# Returns 1 if stored, 0 if a later summary was kept.
+SET_SUMMARY_SCRIPT = """
+local current = redis.call('get', KEYS[1])
+if current then
+    local through = cjson.decode(current)['through_ms']
+    if through and through > tonumber(ARGV[2]) then
+        return 0
+    end
+end
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+
+# Drop sessions last active before a cutoff from the session index and previews in one
+# step, so a session active again in the meantime keeps both its entry and its preview.
+# KEYS: sessions, session previews; ARGV: cutoff (epoch ms), batch size
+# Returns the number of sessions removed (fewer than the batch size when done).
+PRUNE_SESSIONS_SCRIPT = """
+local expired = redis.call('zrangebyscore', KEYS[1], '-inf', '(' .. ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #expired > 0 then
+    redis.call('zrem', KEYS[1], unpack(expired))
+    redis.call('hdel', KEYS[2], unpack(expired))
+end
+return #expired
+"""
+
+class RedisMemoryStore(MemoryStore):
+    """
+    Store and retrieve conversation history and memory using Redis.
+    
+    Sync methods use `redis_client` and are meant for tools running in worker threads.
+    The `a`-prefixed coroutine twins use `async_redis_client` (redis.asyncio) and are
+    used by the async request path so route handlers never block the event loop.
+    """
     
-    def __init__(self, redis_client):
+    def __init__(self, redis_client, async_redis_client=None, async_pubsub_client=None):
+        super().__init__()
         self.redis = redis_client
+        self.async_redis = async_redis_client
+        # Separate only in cluster mode, where redis.asyncio's cluster client has no pub/sub
+        self.async_pubsub = async_pubsub_client or async_redis_client
+        self._history_listener: Optional[asyncio.Task] = None
+        # Optional ColdArchive (storage/cold_archive.py) holding sessions moved out by the retention worker
+        self.cold_archive = None
         self.conversation_key = "conversations"
+        self.archive_key = "conversations_archive"
+        # Fencing counter maintained by SessionQueue
+        self.session_fence_key = "session_fence"
+        # Per-session message counter (history ETag) and message ID -> sequence number index
+        self.session_version_key = "session_version"
+        self.message_index_key = "message_index"
+        # Rolling summary of messages no longer sent to the LLM (controllers/context.py)
+        self.summary_key = "session_summary"
         self.memory_key = "memory"
+        # Session index: sorted set scored by last activity (epoch ms) plus a hash of last-message previews.
+        # Both share one hash tag, so prune_sessions can update them in one script on a cluster
+        self.sessions_key = "{sessions}" if REDIS_HASH_TAGS else "sessions"
+        self.session_previews_key = "{sessions}:previews" if REDIS_HASH_TAGS else "session_previews"
+        # Inverted keyword index, per session and global (see _index_messages)
+        self.search_key = "search"
         self.tool_calls_key = "tool_calls"
-        self.max_messages = 50
-    
-    def add_message(self, session_id: str, role: str, content: str, metadata: Optional[Dict] = None):
-        """Add a message to conversation history"""
-        message = {
-            "role": role,  # "user" or "assistant"
-            "content": content,
-            "timestamp": datetime.now().isoformat(),
-            "metadata": metadata or {}
-        }
-        
-        key = f"{self.conversation_key}:{session_id}"
-        self.redis.lpush(key, json.dumps(message))
-        # Set expiration (60 days)
-        self.redis.expire(key, 60 * 24 * 60 * 60)
-    
-    def get_messages(self, session_id: str, limit: int = 50) -> List[Dict]:
-        """Get last N messages from conversation history"""
-        key = f"{self.conversation_key}:{session_id}"
-        messages = self.redis.lrange(key, 0, limit - 1)
-        return [json.loads(msg) for msg in reversed(messages)]  # Reverse to get chronological order
+        self.tool_events_key = "tool_events"
+        # Chunks of very large compressed tool outputs, one list per output
+        self.tool_output_chunks_key = "tool_output_chunks"
+        self.request_status_key = "request_status"
+        self._append_script = self.redis.register_script(APPEND_MESSAGES_SCRIPT)
+        self._summary_script = self.redis.register_script(SET_SUMMARY_SCRIPT)
+        self._prune_sessions_script = self.redis.register_script(PRUNE_SESSIONS_SCRIPT)
+        if self.async_redis:
+            self._aappend_script = self.async_redis.register_script(APPEND_MESSAGES_SCRIPT)
+            self._asummary_script = self.async_redis.register_script(SET_SUMMARY_SCRIPT)
     
-    def add_tool_call(self, request_id: str, tool_name: str, tool_input: str, tool_output: str):
-        """Store a tool call for a specific request"""
+    def _encode_tool_call(self, tool_name: str, tool_input: str, tool_output: str,
+                          cache: Optional[str] = None) -> tuple[Dict, str, List[str]]:
+        """Build a tool call record, its serialized form and any output chunks (see storage.codec)"""
+        output_fields, chunks = encode_output(tool_output)
         tool_call = {
             "tool_name": tool_name,
             "input": tool_input,
-            "output": tool_output,
+            **output_fields,
             "timestamp": datetime.now().isoformat()
         }
+        if cache:
+            tool_call["cache"] = cache
+        if chunks:
+            tool_call["output_ref"] = generate_cuid()
+        return tool_call, encode_tool_call(tool_call), chunks
+    
+    def _tool_output_chunks_key(self, request_id: str, output_ref: str) -> str:
+        return entity_key(self.tool_output_chunks_key, request_id, output_ref)
+    
+    def _decode_tool_calls(self, tool_calls_raw: List[str]) -> List[Dict]:
+        """Decode stored tool calls and return them in chronological order"""
+        tool_calls = []
+        for call_raw in tool_calls_raw or []:
+            try:
+                tool_calls.append(decode_tool_call(call_raw))
+            except ValueError:
+                continue
+        
+        # Return in chronological order (oldest first)
+        return list(reversed(tool_calls))
+    
+    def _append_args(self, session_id: str, messages: List[Dict], fence_token: Optional[int]) -> tuple[list, list]:
+        """KEYS and ARGV for APPEND_MESSAGES_SCRIPT"""
+        keys = [
+            entity_key(self.conversation_key, session_id),
+            entity_key(self.archive_key, session_id),
+            entity_key(self.session_fence_key, session_id),
+            entity_key(self.session_version_key, session_id),
+            entity_key(self.message_index_key, session_id),
+        ]
+        args = [
+            self.expire_seconds,
+            self.max_messages,
+            self.archive_max_messages,
+            "" if fence_token is None else fence_token,
+        ]
+        for message in messages:
+            args += [message["id"], encode_message(message)]
+        return keys, args
+    
+    def _check_appended(self, session_id: str, result, fence_token: Optional[int]):
+        if result == -1:
+            raise StaleTurnError(f"Fencing token {fence_token} for session {session_id} is no longer current")
+    
+    def _index_session(self, pipe, session_id: str, last_content: str):
+        """Queue the session index update (last activity + preview) on a pipeline"""
+        pipe.zadd(self.sessions_key, {session_id: int(time.time() * 1000)})
+        pipe.hset(self.session_previews_key, session_id, last_content[:self.preview_chars])
+    
+    def _search_prefix(self, session_id: Optional[str]) -> str:
+        """Key prefix of the per-session index, or of the global index when session_id is None"""
+        if session_id is None:
+            return f"{self.search_key}:global"
+        return f"{self.search_key}:session:{tagged(session_id)}"
+    
+    def _search_docs(self, session_id: str, message_id: str) -> List[tuple[str, str]]:
+        """(index prefix, doc ID) of a message in the per-session and the global index"""
+        return [
+            (self._search_prefix(session_id), message_id),
+            (self._search_prefix(None), f"{session_id}/{message_id}"),
+        ]
+    
+    def _doc_location(self, doc_id: str) -> tuple[str, str]:
+        """(session ID, message ID) of a global index doc; message IDs are CUIDs, so the last "/" separates them"""
+        session_id, _, message_id = doc_id.rpartition("/")
+        return session_id, message_id
+    
+    def _index_messages(self, pipe, session_id: str, messages: List[Dict]):
+        """
+        Queue inverted-index updates for new messages on a pipeline.
+        
+        Per scope (session, global) the index keeps:
+            {prefix}:term:{term}  sorted set, doc -> term frequency
+            {prefix}:docs         sorted set, doc -> timestamp (epoch ms)
+            {prefix}:lengths      hash, doc -> length in tokens
+            {prefix}:total_length total tokens, for the BM25 average length
+        Docs are message IDs in the session index and "{session_id}/{message_id}" in the
+        global one, which also keeps {prefix}:doc_terms (doc -> its terms) so
+        prune_search_index can remove docs whose message is gone. Message bodies are
+        read from the conversation lists; nothing here holds a copy.
+        
+        Session keys expire with the conversation. Global keys get the same TTL on every
+        write; messages older than it are pruned by the retention worker, and messages
+        dropped past the archive cap are removed on append.
+        """
+        for message in messages:
+            frequencies, length = term_frequencies(message["content"])
+            if not frequencies:
+                continue
+            timestamp_ms = self._timestamp_ms(message)
+            
+            for prefix, doc_id in self._search_docs(session_id, message["id"]):
+                for term, count in frequencies.items():
+                    pipe.zadd(f"{prefix}:term:{term}", {doc_id: count})
+                    pipe.expire(f"{prefix}:term:{term}", self.expire_seconds)
+                pipe.zadd(f"{prefix}:docs", {doc_id: timestamp_ms})
+                pipe.hset(f"{prefix}:lengths", doc_id, length)
+                pipe.incrby(f"{prefix}:total_length", length)
+            pipe.hset(f"{self._search_prefix(None)}:doc_terms", f"{session_id}/{message['id']}", " ".join(frequencies))
+        
+        for prefix in (self._search_prefix(session_id), self._search_prefix(None)):
+            for suffix in ("docs", "lengths", "total_length"):
+                pipe.expire(f"{prefix}:{suffix}", self.expire_seconds)
+        pipe.expire(f"{self._search_prefix(None)}:doc_terms", self.expire_seconds)
+    
+    def _unindex_docs(self, pipe, docs: List[tuple[str, str, Iterable[str], int]]):
+        """Queue removal of docs given as (index prefix, doc ID, terms, length) on a pipeline"""
+        for prefix, doc_id, terms, length in docs:
+            for term in terms:
+                pipe.zrem(f"{prefix}:term:{term}", doc_id)
+            pipe.zrem(f"{prefix}:docs", doc_id)
+            pipe.hdel(f"{prefix}:lengths", doc_id)
+            pipe.incrby(f"{prefix}:total_length", -length)
+            if prefix == self._search_prefix(None):
+                pipe.hdel(f"{prefix}:doc_terms", doc_id)
+    
+    def _dropped_docs(self, session_id: str, dropped: List[str]) -> List[tuple[str, str, Dict[str, int]]]:
+        """(index prefix, doc ID, term frequencies) of messages the append script dropped past the archive cap"""
+        docs = []
+        for raw in dropped:
+            message = decode_message(raw)
+            if not message.get("id"):
+                continue
+            frequencies, _ = term_frequencies(message["content"])
+            docs += [(prefix, doc_id, frequencies) for prefix, doc_id in self._search_docs(session_id, message["id"])]
+        return docs
+    
+    def _unindex_dropped(self, session_id: str, dropped: List[str]):
+        """Remove messages dropped past the archive cap from the search index (lengths first, to skip unindexed ones)"""
+        docs = self._dropped_docs(session_id, dropped)
+        pipe = self.redis.pipeline(transaction=False)
+        for prefix, doc_id, _ in docs:
+            pipe.hget(f"{prefix}:lengths", doc_id)
+        lengths = pipe.execute()
+        pipe = self.redis.pipeline(transaction=False)
+        self._unindex_docs(pipe, [
+            (prefix, doc_id, frequencies, int(length))
+            for (prefix, doc_id, frequencies), length in zip(docs, lengths) if length is not None
+        ])
+        pipe.execute()
+    
+    async def _aunindex_dropped(self, session_id: str, dropped: List[str]):
+        """Async version of _unindex_dropped"""
+        docs = self._dropped_docs(session_id, dropped)
+        pipe = self.async_redis.pipeline(transaction=False)
+        for prefix, doc_id, _ in docs:
+            pipe.hget(f"{prefix}:lengths", doc_id)
+        lengths = await pipe.execute()
+        pipe = self.async_redis.pipeline(transaction=False)
+        self._unindex_docs(pipe, [
+            (prefix, doc_id, frequencies, int(length))
+            for (prefix, doc_id, frequencies), length in zip(docs, lengths) if length is not None
+        ])
+        await pipe.execute()
+    
+    def _publish_history_change(self, pipe, session_id: str):
+        """Queue the history cache invalidation for other processes on a pipeline"""
+        if HISTORY_CACHE_ENABLED:
+            origin = self.history_cache.origin if self.history_cache is not None else "-"
+            pipe.publish(HISTORY_INVALIDATION_CHANNEL, f"{origin} {session_id}")
+    
+    def _queue_appended(self, pipe, session_id: str, messages: List[Dict]):
+        """Queue the session and search index updates and the invalidation that follow a stored append"""
+        self._index_session(pipe, session_id, messages[-1]["content"])
+        self._index_messages(pipe, session_id, messages)
+        self._publish_history_change(pipe, session_id)
+    
+    def _append(self, session_id: str, messages: List[Dict], fence_token: Optional[int] = None):
+        """
+        Run the append script plus session and search index updates.
+        
+        Unfenced appends cannot be rejected, so everything goes in one pipelined round
+        trip. Fenced ones run the script first and queue the other writes only once it
+        accepted the token, so a stale turn leaves no trace.
+        """
+        keys, args = self._append_args(session_id, messages, fence_token)
+        pipe = self.redis.pipeline(transaction=False)
+        self._append_script(keys=keys, args=args, client=pipe)
+        if fence_token is None:
+            self._queue_appended(pipe, session_id, messages)
+            dropped = pipe.execute()[0]
+        else:
+            dropped = pipe.execute()[0]
+            self._check_appended(session_id, dropped, fence_token)
+            pipe = self.redis.pipeline(transaction=False)
+            self._queue_appended(pipe, session_id, messages)
+            pipe.execute()
+        if dropped:
+            try:
+                self._unindex_dropped(session_id, dropped)
+            except Exception as e:
+                # The turn is stored; stale docs are skipped by search and pruned later
+                print(f"[DEBUG] Search index cleanup for session {session_id} failed: {e}")
+    
+    async def _aappend(self, session_id: str, messages: List[Dict], fence_token: Optional[int] = None):
+        """Async version of _append"""
+        keys, args = self._append_args(session_id, messages, fence_token)
+        pipe = self.async_redis.pipeline(transaction=False)
+        await self._aappend_script(keys=keys, args=args, client=pipe)
+        if fence_token is None:
+            self._queue_appended(pipe, session_id, messages)
+            dropped = (await pipe.execute())[0]
+        else:
+            dropped = (await pipe.execute())[0]
+            self._check_appended(session_id, dropped, fence_token)
+            pipe = self.async_redis.pipeline(transaction=False)
+            self._queue_appended(pipe, session_id, messages)
+            await pipe.execute()
+        if dropped:
+            try:
+                await self._aunindex_dropped(session_id, dropped)
+            except Exception as e:
+                # The turn is stored; stale docs are skipped by search and pruned later
+                print(f"[DEBUG] Search index cleanup for session {session_id} failed: {e}")
+    
+    async def aadd_message(self, session_id: str, role: str, content: str, metadata: Optional[Dict] = None):
+        """Async version of add_message"""
+        messages = [self._new_message(role, content, metadata)]
+        await self._aappend(session_id, messages)
+        self._appended(session_id, messages)
+    
+    async def aadd_turn(self, session_id: str, user_content: str, assistant_content: str,
+                        metadata: Optional[Dict] = None, fence_token: Optional[int] = None):
+        """
+        Async version of add_turn.
+        
+        The conversation list is capped at max_messages with older messages moving to
+        the session's archive list, and the write is rejected if a later turn has taken
+        the session lease since (fence_token). The session and search indexes are
+        updated once the append is accepted (see _append).
+        """
+        messages = self._turn_messages(user_content, assistant_content, metadata)
+        await self._aappend(session_id, messages, fence_token)
+        self._appended(session_id, messages)
+    
+    def _with_cold(self, session_id: str, raw_messages: List[str], limit: int) -> List[Dict]:
+        """Decode messages read from Redis (newest first) and prepend archived ones up to the limit"""
+        messages = [decode_message(msg) for msg in reversed(raw_messages)]  # Reverse to get chronological order
+        if self.cold_archive is None or len(messages) >= limit:
+            return messages
+        return self._merge_cold(self.cold_archive.get_messages(session_id, limit - len(messages)), messages)
+    
+    def _merge_cold(self, cold: List[Dict], messages: List[Dict]) -> List[Dict]:
+        # A retention pass may have archived messages it has not yet removed from Redis
+        seen = {message.get("id") for message in messages}
+        return [message for message in cold if message.get("id") not in seen] + messages
+    
+    def get_messages(self, session_id: str, limit: int = 50) -> List[Dict]:
+        """Get last N messages from conversation history (reading through to the archives if needed)"""
+        messages = self.redis.lrange(entity_key(self.conversation_key, session_id), 0, limit - 1)
+        if len(messages) == limit or len(messages) < self.max_messages:
+            return self._with_cold(session_id, messages, limit)
         
-        key = f"{self.tool_calls_key}:{request_id}"
-        self.redis.lpush(key, json.dumps(tool_call))
-        # Set expiration (60 days)
-        self.redis.expire(key, 60 * 24 * 60 * 60)
+        archived = self.redis.lrange(entity_key(self.archive_key, session_id), 0, limit - len(messages) - 1)
+        return self._with_cold(session_id, messages + archived, limit)
+    
+    async def aget_messages(self, session_id: str, limit: int = 50) -> List[Dict]:
+        """Async version of get_messages"""
+        messages = await self.async_redis.lrange(entity_key(self.conversation_key, session_id), 0, limit - 1)
+        if len(messages) < limit and len(messages) >= self.max_messages:
+            messages += await self.async_redis.lrange(
+                entity_key(self.archive_key, session_id), 0, limit - len(messages) - 1
+            )
+        # Counting reads only the in-memory archive index; segment files are read off the event loop
+        if self.cold_archive is None or len(messages) >= limit or not self.cold_archive.count(session_id):
+            return [decode_message(msg) for msg in reversed(messages)]
+        return await run_blocking(self._with_cold, session_id, messages, limit)
+    
+    def _version_probe(self, pipe, session_id: str):
+        """Queue the reads get_history_version needs (no message bodies) on a pipeline"""
+        pipe.get(entity_key(self.session_version_key, session_id))
+        pipe.llen(entity_key(self.conversation_key, session_id))
+        pipe.llen(entity_key(self.archive_key, session_id))
+    
+    def _version_of(self, probe: list) -> tuple[int, int, int]:
+        """(version, hot length, archive length) from _version_probe results"""
+        version, hot_len, archived_len = probe
+        # Sessions not written since versions were introduced: the append script starts from this count
+        return (int(version) if version is not None else hot_len + archived_len), hot_len, archived_len
+    
+    def get_history_version(self, session_id: str) -> int:
+        """Version of a session's history (see MemoryStore.get_history_version)"""
+        pipe = self.redis.pipeline(transaction=False)
+        self._version_probe(pipe, session_id)
+        return self._version_of(pipe.execute())[0]
     
-    def get_tool_calls(self, request_id: str) -> List[Dict]:
-        """Get all tool calls for a specific request"""
-        key = f"{self.tool_calls_key}:{request_id}"
-        tool_calls_raw = self.redis.lrange(key, 0, -1)
+    async def aget_history_version(self, session_id: str) -> int:
+        """Async version of get_history_version"""
+        pipe = self.async_redis.pipeline(transaction=False)
+        self._version_probe(pipe, session_id)
+        return self._version_of(await pipe.execute())[0]
+    
+    def _find_offset(self, raw_messages: List[str], message_id: str) -> Optional[int]:
+        """Position (newest first) of a message missing from the message index (stored before it existed)"""
+        for offset, raw in enumerate(raw_messages):
+            if decode_message(raw).get("id") == message_id:
+                return offset
+        return None
+    
+    def _page_bounds(self, total: int, limit: int, offset: Optional[int], after: bool) -> tuple[int, int, bool, bool]:
+        """
+        Newest-first positions [start, stop] of a page, plus has_older and has_newer.
         
-        if not tool_calls_raw:
+        Position 0 is the newest message; positions continue from the hot list into the archive.
+        """
+        if offset is None:
+            return 0, limit - 1, total > limit, False
+        if after:
+            start = max(0, offset - limit)
+            return start, offset - 1, True, start > 0
+        return offset + 1, offset + limit, offset + limit < total - 1, True
+    
+    def _page_ranges(self, session_id: str, hot_len: int, start: int, stop: int) -> List[tuple[str, int, int]]:
+        """LRANGE arguments covering newest-first positions [start, stop] across the hot and archive lists"""
+        ranges = []
+        if start > stop:
+            return ranges
+        if start < hot_len:
+            ranges.append((entity_key(self.conversation_key, session_id), start, min(stop, hot_len - 1)))
+        if stop >= hot_len:
+            ranges.append((entity_key(self.archive_key, session_id), max(start - hot_len, 0), stop - hot_len))
+        return ranges
+    
+    def _cold_count(self, session_id: str) -> int:
+        return self.cold_archive.count(session_id) if self.cold_archive is not None else 0
+    
+    def _cold_offset(self, session_id: str, redis_len: int, message_id: str) -> Optional[int]:
+        """Position (newest first) of an archived message; archived positions follow those in Redis"""
+        if self.cold_archive is None:
+            return None
+        for offset, message in enumerate(reversed(self.cold_archive.get_messages(session_id))):
+            if message.get("id") == message_id:
+                return redis_len + offset
+        return None
+    
+    def _cold_slice(self, session_id: str, cold_len: int, redis_len: int, start: int, stop: int) -> List[Dict]:
+        """Archived messages at newest-first positions [start, stop], in chronological order"""
+        first, last = max(start - redis_len, 0), min(stop - redis_len, cold_len - 1)
+        if self.cold_archive is None or first > last:
             return []
+        newest = self.cold_archive.get_messages(session_id, limit=last + 1)
+        return newest[:len(newest) - first]
+    
+    def _page(self, results: list, cold: List[Dict], version: int, has_older: bool, has_newer: bool) -> Dict:
+        raw = [item for chunk in results[:-3] for item in chunk]
+        return {
+            "messages": self._merge_cold(cold, [decode_message(item) for item in reversed(raw)]),
+            "version": version,
+            "has_older": has_older,
+            "has_newer": has_newer,
+        }
+    
+    def get_messages_page(self, session_id: str, limit: int = 50, before: Optional[str] = None,
+                          after: Optional[str] = None) -> Optional[Dict]:
+        """
+        One page of history by message ID cursor (see MemoryStore.get_messages_page).
         
-        tool_calls = []
-        for call_raw in tool_calls_raw:
+        Cursors resolve to list positions through the message index (version - sequence
+        number). If an append or a retention pass lands between resolving the cursor and
+        reading the page, positions shift, so the read is retried when the lists changed.
+        Positions past the Redis lists read through to the cold archive.
+        """
+        cursor = before or after
+        index_key = entity_key(self.message_index_key, session_id)
+        for _ in range(PAGE_READ_ATTEMPTS):
+            pipe = self.redis.pipeline(transaction=False)
+            self._version_probe(pipe, session_id)
+            if cursor:
+                pipe.zscore(index_key, cursor)
+            probe = pipe.execute()
+            state = self._version_of(probe[:3])
+            version, hot_len, archived_len = state
+            cold_len = self._cold_count(session_id)
+            
+            offset = None
+            if cursor:
+                if probe[3] is not None:
+                    offset = version - int(probe[3])
+                else:
+                    offset = self._find_offset(
+                        self.redis.lrange(entity_key(self.conversation_key, session_id), 0, -1)
+                        + self.redis.lrange(entity_key(self.archive_key, session_id), 0, -1),
+                        cursor,
+                    )
+                    if offset is None:
+                        offset = self._cold_offset(session_id, hot_len + archived_len, cursor)
+                    if offset is None:
+                        return None
+            
+            total = hot_len + archived_len + cold_len
+            start, stop, has_older, has_newer = self._page_bounds(total, limit, offset, not before)
+            pipe = self.redis.pipeline(transaction=False)
+            for key, first, last in self._page_ranges(session_id, hot_len, start, min(stop, hot_len + archived_len - 1)):
+                pipe.lrange(key, first, last)
+            self._version_probe(pipe, session_id)
+            results = pipe.execute()
+            if self._version_of(results[-3:]) == state:
+                break
+        
+        cold = self._cold_slice(session_id, cold_len, hot_len + archived_len, start, stop)
+        return self._page(results, cold, version, has_older, has_newer)
+    
+    async def aget_messages_page(self, session_id: str, limit: int = 50, before: Optional[str] = None,
+                                 after: Optional[str] = None) -> Optional[Dict]:
+        """Async version of get_messages_page"""
+        cursor = before or after
+        index_key = entity_key(self.message_index_key, session_id)
+        for _ in range(PAGE_READ_ATTEMPTS):
+            pipe = self.async_redis.pipeline(transaction=False)
+            self._version_probe(pipe, session_id)
+            if cursor:
+                pipe.zscore(index_key, cursor)
+            probe = await pipe.execute()
+            state = self._version_of(probe[:3])
+            version, hot_len, archived_len = state
+            cold_len = await run_blocking(self._cold_count, session_id) if self.cold_archive is not None else 0
+            
+            offset = None
+            if cursor:
+                if probe[3] is not None:
+                    offset = version - int(probe[3])
+                else:
+                    offset = self._find_offset(
+                        await self.async_redis.lrange(entity_key(self.conversation_key, session_id), 0, -1)
+                        + await self.async_redis.lrange(entity_key(self.archive_key, session_id), 0, -1),
+                        cursor,
+                    )
+                    if offset is None and cold_len:
+                        offset = await run_blocking(self._cold_offset, session_id, hot_len + archived_len, cursor)
+                    if offset is None:
+                        return None
+            
+            total = hot_len + archived_len + cold_len
+            start, stop, has_older, has_newer = self._page_bounds(total, limit, offset, not before)
+            pipe = self.async_redis.pipeline(transaction=False)
+            for key, first, last in self._page_ranges(session_id, hot_len, start, min(stop, hot_len + archived_len - 1)):
+                pipe.lrange(key, first, last)
+            self._version_probe(pipe, session_id)
+            results = await pipe.execute()
+            if self._version_of(results[-3:]) == state:
+                break
+        
+        cold = []
+        if cold_len and stop >= hot_len + archived_len:
+            cold = await run_blocking(self._cold_slice, session_id, cold_len, hot_len + archived_len, start, stop)
+        return self._page(results, cold, version, has_older, has_newer)
+    
+    async def _ensure_history_listener(self):
+        """Start the history invalidation subscriber on this event loop if it is not running"""
+        if self.history_cache is not None and (self._history_listener is None or self._history_listener.done()):
+            self._history_listener = asyncio.create_task(self._listen_history_changes())
+    
+    async def awarm(self):
+        """Open a pooled async connection and start the history invalidation subscriber"""
+        await self.async_redis.ping()
+        await self._ensure_history_listener()
+    
+    async def _listen_history_changes(self):
+        """Drop cached histories that other processes append to; the cache serves hits only while subscribed"""
+        cache = self.history_cache
+        while True:
+            pubsub = None
             try:
-                tool_calls.append(json.loads(call_raw))
-            except json.JSONDecodeError:
+                pubsub = self.async_pubsub.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(HISTORY_INVALIDATION_CHANNEL)
+                cache.set_online(True)
+                while True:
+                    message = await pubsub.get_message(timeout=5.0)
+                    if message is None:
+                        continue
+                    origin, _, session_id = message["data"].partition(" ")
+                    if origin != cache.origin:
+                        cache.invalidate(session_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[DEBUG] History cache subscription lost: {e}")
+                await asyncio.sleep(1)
+            finally:
+                cache.set_online(False)
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+    
+    def get_summary(self, session_id: str) -> Optional[Dict]:
+        """Rolling summary of a session's older messages (see MemoryStore.get_summary)"""
+        raw = self.redis.get(entity_key(self.summary_key, session_id))
+        return loads(raw) if raw else None
+    
+    async def aget_summary(self, session_id: str) -> Optional[Dict]:
+        """Async version of get_summary"""
+        raw = await self.async_redis.get(entity_key(self.summary_key, session_id))
+        return loads(raw) if raw else None
+    
+    def _summary_args(self, session_id: str, summary: Dict) -> tuple[list, list]:
+        return [entity_key(self.summary_key, session_id)], [dumps(summary), summary["through_ms"], self.expire_seconds]
+    
+    def set_summary(self, session_id: str, summary: Dict) -> bool:
+        """Store a rolling summary unless a later one is stored (see MemoryStore.set_summary)"""
+        keys, args = self._summary_args(session_id, summary)
+        return bool(self._summary_script(keys=keys, args=args))
+    
+    async def aset_summary(self, session_id: str, summary: Dict) -> bool:
+        """Async version of set_summary"""
+        keys, args = self._summary_args(session_id, summary)
+        return bool(await self._asummary_script(keys=keys, args=args))
+    
+    def search_messages(self, query: str, session_id: Optional[str] = None, limit: int = 10,
+                        since_ms: Optional[int] = None, until_ms: Optional[int] = None,
+                        match_all: Optional[bool] = None) -> List[Dict]:
+        """
+        Keyword search over indexed messages, ranked by BM25.
+        
+        Args:
+            query: Keywords; ANDed unless joined with OR
+            session_id: Session to search, or None to search all sessions
+            limit: Maximum number of results
+            since_ms / until_ms: Optional time window (epoch ms, inclusive)
+            match_all: Override the AND/OR mode parsed from the query
+        
+        Returns:
+            Matching messages (best first) with session_id and score added
+        """
+        terms, parsed_match_all = parse_query(query)
+        if not terms:
+            return []
+        match_all = parsed_match_all if match_all is None else match_all
+        prefix = self._search_prefix(session_id)
+        
+        # Round trip 1: postings of every term plus collection stats
+        pipe = self.redis.pipeline(transaction=False)
+        for term in terms:
+            pipe.zrange(f"{prefix}:term:{term}", 0, -1, withscores=True)
+        pipe.zcard(f"{prefix}:docs")
+        pipe.get(f"{prefix}:total_length")
+        *term_postings, total_docs, total_length = pipe.execute()
+        
+        postings = {term: dict(docs) for term, docs in zip(terms, term_postings)}
+        doc_sets = [set(docs) for docs in postings.values()]
+        candidates = set.intersection(*doc_sets) if match_all else set.union(*doc_sets)
+        if not candidates:
+            return []
+        candidates = list(candidates)
+        
+        # Round trip 2: lengths and timestamps of candidates only
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hmget(f"{prefix}:lengths", candidates)
+        pipe.zmscore(f"{prefix}:docs", candidates)
+        lengths, timestamps = pipe.execute()
+        
+        # Docs without a timestamp were pruned; drop their leftover postings in passing
+        stale = [doc_id for doc_id, ts in zip(candidates, timestamps) if ts is None]
+        if stale:
+            pipe = self.redis.pipeline(transaction=False)
+            for term, docs in postings.items():
+                members = [doc_id for doc_id in stale if doc_id in docs]
+                if members:
+                    pipe.zrem(f"{prefix}:term:{term}", *members)
+            pipe.execute()
+        
+        doc_lengths = {
+            doc_id: float(length or 0)
+            for doc_id, length, ts in zip(candidates, lengths, timestamps)
+            if ts is not None
+            and (since_ms is None or ts >= since_ms)
+            and (until_ms is None or ts <= until_ms)
+        }
+        avg_length = int(total_length or 0) / total_docs if total_docs else 1.0
+        scores = bm25_scores(postings, doc_lengths, total_docs, avg_length, doc_lengths)
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        if not top:
+            return []
+        
+        # Round trips 3 and 4: fetch only the matching messages from the conversation lists
+        locations = [
+            self._doc_location(doc_id) if session_id is None else (session_id, doc_id)
+            for doc_id, _ in top
+        ]
+        results = []
+        for (doc_session, _), (_, score), message in zip(locations, top, self._fetch_messages(locations)):
+            if message is not None:
+                message["session_id"] = doc_session
+                message["score"] = round(score, 4)
+                results.append(message)
+        return results
+    
+    def _fetch_messages(self, locations: List[tuple[str, str]]) -> List[Optional[Dict]]:
+        """
+        Messages by (session ID, message ID), or None for messages no longer stored.
+        
+        Positions in the hot and archive lists come from the message index (version -
+        sequence number). Messages missing from it (stored before it existed), moved by
+        an append in between, or already in the cold archive are looked up by ID.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for session_id, message_id in locations:
+            self._version_probe(pipe, session_id)
+            pipe.zscore(entity_key(self.message_index_key, session_id), message_id)
+        probes = pipe.execute()
+        
+        pipe = self.redis.pipeline(transaction=False)
+        offsets = []
+        for i, (session_id, _) in enumerate(locations):
+            version, hot_len, archived_len = self._version_of(probes[i * 4:i * 4 + 3])
+            sequence = probes[i * 4 + 3]
+            offset = version - int(sequence) if sequence is not None else None
+            if offset is not None and offset < hot_len:
+                pipe.lindex(entity_key(self.conversation_key, session_id), offset)
+            elif offset is not None and offset < hot_len + archived_len:
+                pipe.lindex(entity_key(self.archive_key, session_id), offset - hot_len)
+            offsets.append((offset, hot_len + archived_len))
+        raw_messages = iter(pipe.execute())
+        
+        messages = []
+        for (session_id, message_id), (offset, redis_len) in zip(locations, offsets):
+            if offset is not None and offset >= redis_len:
+                messages.append(self._find_cold(session_id, message_id))
                 continue
+            raw = next(raw_messages) if offset is not None else None
+            message = decode_message(raw) if raw else None
+            if message is None or message.get("id") != message_id:
+                message = self._find_message(session_id, message_id)
+            messages.append(message)
+        return messages
+    
+    def _find_message(self, session_id: str, message_id: str) -> Optional[Dict]:
+        """A session's message by ID, scanning the Redis lists and then the cold archive"""
+        raw_messages = (
+            self.redis.lrange(entity_key(self.conversation_key, session_id), 0, -1)
+            + self.redis.lrange(entity_key(self.archive_key, session_id), 0, -1)
+        )
+        offset = self._find_offset(raw_messages, message_id)
+        if offset is not None:
+            return decode_message(raw_messages[offset])
+        return self._find_cold(session_id, message_id)
+    
+    def _find_cold(self, session_id: str, message_id: str) -> Optional[Dict]:
+        if self.cold_archive is None or not self.cold_archive.count(session_id):
+            return None
+        for message in self.cold_archive.get_messages(session_id):
+            if message.get("id") == message_id:
+                return message
+        return None
+    
+    def prune_search_index(self, batch_size: int = 500) -> int:
+        """
+        Remove messages older than the conversation TTL from the global search index.
         
-        # Return in chronological order (oldest first)
-        return list(reversed(tool_calls))
+        Per-session index keys expire with their conversation; the global keys are
+        written by every session, so their TTL alone would never lapse. Docs indexed
+        before doc_terms existed lose their postings lazily, when a search reads them.
+        
+        Returns:
+            Number of docs removed
+        """
+        prefix = self._search_prefix(None)
+        cutoff = int((time.time() - self.expire_seconds) * 1000)
+        total = 0
+        while True:
+            doc_ids = self.redis.zrangebyscore(f"{prefix}:docs", "-inf", cutoff, start=0, num=batch_size)
+            if not doc_ids:
+                return total
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hmget(f"{prefix}:doc_terms", doc_ids)
+            pipe.hmget(f"{prefix}:lengths", doc_ids)
+            terms, lengths = pipe.execute()
+            
+            pipe = self.redis.pipeline(transaction=False)
+            self._unindex_docs(pipe, [
+                (prefix, doc_id, (doc_terms or "").split(), int(length or 0))
+                for doc_id, doc_terms, length in zip(doc_ids, terms, lengths)
+            ])
+            pipe.execute()
+            total += len(doc_ids)
+    
+    def add_tool_call(self, request_id: str, tool_name: str, tool_input: str, tool_output: str,
+                      cache: Optional[str] = None) -> Dict:
+        """
+        Store a tool call for a specific request.
+        
+        Large outputs are compressed, and very large ones chunked, by storage.codec.
+        
+        Returns:
+            The tool call as readers see it by default (preview of large outputs)
+            with its 1-based index
+        """
+        tool_call, encoded, chunks = self._encode_tool_call(tool_name, tool_input, tool_output, cache)
+        
+        key = entity_key(self.tool_calls_key, request_id)
+        pipe = self.redis.pipeline(transaction=False)
+        if chunks:
+            # Chunks go first so a visible record never points at missing chunks
+            chunks_key = self._tool_output_chunks_key(request_id, tool_call["output_ref"])
+            pipe.rpush(chunks_key, *chunks)
+            pipe.expire(chunks_key, self.expire_seconds)
+        pipe.lpush(key, encoded)
+        pipe.expire(key, self.expire_seconds)
+        results = pipe.execute()
+        
+        tool_call = preview(tool_call)
+        # LPUSH returns the new list length, which is the call's position in chronological order
+        tool_call["index"] = results[-2]
+        return tool_call
+    
+    def _expand_tool_calls(self, tool_calls: List[Dict], chunk_lists: List[List[str]]) -> List[Dict]:
+        """Replace previews with full outputs; chunk_lists holds the chunks of each chunked call in order"""
+        chunk_lists = iter(chunk_lists)
+        expanded = []
+        for tool_call in tool_calls:
+            if is_encoded(tool_call):
+                chunks = next(chunk_lists) if "output_ref" in tool_call else None
+                tool_call = {**preview(tool_call), "output": decode_output(tool_call, chunks), "truncated": False}
+            expanded.append(tool_call)
+        return expanded
+    
+    def _chunk_keys(self, request_id: str, tool_calls: List[Dict]) -> List[str]:
+        return [
+            self._tool_output_chunks_key(request_id, call["output_ref"])
+            for call in tool_calls if "output_ref" in call
+        ]
+    
+    def get_tool_calls(self, request_id: str, full: bool = False) -> List[Dict]:
+        """
+        Get all tool calls for a specific request.
+        
+        Args:
+            request_id: Request identifier
+            full: Decompress large outputs instead of returning their preview
+        """
+        key = entity_key(self.tool_calls_key, request_id)
+        tool_calls = self._decode_tool_calls(self.redis.lrange(key, 0, -1))
+        if not full:
+            return [preview(call) for call in tool_calls]
+        
+        pipe = self.redis.pipeline(transaction=False)
+        for chunks_key in self._chunk_keys(request_id, tool_calls):
+            pipe.lrange(chunks_key, 0, -1)
+        return self._expand_tool_calls(tool_calls, pipe.execute())
+    
+    async def aget_tool_calls(self, request_id: str, full: bool = False) -> List[Dict]:
+        """Async version of get_tool_calls"""
+        key = entity_key(self.tool_calls_key, request_id)
+        tool_calls = self._decode_tool_calls(await self.async_redis.lrange(key, 0, -1))
+        if not full:
+            return [preview(call) for call in tool_calls]
+        
+        pipe = self.async_redis.pipeline(transaction=False)
+        for chunks_key in self._chunk_keys(request_id, tool_calls):
+            pipe.lrange(chunks_key, 0, -1)
+        return self._expand_tool_calls(tool_calls, await pipe.execute())
+    
+    def get_tool_call(self, request_id: str, index: int) -> Optional[Dict]:
+        """Get one tool call (1-based chronological index) with its full output"""
+        raw = self.redis.lindex(entity_key(self.tool_calls_key, request_id), -index) if index > 0 else None
+        tool_calls = self._decode_tool_calls([raw] if raw else [])
+        if not tool_calls:
+            return None
+        chunk_lists = [self.redis.lrange(key, 0, -1) for key in self._chunk_keys(request_id, tool_calls)]
+        return {**self._expand_tool_calls(tool_calls, chunk_lists)[0], "index": index}
+    
+    async def aget_tool_call(self, request_id: str, index: int) -> Optional[Dict]:
+        """Async version of get_tool_call"""
+        raw = await self.async_redis.lindex(entity_key(self.tool_calls_key, request_id), -index) if index > 0 else None
+        tool_calls = self._decode_tool_calls([raw] if raw else [])
+        if not tool_calls:
+            return None
+        chunk_lists = [await self.async_redis.lrange(key, 0, -1) for key in self._chunk_keys(request_id, tool_calls)]
+        return {**self._expand_tool_calls(tool_calls, chunk_lists)[0], "index": index}
     
-    def get_all_sessions(self) -> List[Dict]:
-        """Get all session IDs with their last message"""
-        sessions = []
+    def _sessions_range(self, after: Optional[tuple[int, str]]) -> tuple[str, int]:
+        """Score range (newest, oldest) of a sessions page"""
+        # Sessions idle for longer than the conversation TTL have expired
+        oldest = int((time.time() - self.expire_seconds) * 1000)
+        # Inclusive: sessions sharing the cursor's score are filtered by ID in _sessions_after
+        newest = str(after[0]) if after is not None else "+inf"
+        return newest, oldest
+    
+    def _sessions_after(self, entries: list, after: Optional[tuple[int, str]]) -> list:
+        """Entries past the cursor; ZREVRANGEBYSCORE orders equal scores by member, descending"""
+        return [
+            (session_id, score) for session_id, score in entries
+            if after is None or (int(score), session_id) < after
+        ]
+    
+    def _sessions_page(self, entries: list, previews: list, limit: int) -> tuple[List[Dict], Optional[str]]:
+        sessions = [
+            {
+                "session_id": session_id,
+                "last_message": preview or "",
+                "last_activity": int(score)
+            }
+            for (session_id, score), preview in zip(entries, previews)
+        ]
+        return sessions, self._next_session_cursor(sessions, limit)
+    
+    def list_sessions(self, cursor: Optional[str] = None, limit: int = 50) -> tuple[List[Dict], Optional[str]]:
+        """Page through sessions by last activity, newest first (see alist_sessions)"""
+        after = self._parse_session_cursor(cursor)
+        newest, oldest = self._sessions_range(after)
+        entries, start = [], 0
+        while len(entries) < limit:
+            batch = self.redis.zrevrangebyscore(self.sessions_key, newest, oldest, start=start, num=limit, withscores=True)
+            entries += self._sessions_after(batch, after)
+            if len(batch) < limit:
+                break
+            start += limit
+        entries = entries[:limit]
+        if not entries:
+            return [], None
+        previews = self.redis.hmget(self.session_previews_key, [session_id for session_id, _ in entries])
+        return self._sessions_page(entries, previews, limit)
+    
+    async def alist_sessions(self, cursor: Optional[str] = None, limit: int = 50) -> tuple[List[Dict], Optional[str]]:
+        """
+        Page through sessions by last activity, newest first (ties by session ID, descending).
+        
+        Args:
+            cursor: next_cursor of the previous page (None for the first page)
+            limit: Page size
+        
+        Returns:
+            Tuple of (sessions, next_cursor); next_cursor is None on the last page
+        
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        after = self._parse_session_cursor(cursor)
+        newest, oldest = self._sessions_range(after)
+        entries, start = [], 0
+        while len(entries) < limit:
+            batch = await self.async_redis.zrevrangebyscore(
+                self.sessions_key, newest, oldest, start=start, num=limit, withscores=True
+            )
+            entries += self._sessions_after(batch, after)
+            if len(batch) < limit:
+                break
+            start += limit
+        entries = entries[:limit]
+        if not entries:
+            return [], None
+        previews = await self.async_redis.hmget(self.session_previews_key, [session_id for session_id, _ in entries])
+        return self._sessions_page(entries, previews, limit)
+    
+    def prune_sessions(self, batch_size: int = 500) -> int:
+        """
+        Remove sessions idle for longer than the conversation TTL from the session index.
+        
+        Their conversations have expired; the index and previews have no TTL of their own.
+        
+        Returns:
+            Number of sessions removed
+        """
+        total = 0
+        while True:
+            cutoff = int((time.time() - self.expire_seconds) * 1000)
+            removed = self._prune_sessions_script(
+                keys=[self.sessions_key, self.session_previews_key], args=[cutoff, batch_size]
+            )
+            total += removed
+            if removed < batch_size:
+                return total
+    
+    def backfill_session_index(self) -> int:
+        """
+        Build the session index from existing conversation lists (one-off, SCANs the keyspace).
+        
+        Returns:
+            Number of sessions indexed
+        """
+        count = 0
         pattern = f"{self.conversation_key}:*"
+        for key in self.redis.scan_iter(match=pattern, count=500):
+            session_id = untagged(key.replace(f"{self.conversation_key}:", "", 1))
+            newest = self.redis.lindex(key, 0)
+            if not newest:
+                continue
+            
+            message = decode_message(newest)
+            last_activity = self._timestamp_ms(message)
+            
+            pipe = self.redis.pipeline(transaction=False)
+            # Keep a newer score if live traffic already indexed the session
+            pipe.zadd(self.sessions_key, {session_id: last_activity}, gt=True)
+            pipe.hsetnx(self.session_previews_key, session_id, message.get("content", "")[:self.preview_chars])
+            pipe.execute()
+            count += 1
         
-        cursor = 0
+        return count
+    
+    def backfill_search_index(self) -> int:
+        """
+        Index existing conversations (hot and archived) for keyword search (one-off, SCANs the keyspace).
+        
+        Sessions that already have search index data are skipped, so the command can be
+        re-run safely. Messages stored before message IDs existed are given one, written
+        back to their list so search results can be looked up by it.
+        
+        Returns:
+            Number of sessions indexed
+        """
+        count = 0
+        pattern = f"{self.conversation_key}:*"
+        for key in self.redis.scan_iter(match=pattern, count=500):
+            session_id = untagged(key.replace(f"{self.conversation_key}:", "", 1))
+            if self.redis.exists(f"{self._search_prefix(session_id)}:docs"):
+                continue
+            
+            messages = self._assign_message_ids(key) + self._assign_message_ids(entity_key(self.archive_key, session_id))
+            if not messages:
+                continue
+            
+            pipe = self.redis.pipeline(transaction=False)
+            self._index_messages(pipe, session_id, messages)
+            pipe.execute()
+            count += 1
+        
+        return count
+    
+    def _assign_message_ids(self, key: str) -> List[Dict]:
+        """Decoded messages of a list, after writing an ID into those stored without one"""
+        def rewrite(pipe) -> List[Dict]:
+            messages, changed = [], []
+            for position, raw in enumerate(pipe.lrange(key, 0, -1)):
+                message = decode_message(raw)
+                if not message.get("id"):
+                    message["id"] = generate_cuid()
+                    changed.append((position, encode_message(message)))
+                messages.append(message)
+            pipe.multi()
+            for position, value in changed:
+                pipe.lset(key, position, value)
+            return messages
+        
+        return self.redis.transaction(rewrite, key, value_from_callable=True)
+    
+    def _reencode(self, raw: str, decode, encode) -> Optional[str]:
+        """Value in the current STORAGE_FORMAT, or None if it already is (or cannot be converted)"""
+        if is_current(raw):
+            return None
+        try:
+            return encode(decode(raw))
+        except (KeyError, TypeError, ValueError):
+            # E.g. messages written before message IDs existed; readers still accept them as they are
+            return None
+    
+    def _migrate_key(self, key: str, decode, encode) -> int:
+        """Re-encode one list in place; WATCH makes the rewrite retry if the key changes meanwhile"""
+        def rewrite(pipe) -> int:
+            changed = []
+            for position, raw in enumerate(pipe.lrange(key, 0, -1)):
+                value = self._reencode(raw, decode, encode)
+                if value is not None:
+                    changed.append((position, value))
+            pipe.multi()
+            # LSET keeps the list's TTL; positions are stable while the key is watched
+            for position, value in changed:
+                pipe.lset(key, position, value)
+            return len(changed)
+        
+        return self.redis.transaction(rewrite, key, value_from_callable=True)
+    
+    def migrate_encoding(self, batch_size: int = 500) -> Dict[str, int]:
+        """
+        Rewrite stored messages and tool calls in the STORAGE_FORMAT schema (SCANs the keyspace).
+        
+        Keys are converted one at a time, so the command can run against live traffic
+        and be re-run safely; values already in the target format are left alone.
+        
+        Args:
+            batch_size: SCAN batch size
+        
+        Returns:
+            Number of keys scanned and values rewritten
+        """
+        targets = [
+            (f"{self.conversation_key}:*", decode_message, encode_message),
+            (f"{self.archive_key}:*", decode_message, encode_message),
+            (f"{self.tool_calls_key}:*", decode_tool_call, encode_tool_call),
+        ]
+        totals = {"keys": 0, "values": 0}
+        for pattern, decode, encode in targets:
+            for key in self.redis.scan_iter(match=pattern, count=batch_size):
+                totals["keys"] += 1
+                totals["values"] += self._migrate_key(key, decode, encode)
+        return totals
+    
+    def retention_candidates(self, idle_before_ms: int, whole: bool, batch_size: int = 500) -> List[str]:
+        """
+        Sessions idle since before a time that still hold messages to move to the cold archive.
+        
+        Args:
+            idle_before_ms: Last activity cutoff (epoch ms)
+            whole: Sessions with any messages in Redis qualify; otherwise only those with an archive list
+            batch_size: Sessions checked per round trip
+        """
+        # Sessions idle for longer than the conversation TTL have already expired
+        oldest = int((time.time() - self.expire_seconds) * 1000)
+        candidates = []
+        start = 0
         while True:
-            cursor, keys = self.redis.scan(cursor, match=pattern, count=100)
-            for key in keys:
-                session_id = key.replace(f"{self.conversation_key}:", "")
-                # Get the last message
-                messages = self.get_messages(session_id, limit=1)
-                last_message = messages[0].get("content", "") if messages else ""
-                
-                sessions.append({
-                    "session_id": session_id,
-                    "last_message": last_message
-                })
+            session_ids = self.redis.zrangebyscore(self.sessions_key, oldest, idle_before_ms, start=start, num=batch_size)
+            if not session_ids:
+                return candidates
+            pipe = self.redis.pipeline(transaction=False)
+            for session_id in session_ids:
+                pipe.llen(entity_key(self.conversation_key, session_id))
+                pipe.llen(entity_key(self.archive_key, session_id))
+            lengths = pipe.execute()
+            for session_id, hot_len, archived_len in zip(session_ids, lengths[::2], lengths[1::2]):
+                if archived_len or (whole and hot_len):
+                    candidates.append(session_id)
+            start += batch_size
+    
+    def move_to_cold(self, session_id: str, whole: bool) -> Dict[str, int]:
+        """
+        Move a session's archive list (and with `whole`, its hot list too) to the cold archive.
+        
+        Messages are written to disk before they are deleted from Redis. The lists are
+        watched, so a concurrent append makes the move start over; messages already in
+        the cold archive are not written twice. The version key is kept with its TTL, so
+        history ETags and cursors stay valid if the session is resumed before it expires.
+        
+        Returns:
+            Messages moved and compressed bytes written
+        """
+        conversation_key = entity_key(self.conversation_key, session_id)
+        archive_key = entity_key(self.archive_key, session_id)
+        index_key = entity_key(self.message_index_key, session_id)
+        
+        def move(pipe, reader) -> Dict[str, int]:
+            hot = reader.lrange(conversation_key, 0, -1)
+            archived = reader.lrange(archive_key, 0, -1)
+            raw = hot + archived if whole else archived
+            messages = [decode_message(item) for item in reversed(raw)]
+            # Left there by an earlier attempt that lost the WATCH race
+            already = self.cold_archive.get_messages(session_id, limit=len(raw)) if raw else []
+            archived_ids = {message.get("id") for message in already}
+            written = self.cold_archive.append(
+                session_id, [message for message in messages if message.get("id") not in archived_ids]
+            )
+            if reader is pipe:
+                pipe.multi()
+            if whole:
+                pipe.delete(conversation_key)
+                pipe.delete(index_key)
+            else:
+                # Index only what the hot list still holds
+                pipe.zremrangebyrank(index_key, 0, -len(hot) - 1)
+            pipe.delete(archive_key)
+            if reader is not pipe:
+                pipe.execute()
+            return {"messages": len(raw), "bytes": written}
+        
+        if self.cold_archive is None:
+            raise ValueError("Cold archive not configured")
+        if MULTI_KEY_TRANSACTIONS:
+            return self.redis.transaction(
+                lambda pipe: move(pipe, pipe), conversation_key, archive_key, value_from_callable=True
+            )
+        # Keys may live on different cluster nodes; the caller's session lease fences appends instead
+        return move(self.redis.pipeline(transaction=False), self.redis)
+    
+    def _drop_output(self, raw: str, cutoff: str) -> Optional[Dict]:
+        """Tool call with its output reduced to the preview, or None if it is too recent or already small"""
+        try:
+            tool_call = decode_tool_call(raw)
+        except ValueError:
+            return None
+        if tool_call.get("output_dropped") or tool_call.get("timestamp", cutoff) >= cutoff:
+            return None
+        output = tool_call.get("output") or ""
+        if not is_encoded(tool_call) and len(output) <= TOOL_OUTPUT_PREVIEW_CHARS:
+            return None
+        dropped = {k: v for k, v in tool_call.items() if k not in CODEC_FIELDS}
+        dropped["output"] = output[:TOOL_OUTPUT_PREVIEW_CHARS]
+        dropped["output_size"] = tool_call.get("output_size", len(output.encode("utf-8")))
+        dropped["output_dropped"] = True
+        return dropped
+    
+    def drop_tool_outputs(self, older_than: datetime, batch_size: int = 500) -> int:
+        """
+        Replace the outputs of tool calls made before a time with their preview (SCANs the keyspace).
+        
+        Tool name, input, timestamp and output size are kept; chunk keys of dropped
+        outputs are deleted. Records get `output_dropped: true`.
+        
+        Returns:
+            Number of tool calls rewritten
+        """
+        cutoff = older_than.isoformat()
+        # Keys written since the cutoff still have more TTL left than this
+        min_ttl = self.expire_seconds - (datetime.now() - older_than).total_seconds()
+        total = 0
+        keys = []
+        for key in self.redis.scan_iter(match=f"{self.tool_calls_key}:*", count=batch_size):
+            keys.append(key)
+            if len(keys) == batch_size:
+                total += self._drop_outputs_batch(keys, cutoff, min_ttl)
+                keys = []
+        if keys:
+            total += self._drop_outputs_batch(keys, cutoff, min_ttl)
+        return total
+    
+    def _drop_outputs_batch(self, keys: List[str], cutoff: str, min_ttl: float) -> int:
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.ttl(key)
+        total = 0
+        for key, ttl in zip(keys, pipe.execute()):
+            if ttl > min_ttl:
+                continue
+            request_id = untagged(key.replace(f"{self.tool_calls_key}:", "", 1))
             
-            if cursor == 0:
-                break
+            def rewrite(pipe) -> List[Dict]:
+                changed = []
+                for position, raw in enumerate(pipe.lrange(key, 0, -1)):
+                    dropped = self._drop_output(raw, cutoff)
+                    if dropped is not None:
+                        changed.append((position, raw, dropped))
+                pipe.multi()
+                for position, _, dropped in changed:
+                    pipe.lset(key, position, encode_tool_call(dropped))
+                return [decode_tool_call(raw) for _, raw, _ in changed]
+            
+            dropped_calls = self.redis.transaction(rewrite, key, value_from_callable=True)
+            chunk_keys = self._chunk_keys(request_id, dropped_calls)
+            if chunk_keys:
+                self.redis.delete(*chunk_keys)
+            total += len(dropped_calls)
+        return total
+    
+    def session_usage(self, session_id: str) -> Dict:
+        """
+        Bytes used by a session in Redis (MEMORY USAGE per key family) and in the cold archive.
+        
+        Tool calls are attributed through the request IDs in the metadata of the session's
+        messages still held in Redis.
+        """
+        keys = {
+            "conversation": entity_key(self.conversation_key, session_id),
+            "archive": entity_key(self.archive_key, session_id),
+            "message_index": entity_key(self.message_index_key, session_id),
+        }
+        request_ids = {
+            message.get("metadata", {}).get("request_id")
+            for message in self.get_messages(session_id, self.max_messages + self.archive_max_messages)
+        }
+        request_ids.discard(None)
+        
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys.values():
+            pipe.memory_usage(key)
+        for request_id in request_ids:
+            pipe.memory_usage(entity_key(self.tool_calls_key, request_id))
+        sizes = [size or 0 for size in pipe.execute()]
+        
+        redis_bytes = dict(zip(keys, sizes))
+        redis_bytes["tool_calls"] = sum(sizes[len(keys):])
+        cold = {"messages": 0, "bytes": 0, "raw_bytes": 0}
+        if self.cold_archive is not None:
+            cold = self.cold_archive.usage(session_id)
+        return {
+            "session_id": session_id,
+            "redis_bytes": redis_bytes,
+            "cold": cold,
+            "total_bytes": sum(redis_bytes.values()) + cold["bytes"],
+        }
+    
+    def usage_totals(self, batch_size: int = 500) -> Dict[str, Dict[str, int]]:
+        """Keys and bytes (MEMORY USAGE) per key family across Redis (SCANs the keyspace)"""
+        families = {
+            "conversations": self.conversation_key,
+            "archives": self.archive_key,
+            "message_indexes": self.message_index_key,
+            "tool_calls": self.tool_calls_key,
+            "tool_output_chunks": self.tool_output_chunks_key,
+            "search": self.search_key,
+        }
+        totals = {}
+        for family, prefix in families.items():
+            count = size = 0
+            keys = []
+            for key in self.redis.scan_iter(match=f"{prefix}:*", count=batch_size):
+                keys.append(key)
+                if len(keys) == batch_size:
+                    size += self._memory_usage(keys)
+                    count += len(keys)
+                    keys = []
+            size += self._memory_usage(keys)
+            totals[family] = {"keys": count + len(keys), "bytes": size}
+        return totals
+    
+    def _memory_usage(self, keys: List[str]) -> int:
+        if not keys:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key)
+        return sum(size or 0 for size in pipe.execute())
+    
+    def hash_tag_keys(self, extra_prefixes: Iterable[str] = ()) -> int:
+        """
+        Rename existing keys to their hash-tagged form (one-off, SCANs the keyspace).
+        
+        Run against a standalone server with REDIS_HASH_TAGS=true before moving the
+        data to a cluster; RENAME cannot cross slots on the cluster itself.
+        
+        Args:
+            extra_prefixes: Other per-entity key prefixes to convert (e.g. SessionQueue's)
+        
+        Returns:
+            Number of keys renamed
+        """
+        if not REDIS_HASH_TAGS:
+            raise ValueError("Set REDIS_HASH_TAGS=true to convert keys to hash-tagged names")
+        
+        prefixes = [
+            self.conversation_key,
+            self.archive_key,
+            self.session_fence_key,
+            self.session_version_key,
+            self.message_index_key,
+            self.summary_key,
+            self.tool_calls_key,
+            self.tool_output_chunks_key,
+            self.request_status_key,
+            f"{self.search_key}:session",
+            *extra_prefixes,
+        ]
+        count = 0
+        for prefix in dict.fromkeys(prefixes):
+            for key in self.redis.scan_iter(match=f"{prefix}:*", count=500):
+                entity_id, _, rest = key[len(prefix) + 1:].partition(":")
+                if entity_id.startswith("{"):
+                    continue
+                new_key = entity_key(prefix, entity_id, *([rest] if rest else []))
+                # RENAMENX leaves keys alone if live traffic already wrote the tagged key
+                count += self.redis.renamenx(key, new_key)
         
-        return sessions
-  
\ No newline at end of file
+        # The session index is one global key pair; merge it into the tagged pair live traffic may have started
+        if self.redis.exists("sessions"):
+            self.redis.zunionstore(self.sessions_key, [self.sessions_key, "sessions"], aggregate="MAX")
+            self.redis.delete("sessions")
+            count += 1
+        if self.redis.exists("session_previews"):
+            for session_id, preview in self.redis.hscan_iter("session_previews", count=500):
+                self.redis.hsetnx(self.session_previews_key, session_id, preview)
+            self.redis.delete("session_previews")
+            count += 1
+        
+        return count
+    
+    def tool_events_channel(self, request_id: str) -> str:
+        """Pub/sub channel carrying live tool events for a request"""
+        return f"{self.tool_events_key}:{request_id}"
+    
+    def publish_tool_event(self, request_id: str, event: Dict):
+        """Publish a tool event to the per-request channel"""
+        self.redis.publish(self.tool_events_channel(request_id), json.dumps(event, default=str))
+    
+    async def amark_request_done(self, request_id: str):
+        """Record that a request has finished and notify live subscribers"""
+        key = entity_key(self.request_status_key, request_id)
+        # Keep the marker long enough for late subscribers (1 day)
+        await self.async_redis.set(key, "done", ex=24 * 60 * 60)
+        await self.async_redis.publish(self.tool_events_channel(request_id), json.dumps({"type": "done"}))
+    
+    async def ais_request_done(self, request_id: str) -> bool:
+        """Check whether a request has already finished"""
+        return await self.async_redis.exists(entity_key(self.request_status_key, request_id)) > 0
+    
+    async def asubscribe_tool_events(self, request_id: str):
+        """Return an async pub/sub object subscribed to the request's tool events channel"""
+        pubsub = self.async_pubsub.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.tool_events_channel(request_id))
+        return pubsub
@@ -0,0 +1,89 @@
+import os
+from typing import List, Optional, Tuple
+from storage.keys import REDIS_HASH_TAGS
+
+# Token bucket settings: refill rate (requests/second) and burst size; rate 0 disables the bucket
+RATE_LIMIT_SESSION_RPS = float(os.getenv("RATE_LIMIT_SESSION_RPS", 1))
+RATE_LIMIT_SESSION_BURST = float(os.getenv("RATE_LIMIT_SESSION_BURST", 5))
+RATE_LIMIT_KEY_RPS = float(os.getenv("RATE_LIMIT_KEY_RPS", 5))
+RATE_LIMIT_KEY_BURST = float(os.getenv("RATE_LIMIT_KEY_BURST", 20))
+RATE_LIMIT_GLOBAL_RPS = float(os.getenv("RATE_LIMIT_GLOBAL_RPS", 0))
+RATE_LIMIT_GLOBAL_BURST = float(os.getenv("RATE_LIMIT_GLOBAL_BURST", 50))
+
+# Check every bucket first and only take a token from each when all of them allow it,
+# so a request rejected by one bucket does not drain the others.
+# KEYS: bucket keys; ARGV: rate1, burst1, rate2, burst2, ...
+# Returns 0 when admitted, otherwise the seconds until the request would fit (as a string).
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('time')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local levels = {}
+local wait = 0
+
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local bucket = redis.call('hmget', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+end
+
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - 1
+    end
+    redis.call('hset', key, 'tokens', tokens, 'ts', now)
+    redis.call('pexpire', key, math.ceil(burst / rate * 1000) + 1000)
+end
+
+return tostring(wait)
+"""
+
+
+class RateLimiter:
+    """
+    Redis-backed token buckets shared by all workers.
+    
+    Buckets live in `rate_limit:{scope}:{id}` hashes (tokens, last refill time) and
+    are refilled lazily inside a Lua script using the Redis server clock.
+    """
+    
+    def __init__(self, async_redis_client):
+        self.redis = async_redis_client
+        # The script touches several buckets at once; on Cluster they must share one slot
+        self.rate_limit_key = "{rate_limit}" if REDIS_HASH_TAGS else "rate_limit"
+        self._script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+    
+    def buckets_for(self, session_id: Optional[str], api_key: Optional[str]) -> List[Tuple[str, float, float]]:
+        """Bucket (key, rate, burst) triples that apply to a request"""
+        buckets = []
+        if session_id and RATE_LIMIT_SESSION_RPS > 0:
+            buckets.append((f"{self.rate_limit_key}:session:{session_id}", RATE_LIMIT_SESSION_RPS, RATE_LIMIT_SESSION_BURST))
+        if api_key and RATE_LIMIT_KEY_RPS > 0:
+            buckets.append((f"{self.rate_limit_key}:key:{api_key}", RATE_LIMIT_KEY_RPS, RATE_LIMIT_KEY_BURST))
+        if RATE_LIMIT_GLOBAL_RPS > 0:
+            buckets.append((f"{self.rate_limit_key}:global", RATE_LIMIT_GLOBAL_RPS, RATE_LIMIT_GLOBAL_BURST))
+        return buckets
+    
+    async def check(self, session_id: Optional[str], api_key: Optional[str]) -> float:
+        """
+        Take one token from every applicable bucket.
+        
+        Returns:
+            0 if the request is admitted, otherwise seconds until it would be
+        """
+        buckets = self.buckets_for(session_id, api_key)
+        if not buckets:
+            return 0.0
+        
+        keys = [key for key, _, _ in buckets]
+        args = [value for _, rate, burst in buckets for value in (rate, burst)]
+        return float(await self._script(keys=keys, args=args))
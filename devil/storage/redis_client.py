@@ -1,25 +1,214 @@
+"""
+Redis client construction.
+
+Topologies (REDIS_MODE, see storage/keys.py):
+    standalone - one server at REDIS_HOST:REDIS_PORT
+    sentinel   - master `REDIS_SENTINEL_MASTER` discovered via REDIS_SENTINELS
+    cluster    - Redis Cluster seeded from REDIS_CLUSTER_NODES
+
+Both clients use explicit pools sized from this process's concurrency: the sync
+client serves tool worker threads (TOOL_EXECUTOR_MAX_WORKERS), the async client
+serves in-flight requests (LLM_MAX_INFLIGHT). Transient connection errors are
+retried with jittered exponential backoff.
+"""
 import os
+from typing import Dict, List, Tuple
+
 import redis
+import redis.asyncio
 from dotenv import load_dotenv
+from redis.backoff import EqualJitterBackoff
+from redis.exceptions import BusyLoadingError, ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from storage.keys import REDIS_MODE
 from utils.logger import logger
 load_dotenv()
 
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_DB = int(os.getenv("REDIS_DB", 0))
+REDIS_USERNAME = os.getenv("REDIS_USERNAME") or None
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD") or None
+REDIS_SSL = os.getenv("REDIS_SSL", "false").lower() == "true"
+# Comma-separated host:port lists for sentinel and cluster modes
+REDIS_SENTINELS = os.getenv("REDIS_SENTINELS", "")
+REDIS_SENTINEL_MASTER = os.getenv("REDIS_SENTINEL_MASTER", "mymaster")
+REDIS_CLUSTER_NODES = os.getenv("REDIS_CLUSTER_NODES", "")
+
+# Sync pool: one connection per tool worker thread plus headroom for the API path
+REDIS_MAX_CONNECTIONS = int(os.getenv(
+    "REDIS_MAX_CONNECTIONS", int(os.getenv("TOOL_EXECUTOR_MAX_WORKERS", 32)) + 8
+))
+# Async pool: a request holds at most a couple of connections at once (e.g. a pub/sub subscription)
+REDIS_ASYNC_MAX_CONNECTIONS = int(os.getenv(
+    "REDIS_ASYNC_MAX_CONNECTIONS", int(os.getenv("LLM_MAX_INFLIGHT", 64)) * 2 + 16
+))
+# Seconds to wait for a free pooled connection before failing
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 5))
+# Must exceed the longest blocking command (job queue XREADGROUP blocks for 5s)
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 10))
+# PING idle connections before reuse if unused for this many seconds (0 disables)
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+# Retries of a command after a connection error or timeout, with jittered backoff
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", 3))
+REDIS_RETRY_BACKOFF_BASE = float(os.getenv("REDIS_RETRY_BACKOFF_BASE", 0.05))
+REDIS_RETRY_BACKOFF_CAP = float(os.getenv("REDIS_RETRY_BACKOFF_CAP", 1.0))
+
+RETRY_ERRORS = (RedisConnectionError, RedisTimeoutError, BusyLoadingError)
+
+
+def _parse_nodes(value: str) -> List[Tuple[str, int]]:
+    nodes = []
+    for node in value.split(","):
+        node = node.strip()
+        if node:
+            host, _, port = node.rpartition(":")
+            nodes.append((host, int(port)))
+    return nodes
+
+
+def _connection_kwargs() -> Dict:
+    """Connection settings shared by every topology and both clients"""
+    kwargs = {
+        "username": REDIS_USERNAME,
+        "password": REDIS_PASSWORD,
+        "decode_responses": True,
+        "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "socket_keepalive": True,
+        "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+    }
+    if REDIS_SSL:
+        kwargs["ssl"] = True
+    return kwargs
+
+
+def _retry(asyncio_client: bool = False):
+    backoff = EqualJitterBackoff(cap=REDIS_RETRY_BACKOFF_CAP, base=REDIS_RETRY_BACKOFF_BASE)
+    if asyncio_client:
+        from redis.asyncio.retry import Retry
+    else:
+        from redis.retry import Retry
+    return Retry(backoff, REDIS_RETRIES, supported_errors=RETRY_ERRORS)
+
+
+def _describe() -> str:
+    if REDIS_MODE == "sentinel":
+        return f"sentinel master '{REDIS_SENTINEL_MASTER}' via {REDIS_SENTINELS}"
+    if REDIS_MODE == "cluster":
+        return f"cluster {REDIS_CLUSTER_NODES}"
+    return f"{REDIS_HOST}:{REDIS_PORT}"
+
+
 def get_redis_client():
     """Create and return a Redis client connection"""
-    host = os.getenv("REDIS_HOST", "localhost")
-    port = int(os.getenv("REDIS_PORT", 6379))
+    kwargs = _connection_kwargs()
+    retry = _retry()
     
     try:
-        client = redis.Redis(
-            host=host,
-            port=port,
-            decode_responses=True,
-            socket_connect_timeout=5
-        )
+        if REDIS_MODE == "cluster":
+            from redis.cluster import RedisCluster, ClusterNode
+            client = RedisCluster(
+                startup_nodes=[ClusterNode(host, port) for host, port in _parse_nodes(REDIS_CLUSTER_NODES)],
+                # Per node
+                max_connections=REDIS_MAX_CONNECTIONS,
+                retry=retry,
+                **kwargs
+            )
+        elif REDIS_MODE == "sentinel":
+            from redis.sentinel import Sentinel, SentinelManagedSSLConnection
+            if kwargs.pop("ssl", False):
+                kwargs["connection_class"] = SentinelManagedSSLConnection
+            sentinel = Sentinel(
+                _parse_nodes(REDIS_SENTINELS),
+                sentinel_kwargs={"socket_timeout": REDIS_CONNECT_TIMEOUT, "password": REDIS_PASSWORD},
+            )
+            client = sentinel.master_for(
+                REDIS_SENTINEL_MASTER, db=REDIS_DB, retry=retry, max_connections=REDIS_MAX_CONNECTIONS, **kwargs
+            )
+        else:
+            if kwargs.pop("ssl", False):
+                kwargs["connection_class"] = redis.SSLConnection
+            pool = redis.BlockingConnectionPool(
+                host=REDIS_HOST,
+                port=REDIS_PORT,
+                db=REDIS_DB,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                timeout=REDIS_POOL_TIMEOUT,
+                retry=retry,
+                **kwargs
+            )
+            client = redis.Redis(connection_pool=pool)
         # Test connection
         client.ping()
-        logger.info(f"Connected to Redis at {host}:{port}")
+        logger.info(f"Connected to Redis ({_describe()}), pool size {REDIS_MAX_CONNECTIONS}")
         return client
     except Exception as e:
         raise ConnectionError(f"Failed to connect to Redis: {e}")
 
+
+def get_async_redis_client():
+    """
+    Create and return an asyncio Redis client (redis.asyncio).
+    
+    Connections are opened lazily on first use inside the running event loop,
+    so this does not ping the server; call it after get_redis_client() succeeded.
+    """
+    kwargs = _connection_kwargs()
+    retry = _retry(asyncio_client=True)
+    
+    if REDIS_MODE == "cluster":
+        from redis.asyncio.cluster import RedisCluster, ClusterNode
+        # The async cluster client keeps one connection pool per node; health checks are per command there
+        kwargs.pop("health_check_interval")
+        return RedisCluster(
+            startup_nodes=[ClusterNode(host, port) for host, port in _parse_nodes(REDIS_CLUSTER_NODES)],
+            max_connections=REDIS_ASYNC_MAX_CONNECTIONS,
+            retry=retry,
+            **kwargs
+        )
+    if REDIS_MODE == "sentinel":
+        from redis.asyncio.sentinel import Sentinel, SentinelManagedSSLConnection
+        if kwargs.pop("ssl", False):
+            kwargs["connection_class"] = SentinelManagedSSLConnection
+        sentinel = Sentinel(
+            _parse_nodes(REDIS_SENTINELS),
+            sentinel_kwargs={"socket_timeout": REDIS_CONNECT_TIMEOUT, "password": REDIS_PASSWORD},
+        )
+        return sentinel.master_for(
+            REDIS_SENTINEL_MASTER, db=REDIS_DB, retry=retry, max_connections=REDIS_ASYNC_MAX_CONNECTIONS, **kwargs
+        )
+    
+    if kwargs.pop("ssl", False):
+        kwargs["connection_class"] = redis.asyncio.SSLConnection
+    pool = redis.asyncio.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=REDIS_DB,
+        max_connections=REDIS_ASYNC_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        retry=retry,
+        **kwargs
+    )
+    return redis.asyncio.Redis(connection_pool=pool)
+
+
+def get_async_pubsub_client(async_redis_client):
+    """
+    Async client for pub/sub subscriptions.
+    
+    redis.asyncio's cluster client has no pub/sub; cluster PUBLISH is broadcast to
+    every node, so subscribers connect to a single seed node instead. Other modes
+    subscribe through the regular async client.
+    """
+    if REDIS_MODE != "cluster":
+        return async_redis_client
+    host, port = _parse_nodes(REDIS_CLUSTER_NODES)[0]
+    kwargs = _connection_kwargs()
+    if kwargs.pop("ssl", False):
+        kwargs["connection_class"] = redis.asyncio.SSLConnection
+    return redis.asyncio.Redis(
+        connection_pool=redis.asyncio.ConnectionPool(
+            host=host, port=port, max_connections=REDIS_ASYNC_MAX_CONNECTIONS, retry=_retry(asyncio_client=True), **kwargs
+        )
+    )
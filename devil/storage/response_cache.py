@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from storage.keys import MULTI_KEY_TRANSACTIONS
+
+# Cache agent responses by default (requests can still opt in/out individually)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+# Lifetime of a cached response (seconds)
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+# Max cached responses; the oldest entries are evicted beyond this
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+
+# Tools whose effects make a response unsafe to replay
+SIDE_EFFECT_TOOLS = {"run_shell", "write_file", "apply_patch"}
+
+
+def _normalize(text: str) -> str:
+    """Collapse whitespace so trivially different prompts share a key"""
+    return " ".join(str(text).split())
+
+
+def conversation_hash(model_name: str, messages: List) -> str:
+    """
+    Hash a full agent input: model name plus every message (system prompt,
+    history and the current query) as normalized (type, content) pairs.
+    """
+    payload = {
+        "model": model_name or "",
+        "messages": [[message.type, _normalize(message.content)] for message in messages],
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Exact-match cache of final agent responses in Redis.
+    
+    Entries live in `response_cache:{hash}` with a TTL. Insertion times are kept in the
+    `response_cache:index` sorted set so the oldest entries can be evicted once the
+    cache grows beyond RESPONSE_CACHE_MAX_ENTRIES. Hit/miss counters are kept in the
+    `response_cache:stats` hash so they are shared by all workers.
+    """
+    
+    def __init__(self, async_redis_client):
+        self.redis = async_redis_client
+        self.cache_key = "response_cache"
+        self.index_key = f"{self.cache_key}:index"
+        self.stats_key = f"{self.cache_key}:stats"
+    
+    async def get(self, key: str) -> Optional[str]:
+        """Return the cached response for a conversation hash and count the hit/miss"""
+        response = await self.redis.get(f"{self.cache_key}:{key}")
+        await self.redis.hincrby(self.stats_key, "hits" if response is not None else "misses", 1)
+        return response
+    
+    async def set(self, key: str, response: str):
+        """Store a response and evict the oldest entries beyond the size bound"""
+        now = time.time()
+        # Entry, index and stats keys sit in different Cluster slots; no MULTI there
+        pipe = self.redis.pipeline(transaction=MULTI_KEY_TRANSACTIONS)
+        pipe.set(f"{self.cache_key}:{key}", response, ex=RESPONSE_CACHE_TTL)
+        # Drop index entries whose cache keys have already expired
+        pipe.zremrangebyscore(self.index_key, 0, now - RESPONSE_CACHE_TTL)
+        pipe.zadd(self.index_key, {key: now})
+        pipe.hincrby(self.stats_key, "stores", 1)
+        pipe.zcard(self.index_key)
+        size = (await pipe.execute())[-1]
+        
+        overflow = size - RESPONSE_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            evicted = await self.redis.zpopmin(self.index_key, overflow)
+            if evicted:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.delete(*[f"{self.cache_key}:{member}" for member, _ in evicted])
+                pipe.hincrby(self.stats_key, "evictions", len(evicted))
+                await pipe.execute()
+    
+    async def record_bypass(self):
+        """Count a response that was not cached because a side-effecting tool ran"""
+        await self.redis.hincrby(self.stats_key, "bypassed", 1)
+    
+    async def stats(self) -> Dict:
+        """Hit/miss counters, hit rate and current size"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(self.stats_key)
+        pipe.zcard(self.index_key)
+        counters, size = await pipe.execute()
+        
+        stats = {name: int(counters.get(name, 0)) for name in ("hits", "misses", "stores", "bypassed", "evictions")}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = size
+        stats["max_entries"] = RESPONSE_CACHE_MAX_ENTRIES
+        stats["ttl"] = RESPONSE_CACHE_TTL
+        stats["enabled_by_default"] = RESPONSE_CACHE_ENABLED
+        return stats
@@ -0,0 +1,166 @@
+"""
+Retention policies for history held in Redis, applied by a background worker.
+
+Policies (days since the session's last activity or the tool call; 0 disables):
+    RETENTION_TRIM_AFTER_DAYS     move the archive list of idle sessions to the cold
+                                  archive, keeping only the hot list in Redis
+    RETENTION_ARCHIVE_AFTER_DAYS  move idle sessions to the cold archive entirely
+    RETENTION_TOOL_OUTPUT_DAYS    replace tool outputs with their preview, keeping
+                                  tool name, input, timestamp and size
+Anything left is still removed by the MEMORY_EXPIRE_DAYS TTL; cold segments are
+deleted after COLD_ARCHIVE_RETENTION_DAYS (ColdArchive.expire_segments). Each pass also prunes
+global search index entries older than that TTL (RedisMemoryStore.prune_search_index) and
+expired sessions from the session index (RedisMemoryStore.prune_sessions).
+
+Archived messages stay readable: RedisMemoryStore reads through to the cold
+archive (storage/cold_archive.py) when Redis holds fewer messages than asked for.
+Both moving policies are off by default; enable them only with COLD_ARCHIVE_DIR
+on storage every node mounts, or other nodes see moved messages as missing.
+Moving messages does not change a session's content or version, so neither the
+history cache nor history ETags need invalidating.
+
+One pass runs at a time across the fleet (RETENTION_LOCK_KEY, renewed while the
+pass runs), and each session is moved while holding its turn lease, so no turn
+writes to it meanwhile.
+
+Run with `python -m workers.retention` (every RETENTION_INTERVAL seconds) or once
+with `python manage.py retention`.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from storage.session_queue import RELEASE_SCRIPT, RENEW_SCRIPT, SessionBusyError
+from utils.executor import run_blocking
+
+RETENTION_TRIM_AFTER_DAYS = float(os.getenv("RETENTION_TRIM_AFTER_DAYS", 0))
+RETENTION_ARCHIVE_AFTER_DAYS = float(os.getenv("RETENTION_ARCHIVE_AFTER_DAYS", 0))
+RETENTION_TOOL_OUTPUT_DAYS = float(os.getenv("RETENTION_TOOL_OUTPUT_DAYS", 7))
+# Seconds between passes of the worker
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", 3600))
+
+# Held by the node running a pass; renewed every third of its TTL, so it expires soon after that node dies
+RETENTION_LOCK_KEY = "retention:lock"
+RETENTION_LOCK_TTL = 60
+# Hash with the results and usage totals of the last pass (JSON values)
+RETENTION_STATS_KEY = "retention:stats"
+
+
+class RetentionWorker:
+    """Applies the retention policies to a RedisMemoryStore with a cold archive"""
+    
+    def __init__(self, memory_store, session_queue, trim_after_days: float = RETENTION_TRIM_AFTER_DAYS,
+                 archive_after_days: float = RETENTION_ARCHIVE_AFTER_DAYS,
+                 tool_output_days: float = RETENTION_TOOL_OUTPUT_DAYS):
+        """
+        Args:
+            memory_store: RedisMemoryStore whose cold_archive is set
+            session_queue: SessionQueue fencing writes to a session while it is moved
+            trim_after_days: Idle days before a session's archive list is moved (0 disables)
+            archive_after_days: Idle days before a whole session is moved (0 disables)
+            tool_output_days: Days before tool outputs are dropped (0 disables)
+        """
+        self.store = memory_store
+        self.redis = memory_store.async_redis
+        self.session_queue = session_queue
+        self.trim_after_days = trim_after_days
+        self.archive_after_days = archive_after_days
+        self.tool_output_days = tool_output_days
+        self._release_script = self.redis.register_script(RELEASE_SCRIPT)
+        self._renew_script = self.redis.register_script(RENEW_SCRIPT)
+    
+    async def _renew_lock(self, owner: str):
+        while True:
+            await asyncio.sleep(RETENTION_LOCK_TTL / 3)
+            try:
+                if not await self._renew_script(keys=[RETENTION_LOCK_KEY], args=[owner, RETENTION_LOCK_TTL * 1000]):
+                    print("[RETENTION] Lost the pass lock")
+                    return
+            except Exception as e:
+                print(f"[RETENTION] Failed to renew the pass lock: {e}")
+    
+    async def _move_sessions(self, idle_days: float, whole: bool, results: Dict[str, int]):
+        idle_before_ms = int((time.time() - idle_days * 24 * 60 * 60) * 1000)
+        session_ids = await run_blocking(self.store.retention_candidates, idle_before_ms, whole)
+        for session_id in session_ids:
+            try:
+                async with self.session_queue.turn(session_id):
+                    moved = await run_blocking(self.store.move_to_cold, session_id, whole)
+            except SessionBusyError:
+                # Active again; it is no longer idle anyway
+                continue
+            except Exception as e:
+                print(f"[RETENTION] Failed to move session {session_id}: {e}")
+                results["errors"] += 1
+                continue
+            results["archived_sessions" if whole else "trimmed_sessions"] += 1
+            results["archived_messages"] += moved["messages"]
+            results["archived_bytes"] += moved["bytes"]
+    
+    async def run_once(self) -> Optional[Dict]:
+        """
+        Run one retention pass.
+        
+        Returns:
+            Counts of moved sessions, messages, bytes and dropped tool outputs plus
+            usage totals, or None if another node is running a pass
+        """
+        owner = str(uuid.uuid4())
+        if not await self.redis.set(RETENTION_LOCK_KEY, owner, nx=True, ex=RETENTION_LOCK_TTL):
+            return None
+        renew = asyncio.create_task(self._renew_lock(owner))
+        
+        started = time.monotonic()
+        results = {
+            "archived_sessions": 0,
+            "trimmed_sessions": 0,
+            "archived_messages": 0,
+            "archived_bytes": 0,
+            "tool_outputs_dropped": 0,
+            "search_docs_pruned": 0,
+            "sessions_pruned": 0,
+            "cold_segments_expired": 0,
+            "cold_messages_expired": 0,
+            "errors": 0,
+        }
+        try:
+            # Whole sessions first, so trimming does not also visit them
+            if self.archive_after_days:
+                await self._move_sessions(self.archive_after_days, True, results)
+            if self.trim_after_days:
+                await self._move_sessions(self.trim_after_days, False, results)
+            if self.tool_output_days:
+                older_than = datetime.now() - timedelta(days=self.tool_output_days)
+                results["tool_outputs_dropped"] = await run_blocking(self.store.drop_tool_outputs, older_than)
+            results["search_docs_pruned"] = await run_blocking(self.store.prune_search_index)
+            results["sessions_pruned"] = await run_blocking(self.store.prune_sessions)
+            expired = await run_blocking(self.store.cold_archive.expire_segments)
+            results["cold_segments_expired"] = expired["segments"]
+            results["cold_messages_expired"] = expired["messages"]
+            
+            usage = {
+                "redis": await run_blocking(self.store.usage_totals),
+                "cold": await run_blocking(self.store.cold_archive.total_usage),
+            }
+            results["duration_seconds"] = round(time.monotonic() - started, 3)
+            results["finished_at"] = datetime.now().isoformat()
+            await self.redis.hset(RETENTION_STATS_KEY, mapping={
+                "last_run": json.dumps(results),
+                "usage": json.dumps(usage),
+            })
+        finally:
+            renew.cancel()
+            await self._release_script(keys=[RETENTION_LOCK_KEY], args=[owner])
+        
+        print(f"[RETENTION] Pass finished: {results}")
+        return {**results, "usage": usage}
+
+
+async def read_stats(async_redis) -> Dict:
+    """Results and usage totals of the last pass (empty before the first one)"""
+    stored = await async_redis.hgetall(RETENTION_STATS_KEY)
+    return {field: json.loads(value) for field, value in stored.items()}
@@ -0,0 +1,133 @@
+"""
+Semantic recall over conversation messages and tool outputs.
+
+Complements the keyword index in MemoryStore: entries are embedded with the
+configured provider (storage.embeddings) and stored in a local VectorIndex, so
+paraphrased questions still find earlier answers and earlier tool results.
+
+The index is bounded like the conversations it mirrors: each session keeps its
+newest VECTOR_MAX_ENTRIES_PER_SESSION entries, and every VECTOR_COMPACT_INTERVAL
+seconds a writer compacts away deleted entries and those older than
+MEMORY_EXPIRE_DAYS.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from storage.base import MEMORY_EXPIRE_DAYS
+from storage.embeddings import Embedder, get_embedder
+from storage.vector_index import VectorIndex
+
+SEMANTIC_MEMORY_ENABLED = os.getenv("SEMANTIC_MEMORY_ENABLED", "true").lower() == "true"
+# Shared by all processes on a host (API and workers); flock-protected appends
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "data/vector_index")
+# Tools whose output is itself recalled memory; indexing it would only duplicate entries
+SEMANTIC_MEMORY_SKIP_TOOLS = {"recall", "search_memory", "get_tool_calls"}
+# Characters of each entry kept in the index metadata for display
+PREVIEW_CHARS = 1000
+# Newest entries kept per session; older ones are deleted (0 keeps all)
+VECTOR_MAX_ENTRIES_PER_SESSION = int(os.getenv("VECTOR_MAX_ENTRIES_PER_SESSION", 2000))
+# Seconds between compactions of the index by each process (0 disables)
+VECTOR_COMPACT_INTERVAL = int(os.getenv("VECTOR_COMPACT_INTERVAL", 3600))
+
+
+class SemanticMemory:
+    """
+    Embeds and indexes messages and tool calls, and recalls the most similar ones.
+    
+    Entries are indexed once, at write time. Metadata keeps a preview plus the
+    session and request IDs, so full tool calls can be fetched afterwards with
+    MemoryStore.get_tool_calls.
+    """
+    
+    def __init__(self, embedder: Embedder, index: VectorIndex):
+        self.embedder = embedder
+        self.index = index
+        self._compact_lock = threading.Lock()
+        self._next_compact = time.monotonic() + VECTOR_COMPACT_INTERVAL
+    
+    @classmethod
+    def from_env(cls) -> "SemanticMemory":
+        """Build the configured embedder and open (or create) the index in VECTOR_INDEX_DIR"""
+        embedder = get_embedder()
+        return cls(embedder, VectorIndex(VECTOR_INDEX_DIR, embedder.dim, embedder.name,
+                                         max_session_rows=VECTOR_MAX_ENTRIES_PER_SESSION))
+    
+    def _add(self, texts: List[str], metadata: List[Dict]):
+        self.index.add(self.embedder.embed(texts), metadata)
+        self._maybe_compact()
+    
+    def _maybe_compact(self):
+        """Compact the index when this process's interval has elapsed (runs in the writing thread)"""
+        if not VECTOR_COMPACT_INTERVAL or time.monotonic() < self._next_compact:
+            return
+        if not self._compact_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_compact = time.monotonic() + VECTOR_COMPACT_INTERVAL
+            cutoff = (datetime.now() - timedelta(days=MEMORY_EXPIRE_DAYS)).isoformat()
+            removed = self.index.compact(expire_before=cutoff)
+            if removed:
+                print(f"[DEBUG] Compacted vector index: {removed} entries removed")
+        except Exception as e:
+            print(f"[DEBUG] Vector index compaction failed: {e}")
+        finally:
+            self._compact_lock.release()
+    
+    def add_turn(self, session_id: str, user_content: str, assistant_content: str, request_id: Optional[str] = None):
+        """Index the user query and agent response of a turn"""
+        timestamp = datetime.now().isoformat()
+        texts = [user_content, assistant_content]
+        metadata = [
+            {
+                "kind": "message",
+                "role": role,
+                "session_id": session_id,
+                "request_id": request_id,
+                "timestamp": timestamp,
+                "text": content[:PREVIEW_CHARS],
+            }
+            for role, content in (("user", user_content), ("assistant", assistant_content))
+        ]
+        self._add(texts, metadata)
+    
+    def add_tool_call(self, session_id: str, request_id: str, tool_call: Dict):
+        """Index a stored tool call (as returned by MemoryStore.add_tool_call)"""
+        if tool_call["tool_name"] in SEMANTIC_MEMORY_SKIP_TOOLS:
+            return
+        text = f"{tool_call['tool_name']}: {tool_call['input']}\n{tool_call['output']}"
+        self._add([text], [{
+            "kind": "tool_call",
+            "session_id": session_id,
+            "request_id": request_id,
+            "tool_name": tool_call["tool_name"],
+            "index": tool_call.get("index"),
+            "timestamp": tool_call.get("timestamp"),
+            "input": str(tool_call["input"])[:PREVIEW_CHARS],
+            "text": str(tool_call["output"])[:PREVIEW_CHARS],
+        }])
+    
+    def recall(self, query: str, session_id: Optional[str] = None, kind: Optional[str] = None,
+               limit: int = 5) -> List[Dict]:
+        """
+        Find the stored entries most similar to a query.
+        
+        Args:
+            query: Free-text query
+            session_id: Restrict to one session, or None for all sessions
+            kind: "message", "tool_call", or None for both
+            limit: Maximum number of results
+        
+        Returns:
+            Entry metadata dicts with a "score" (cosine similarity), best first
+        """
+        vector = self.embedder.embed([query])[0]
+        results = []
+        for score, metadata in self.index.search(vector, limit, session_id=session_id, kind=kind):
+            if score <= 0:
+                continue
+            metadata["score"] = round(score, 4)
+            results.append(metadata)
+        return results
@@ -0,0 +1,154 @@
+"""
+Encoding of messages and tool calls stored in Redis.
+
+Schema versions:
+    v1 - JSON object with every field spelled out and an ISO timestamp,
+         e.g. {"id": ..., "role": "user", "content": ..., "timestamp": "2025-...", "metadata": {}}
+    v2 - compact JSON array with a leading version number, epoch-millisecond
+         timestamp, role code and metadata omitted when empty (read only; it
+         dropped microseconds and UTC offsets)
+    v3 - like v2, but the timestamp is epoch microseconds, or the ISO string
+         itself when microseconds would not reproduce it exactly (e.g. "+05:30"):
+             message:   [3, id, role_code, content, ts(, metadata)]
+             tool call: [3, tool_name, input, output, ts(, extra fields)]
+
+Readers accept all of them (v1 values start with "{", the others with "["), so
+keys can be converted gradually with `python manage.py migrate-storage`. Writers
+use STORAGE_FORMAT; switch to "compact" once every reader in the fleet runs this
+version.
+
+Values stay text because the Redis clients run with decode_responses=True.
+orjson is used when installed (several times faster than json for both
+directions); the output is identical either way.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Dict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# "json" (v1, default, readable by older releases) or "compact" (v3)
+STORAGE_FORMAT = os.getenv("STORAGE_FORMAT", "json").lower()
+
+SCHEMA_VERSION = 3
+
+ROLE_CODES = {"user": 0, "assistant": 1, "system": 2, "tool": 3}
+ROLES = {code: role for role, code in ROLE_CODES.items()}
+
+# Tool-call fields stored positionally in v2; anything else goes into the trailing extras dict
+TOOL_CALL_FIELDS = ("tool_name", "input", "output", "timestamp")
+
+
+def dumps(value) -> str:
+    """Serialize to compact JSON text"""
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(raw: str):
+    """Parse JSON text"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def from_us(timestamp_us: int) -> str:
+    """Epoch microseconds as the local ISO timestamp readers expect"""
+    seconds, microseconds = divmod(timestamp_us, 1_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=microseconds).isoformat()
+
+
+def pack_timestamp(timestamp: str):
+    """
+    ISO timestamp as epoch microseconds, or the string itself when converting
+    back would not give the same string (UTC offsets, DST folds, other spellings)
+    """
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        timestamp_us = int(moment.timestamp()) * 1_000_000 + moment.microsecond
+        if from_us(timestamp_us) == timestamp:
+            return timestamp_us
+    return timestamp
+
+
+def unpack_timestamp(version: int, value) -> str:
+    """ISO timestamp from a stored v2 or v3 timestamp field"""
+    if isinstance(value, str):
+        return value
+    if version == 2:
+        return datetime.fromtimestamp(value / 1000).isoformat()
+    return from_us(value)
+
+
+def is_current(raw: str) -> bool:
+    """Whether a stored value already uses the format STORAGE_FORMAT writes"""
+    if STORAGE_FORMAT == "compact":
+        return raw.startswith(f"[{SCHEMA_VERSION},")
+    return not raw.startswith("[")
+
+
+def encode_message(message: Dict) -> str:
+    """Serialize a conversation message in the STORAGE_FORMAT schema"""
+    if STORAGE_FORMAT != "compact":
+        return dumps(message)
+    
+    role = ROLE_CODES.get(message["role"], message["role"])
+    fields = [SCHEMA_VERSION, message["id"], role, message["content"], pack_timestamp(message["timestamp"])]
+    if message.get("metadata"):
+        fields.append(message["metadata"])
+    return dumps(fields)
+
+
+def decode_message(raw: str) -> Dict:
+    """Parse a stored conversation message of any schema version"""
+    value = loads(raw)
+    if isinstance(value, dict):
+        return value
+    
+    version, message_id, role, content, timestamp, *rest = value
+    return {
+        "id": message_id,
+        "role": ROLES.get(role, role),
+        "content": content,
+        "timestamp": unpack_timestamp(version, timestamp),
+        "metadata": rest[0] if rest else {},
+    }
+
+
+def encode_tool_call(tool_call: Dict) -> str:
+    """Serialize a tool-call record in the STORAGE_FORMAT schema"""
+    if STORAGE_FORMAT != "compact":
+        return dumps(tool_call)
+    
+    fields = [
+        SCHEMA_VERSION,
+        tool_call["tool_name"],
+        tool_call["input"],
+        tool_call["output"],
+        pack_timestamp(tool_call["timestamp"]),
+    ]
+    extra = {k: v for k, v in tool_call.items() if k not in TOOL_CALL_FIELDS}
+    if extra:
+        fields.append(extra)
+    return dumps(fields)
+
+
+def decode_tool_call(raw: str) -> Dict:
+    """Parse a stored tool-call record of any schema version"""
+    value = loads(raw)
+    if isinstance(value, dict):
+        return value
+    
+    version, tool_name, tool_input, output, timestamp, *rest = value
+    return {
+        "tool_name": tool_name,
+        "input": tool_input,
+        "output": output,
+        "timestamp": unpack_timestamp(version, timestamp),
+        **(rest[0] if rest else {}),
+    }
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+from storage.keys import entity_key
+
+# Max turns queued (running + waiting) per session before new ones are rejected
+SESSION_QUEUE_MAX_DEPTH = int(os.getenv("SESSION_QUEUE_MAX_DEPTH", 4))
+# Lease lifetime; renewed every third of it while the turn is running
+SESSION_LOCK_TTL_MS = int(os.getenv("SESSION_LOCK_TTL_MS", 30000))
+# How long a turn waits for the previous one before giving up (seconds)
+SESSION_LOCK_WAIT = float(os.getenv("SESSION_LOCK_WAIT", 600))
+
+# Take the lease if free; every successful acquisition bumps the fencing counter
+ACQUIRE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+local token = redis.call('incr', KEYS[2])
+redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return token
+"""
+
+# Extend / drop the lease only if we still own it
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SessionBusyError(Exception):
+    """Raised when a session has too many queued turns or the previous turn never finished"""
+
+
+class StaleTurnError(Exception):
+    """Raised when a turn tries to persist after a later turn has taken the session lease"""
+
+
+class SessionQueue:
+    """
+    Per-session ordered execution.
+    
+    Inside a process, turns for the same session wait on a keyed asyncio.Lock (FIFO).
+    Across nodes, the lock holder also takes a Redis lease (`session_lock:{id}`) and
+    gets a fencing token from `session_fence:{id}`; MemoryStore.add_turn rejects writes
+    whose token is no longer current. Different sessions never wait on each other.
+    
+    Queue depth (running + waiting turns) is tracked in `session_queue_depth:{id}`
+    so any node can reject excess load before doing any work. Without Redis only
+    the in-process queue is used.
+    """
+    
+    def __init__(self, async_redis_client=None):
+        self.redis = async_redis_client
+        self.lock_key = "session_lock"
+        self.fence_key = "session_fence"
+        self.depth_key = "session_queue_depth"
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._depths: Dict[str, int] = {}
+        self._local_fence = 0
+        if self.redis:
+            self._acquire_script = self.redis.register_script(ACQUIRE_SCRIPT)
+            self._renew_script = self.redis.register_script(RENEW_SCRIPT)
+            self._release_script = self.redis.register_script(RELEASE_SCRIPT)
+    
+    async def depth(self, session_id: str) -> int:
+        """Number of turns running or waiting for a session"""
+        if self.redis:
+            depth = await self.redis.get(entity_key(self.depth_key, session_id))
+            return max(int(depth or 0), 0)
+        return self._depths.get(session_id, 0)
+    
+    async def is_full(self, session_id: str) -> bool:
+        """Whether a new turn for the session would be rejected"""
+        return await self.depth(session_id) >= SESSION_QUEUE_MAX_DEPTH
+    
+    @asynccontextmanager
+    async def turn(self, session_id: str) -> AsyncIterator[int]:
+        """
+        Run a block as the session's only active turn.
+        
+        Yields:
+            Fencing token for this turn
+        
+        Raises:
+            SessionBusyError: Queue is full or the lease could not be taken in time
+        """
+        depth = await self._enter(session_id)
+        try:
+            if depth > SESSION_QUEUE_MAX_DEPTH:
+                raise SessionBusyError(
+                    f"Session {session_id} already has {depth - 1} turns queued (max {SESSION_QUEUE_MAX_DEPTH})"
+                )
+            
+            lock = self._locks.setdefault(session_id, asyncio.Lock())
+            async with lock:
+                owner = str(uuid.uuid4())
+                token = await self._acquire_lease(session_id, owner)
+                renew = asyncio.create_task(self._renew_lease(session_id, owner)) if self.redis else None
+                try:
+                    yield token
+                finally:
+                    if renew:
+                        renew.cancel()
+                        await self._release_script(keys=[entity_key(self.lock_key, session_id)], args=[owner])
+        finally:
+            await self._leave(session_id)
+    
+    async def _enter(self, session_id: str) -> int:
+        depth = None
+        if self.redis:
+            key = entity_key(self.depth_key, session_id)
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.incr(key)
+            # Bound drift from crashed nodes that never decremented
+            pipe.expire(key, int(SESSION_LOCK_WAIT + SESSION_LOCK_TTL_MS / 1000))
+            depth, _ = await pipe.execute()
+        # Counted only once Redis succeeded: a failed enter never reaches _leave
+        self._depths[session_id] = self._depths.get(session_id, 0) + 1
+        return self._depths[session_id] if depth is None else depth
+    
+    async def _leave(self, session_id: str):
+        self._depths[session_id] -= 1
+        if self._depths[session_id] <= 0:
+            # Nobody in this process is waiting on or holding the lock any more
+            del self._depths[session_id]
+            self._locks.pop(session_id, None)
+        if self.redis:
+            await self.redis.decr(entity_key(self.depth_key, session_id))
+    
+    async def _acquire_lease(self, session_id: str, owner: str) -> int:
+        if not self.redis:
+            self._local_fence += 1
+            return self._local_fence
+        
+        keys = [entity_key(self.lock_key, session_id), entity_key(self.fence_key, session_id)]
+        deadline = time.monotonic() + SESSION_LOCK_WAIT
+        delay = 0.05
+        while True:
+            token = await self._acquire_script(keys=keys, args=[owner, SESSION_LOCK_TTL_MS])
+            if token:
+                return int(token)
+            if time.monotonic() >= deadline:
+                raise SessionBusyError(f"Timed out waiting for the previous turn of session {session_id}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+    
+    async def _renew_lease(self, session_id: str, owner: str):
+        key = entity_key(self.lock_key, session_id)
+        while True:
+            await asyncio.sleep(SESSION_LOCK_TTL_MS / 3000)
+            try:
+                if not await self._renew_script(keys=[key], args=[owner, SESSION_LOCK_TTL_MS]):
+                    print(f"[SESSION] Lost lease for session {session_id}")
+                    return
+            except Exception as e:
+                print(f"[SESSION] Failed to renew lease for session {session_id}: {e}")
@@ -0,0 +1,425 @@
+"""
+Embedded MemoryStore on SQLite (MEMORY_BACKEND=sqlite).
+
+For single-node installs: history, keyword search and tool-call tracing with no
+network hop and no Redis. The database runs in WAL mode, so readers never block
+the writer and the API and worker processes on one host can share the file.
+
+Messages are indexed on (session_id, seq) and timestamp. Keyword search uses
+an FTS5 table kept in sync by triggers and ranked with FTS5's built-in bm25().
+Every write call is a single transaction, e.g. both messages of a turn plus
+the session row and the archive trim.
+
+Rows expire like the Redis keys they stand in for: every process using the file
+runs a background thread that deletes sessions idle for MEMORY_EXPIRE_DAYS (with
+their messages and summary), older tool calls and day-old request markers.
+
+Live tool events go through an in-process broker, so streaming subscribers see
+events from the same process only. Everything else is visible to every process
+using the file.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from storage.base import MemoryStore, LocalBroker
+from storage.codec import truncate_output
+from storage.text_index import parse_query
+from utils.executor import run_blocking
+
+# Database file used when MEMORY_BACKEND=sqlite
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/memory.db")
+# How long a writer waits for another process's write lock (ms)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+# Seconds between deletes of expired rows (0 disables)
+SQLITE_PURGE_INTERVAL = float(os.getenv("SQLITE_PURGE_INTERVAL", 3600))
+# Rows deleted per transaction, so a purge never holds the write lock for long
+SQLITE_PURGE_BATCH = 1000
+# Finished-request markers are kept for a day, like the Redis keys
+REQUEST_STATUS_SECONDS = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    ts_ms INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_session_seq ON messages (session_id, seq);
+CREATE INDEX IF NOT EXISTS messages_ts_ms ON messages (ts_ms);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    content, content='messages', content_rowid='seq'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.seq, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.seq, old.content);
+END;
+
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_activity INTEGER NOT NULL,
+    last_message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_activity ON sessions (last_activity);
+
+CREATE TABLE IF NOT EXISTS session_summaries (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    through_ms INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tool_calls (
+    request_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    tool_name TEXT NOT NULL,
+    input TEXT NOT NULL,
+    output TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    cache TEXT,
+    PRIMARY KEY (request_id, idx)
+);
+CREATE INDEX IF NOT EXISTS tool_calls_timestamp ON tool_calls (timestamp);
+
+CREATE TABLE IF NOT EXISTS request_status (
+    request_id TEXT PRIMARY KEY,
+    done_at INTEGER NOT NULL
+);
+"""
+
+MESSAGE_COLUMNS = "id, session_id, role, content, metadata, timestamp"
+
+
+class SQLiteMemoryStore(MemoryStore):
+    """MemoryStore on an embedded SQLite database (see module docstring)"""
+    
+    def __init__(self, path: str = SQLITE_PATH):
+        super().__init__()
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One connection per thread; tools call in from the executor's threads
+        self._local = threading.local()
+        self._broker = LocalBroker()
+        self._connection().executescript(SCHEMA)
+        self._migrate()
+        if SQLITE_PURGE_INTERVAL > 0:
+            threading.Thread(target=self._purge_loop, name="sqlite-purge", daemon=True).start()
+    
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly in _transaction
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints; a power loss can drop the last few commits, never corrupt
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+    
+    def _migrate(self):
+        """Add columns introduced after a database file was created"""
+        conn = self._connection()
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(tool_calls)")}
+        if "cache" not in columns:
+            try:
+                conn.execute("ALTER TABLE tool_calls ADD COLUMN cache TEXT")
+            except sqlite3.OperationalError:
+                # Another process sharing the file added it first
+                pass
+    
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction; IMMEDIATE takes the write lock up front instead of failing on upgrade"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    
+    def purge_expired(self) -> Dict[str, int]:
+        """
+        Delete rows past their expiry, in batches.
+        
+        Returns:
+            Rows deleted per table
+        """
+        now = time.time()
+        session_cutoff = int((now - self.expire_seconds) * 1000)
+        idle_sessions = "SELECT session_id FROM sessions WHERE last_activity < ?"
+        # Messages and summaries go before the session rows that select them
+        statements = [
+            ("messages", "DELETE FROM messages WHERE seq IN (SELECT seq FROM messages "
+                         f"WHERE session_id IN ({idle_sessions}) LIMIT ?)", session_cutoff),
+            ("session_summaries", "DELETE FROM session_summaries WHERE session_id IN "
+                                  f"({idle_sessions} LIMIT ?)", session_cutoff),
+            ("sessions", f"DELETE FROM sessions WHERE session_id IN ({idle_sessions} LIMIT ?)", session_cutoff),
+            ("tool_calls", "DELETE FROM tool_calls WHERE rowid IN (SELECT rowid FROM tool_calls "
+                           "WHERE timestamp < ? LIMIT ?)", datetime.fromtimestamp(now - self.expire_seconds).isoformat()),
+            ("request_status", "DELETE FROM request_status WHERE request_id IN (SELECT request_id "
+                               "FROM request_status WHERE done_at < ? LIMIT ?)", int(now - REQUEST_STATUS_SECONDS)),
+        ]
+        deleted = {}
+        for table, sql, cutoff in statements:
+            deleted[table] = 0
+            while True:
+                with self._transaction() as conn:
+                    count = conn.execute(sql, (cutoff, SQLITE_PURGE_BATCH)).rowcount
+                deleted[table] += count
+                if count < SQLITE_PURGE_BATCH:
+                    break
+        return deleted
+    
+    def _purge_loop(self):
+        while True:
+            try:
+                deleted = self.purge_expired()
+                if any(deleted.values()):
+                    print(f"[DEBUG] Deleted expired SQLite rows: {deleted}")
+            except Exception as e:
+                print(f"[DEBUG] SQLite purge failed: {e}")
+            time.sleep(SQLITE_PURGE_INTERVAL)
+    
+    def _row_to_message(self, row: sqlite3.Row) -> Dict:
+        return {
+            "id": row["id"],
+            "role": row["role"],
+            "content": row["content"],
+            "timestamp": row["timestamp"],
+            "metadata": json.loads(row["metadata"]),
+        }
+    
+    def _append(self, session_id: str, messages: List[Dict], fence_token: Optional[int] = None):
+        # Turn ordering is enforced by SessionQueue's in-process lock; fencing tokens are a Redis feature
+        rows = [
+            (m["id"], session_id, m["role"], m["content"], json.dumps(m["metadata"]), m["timestamp"], self._timestamp_ms(m))
+            for m in messages
+        ]
+        keep = self.max_messages + self.archive_max_messages
+        with self._transaction() as conn:
+            conn.executemany(
+                f"INSERT INTO messages ({MESSAGE_COLUMNS}, ts_ms) VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            conn.execute(
+                "INSERT INTO sessions (session_id, last_activity, last_message) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET "
+                "last_activity = excluded.last_activity, last_message = excluded.last_message",
+                (session_id, int(time.time() * 1000), messages[-1]["content"][:self.preview_chars]),
+            )
+            # Drop messages beyond the hot + archive caps (the FTS trigger unindexes them)
+            conn.execute(
+                "DELETE FROM messages WHERE session_id = ? AND seq <= ("
+                "SELECT seq FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                (session_id, session_id, keep),
+            )
+    
+    def get_messages(self, session_id: str, limit: int = 50) -> List[Dict]:
+        """Get last N messages from conversation history"""
+        rows = self._connection().execute(
+            f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, limit),
+        ).fetchall()
+        return [self._row_to_message(row) for row in reversed(rows)]
+    
+    def get_history_version(self, session_id: str) -> int:
+        """Version of a session's history: its newest row's seq (global, so unique per change)"""
+        return self._connection().execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()[0]
+    
+    def get_messages_page(self, session_id: str, limit: int = 50, before: Optional[str] = None,
+                          after: Optional[str] = None) -> Optional[Dict]:
+        """One page of history by message ID cursor (see MemoryStore.get_messages_page)"""
+        conn = self._connection()
+        # Read the version and the page from one snapshot
+        conn.execute("BEGIN")
+        try:
+            version = self.get_history_version(session_id)
+            cursor = before or after
+            sql = f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id = ?"
+            params: list = [session_id]
+            if cursor:
+                row = conn.execute(
+                    "SELECT seq FROM messages WHERE session_id = ? AND id = ?", (session_id, cursor)
+                ).fetchone()
+                if row is None:
+                    return None
+                sql += " AND seq < ?" if before else " AND seq > ?"
+                params.append(row["seq"])
+            newest_first = not cursor or bool(before)
+            sql += f" ORDER BY seq {'DESC' if newest_first else 'ASC'} LIMIT ?"
+            # One extra row tells whether there is more in the paging direction
+            params.append(limit + 1)
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if newest_first:
+            rows.reverse()
+        return {
+            "messages": [self._row_to_message(row) for row in rows],
+            "version": version,
+            "has_older": more if newest_first else True,
+            "has_newer": bool(before) or (more and not newest_first),
+        }
+    
+    def get_summary(self, session_id: str) -> Optional[Dict]:
+        """Rolling summary of a session's older messages (see MemoryStore.get_summary)"""
+        row = self._connection().execute(
+            "SELECT summary FROM session_summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return json.loads(row["summary"]) if row else None
+    
+    def set_summary(self, session_id: str, summary: Dict) -> bool:
+        """Store a rolling summary unless a later one is stored (see MemoryStore.set_summary)"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO session_summaries (session_id, summary, through_ms) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET summary = excluded.summary, through_ms = excluded.through_ms "
+                "WHERE excluded.through_ms >= session_summaries.through_ms",
+                (session_id, json.dumps(summary), summary["through_ms"]),
+            )
+        return cursor.rowcount > 0
+    
+    def search_messages(self, query: str, session_id: Optional[str] = None, limit: int = 10,
+                        since_ms: Optional[int] = None, until_ms: Optional[int] = None,
+                        match_all: Optional[bool] = None) -> List[Dict]:
+        """Keyword search over messages, ranked by FTS5 bm25 (see MemoryStore.search_messages)"""
+        terms, parsed_match_all = parse_query(query)
+        if not terms:
+            return []
+        match_all = parsed_match_all if match_all is None else match_all
+        
+        operator = " AND " if match_all else " OR "
+        match = operator.join('"' + term.replace('"', '""') + '"' for term in terms)
+        sql = (
+            f"SELECT m.{MESSAGE_COLUMNS.replace(', ', ', m.')}, bm25(messages_fts) AS rank "
+            "FROM messages_fts JOIN messages m ON m.seq = messages_fts.rowid "
+            "WHERE messages_fts MATCH ?"
+        )
+        params: list = [match]
+        if session_id is not None:
+            sql += " AND m.session_id = ?"
+            params.append(session_id)
+        if since_ms is not None:
+            sql += " AND m.ts_ms >= ?"
+            params.append(since_ms)
+        if until_ms is not None:
+            sql += " AND m.ts_ms <= ?"
+            params.append(until_ms)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        
+        results = []
+        for row in self._connection().execute(sql, params).fetchall():
+            message = self._row_to_message(row)
+            message["session_id"] = row["session_id"]
+            # bm25() is lower-is-better; flip it so higher scores are better, as in the other backends
+            message["score"] = round(-row["rank"], 6)
+            results.append(message)
+        return results
+    
+    def list_sessions(self, cursor: Optional[str] = None, limit: int = 50) -> tuple[List[Dict], Optional[str]]:
+        """Page through sessions by last activity, newest first"""
+        oldest = int((time.time() - self.expire_seconds) * 1000)
+        newest, after_id = self._parse_session_cursor(cursor) or (2 ** 62, "")
+        rows = self._connection().execute(
+            "SELECT session_id, last_message, last_activity FROM sessions "
+            "WHERE (last_activity < ? OR (last_activity = ? AND session_id < ?)) AND last_activity >= ? "
+            "ORDER BY last_activity DESC, session_id DESC LIMIT ?",
+            (newest, newest, after_id, oldest, limit),
+        ).fetchall()
+        sessions = [dict(row) for row in rows]
+        return sessions, self._next_session_cursor(sessions, limit)
+    
+    def add_tool_call(self, request_id: str, tool_name: str, tool_input: str, tool_output: str,
+                      cache: Optional[str] = None) -> Dict:
+        """Store a tool call for a specific request and return its preview with its 1-based index"""
+        timestamp = datetime.now().isoformat()
+        with self._transaction() as conn:
+            index = conn.execute(
+                "SELECT COALESCE(MAX(idx), 0) + 1 FROM tool_calls WHERE request_id = ?", (request_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO tool_calls (request_id, idx, tool_name, input, output, timestamp, cache)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (request_id, index, tool_name, tool_input, tool_output, timestamp, cache),
+            )
+        tool_call = {
+            "tool_name": tool_name,
+            "input": tool_input,
+            "output": tool_output,
+            "timestamp": timestamp,
+            "index": index,
+        }
+        if cache:
+            tool_call["cache"] = cache
+        return truncate_output(tool_call)
+    
+    def _tool_call_rows(self, request_id: str, index: Optional[int] = None) -> List[Dict]:
+        sql = "SELECT idx AS \"index\", tool_name, input, output, timestamp, cache FROM tool_calls WHERE request_id = ?"
+        params: list = [request_id]
+        if index is not None:
+            sql += " AND idx = ?"
+            params.append(index)
+        rows = self._connection().execute(sql + " ORDER BY idx", params).fetchall()
+        # Only calls served from the tool result cache carry the field
+        return [{k: v for k, v in dict(row).items() if k != "cache" or v} for row in rows]
+    
+    def get_tool_calls(self, request_id: str, full: bool = False) -> List[Dict]:
+        """Get all tool calls for a specific request"""
+        tool_calls = self._tool_call_rows(request_id)
+        return tool_calls if full else [truncate_output(call) for call in tool_calls]
+    
+    def get_tool_call(self, request_id: str, index: int) -> Optional[Dict]:
+        """Get one tool call (1-based index) with its full output"""
+        rows = self._tool_call_rows(request_id, index)
+        return rows[0] if rows else None
+    
+    def publish_tool_event(self, request_id: str, event: Dict):
+        """Publish a tool event to subscribers in this process"""
+        self._broker.publish(request_id, event)
+    
+    async def amark_request_done(self, request_id: str):
+        """Record that a request has finished and notify live subscribers"""
+        def mark():
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO request_status (request_id, done_at) VALUES (?, ?)",
+                    (request_id, int(time.time())),
+                )
+        
+        await run_blocking(mark)
+        self._broker.publish(request_id, {"type": "done"})
+    
+    async def ais_request_done(self, request_id: str) -> bool:
+        """Check whether a request has already finished"""
+        def is_done():
+            return self._connection().execute(
+                "SELECT 1 FROM request_status WHERE request_id = ?", (request_id,)
+            ).fetchone() is not None
+        
+        return await run_blocking(is_done)
+    
+    async def asubscribe_tool_events(self, request_id: str):
+        """Subscribe to the request's tool events (this process only)"""
+        return await self._broker.subscribe(request_id)
@@ -0,0 +1,96 @@
+"""
+Tokenization and BM25 scoring shared by the memory search index.
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Longest token worth indexing; longer ones are usually hashes or base64 blobs
+MAX_TOKEN_LENGTH = 40
+# Distinct terms indexed per message, so a pasted log cannot blow up the index
+MAX_TERMS_PER_MESSAGE = 500
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its me my no not
+of on or our she so than that the their them then there these they this to was we were what
+when where which who will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, single characters or overlong tokens"""
+    return [
+        token for token in _TOKEN_RE.findall(str(text).lower())
+        if 1 < len(token) <= MAX_TOKEN_LENGTH and token not in STOPWORDS
+    ]
+
+
+def term_frequencies(text: str) -> Tuple[Dict[str, int], int]:
+    """
+    Term counts for a document, limited to its MAX_TERMS_PER_MESSAGE most frequent terms.
+    
+    Returns:
+        Tuple of (term -> count, document length in tokens)
+    """
+    tokens = tokenize(text)
+    counts = Counter(tokens)
+    if len(counts) > MAX_TERMS_PER_MESSAGE:
+        counts = Counter(dict(counts.most_common(MAX_TERMS_PER_MESSAGE)))
+    return dict(counts), len(tokens)
+
+
+def parse_query(query: str) -> Tuple[List[str], bool]:
+    """
+    Parse a keyword query into terms and a match mode.
+    
+    Terms are ANDed by default; an explicit `OR` between terms switches to any-term
+    matching (e.g. "redis OR postgres").
+    
+    Returns:
+        Tuple of (unique terms, match_all)
+    """
+    match_all = not re.search(r"\sOR\s", f" {query} ")
+    terms = list(dict.fromkeys(tokenize(re.sub(r"\bOR\b", " ", query))))
+    return terms, match_all
+
+
+def bm25_scores(
+    postings: Dict[str, Dict[str, float]],
+    doc_lengths: Dict[str, float],
+    total_docs: int,
+    avg_length: float,
+    candidates: Iterable[str],
+) -> Dict[str, float]:
+    """
+    BM25 score of each candidate document.
+    
+    Args:
+        postings: term -> {doc_id: term frequency}
+        doc_lengths: doc_id -> length in tokens
+        total_docs: Number of documents in the collection
+        avg_length: Average document length
+        candidates: Documents to score
+    """
+    avg_length = avg_length or 1.0
+    idf = {
+        term: math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+        for term, docs in postings.items()
+    }
+    
+    scores = {}
+    for doc_id in candidates:
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths.get(doc_id, avg_length) / avg_length)
+        score = 0.0
+        for term, docs in postings.items():
+            tf = docs.get(doc_id)
+            if tf:
+                score += idf[term] * tf * (BM25_K1 + 1) / (tf + length_norm)
+        scores[doc_id] = score
+    return scores
@@ -0,0 +1,274 @@
+"""
+Cache of tool results, so repeated identical tool calls skip the work.
+
+A tool opts in by passing a policy to its decorator, e.g.
+`@log_tool_call(cache=FilePolicy("file_path"))`. The policy decides when a stored
+result is still valid:
+
+    TTLPolicy         valid for a fixed time (web search)
+    FilePolicy        valid while the file's mtime, size and inode are unchanged
+                      (read_file); kept in this process only, since other hosts
+                      see other filesystems
+    RevalidatePolicy  valid for `max_age`, then revalidated with a conditional
+                      request (ETag / Last-Modified) instead of a full fetch (scraping)
+
+Keys are the tool name plus its bound arguments. Entries live in a per-process
+LRU bounded by count and size, with an optional Redis tier (TOOL_CACHE_REDIS)
+shared by every process. Calls served from the cache are stored in the request's
+tool-call records with "cache": "hit" (or "revalidated").
+"""
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Cache results of tools that declare a cache policy
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+# Also keep shareable entries in Redis so every process (and node) can reuse them
+TOOL_CACHE_REDIS = os.getenv("TOOL_CACHE_REDIS", "true").lower() == "true"
+# Max entries and approximate bytes of results per process
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", 2000))
+TOOL_CACHE_MAX_BYTES = int(os.getenv("TOOL_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Results larger than this are not cached
+TOOL_CACHE_MAX_ENTRY_BYTES = int(os.getenv("TOOL_CACHE_MAX_ENTRY_BYTES", 1024 * 1024))
+
+# Validators (e.g. ETag) reported by the running tool for the entry being filled
+_validators_var: ContextVar[Optional[Dict]] = ContextVar("tool_cache_validators", default=None)
+
+
+def record_validators(**validators):
+    """Called by a tool to store HTTP validators (etag, last_modified) with its result"""
+    holder = _validators_var.get()
+    if holder is not None:
+        holder.update({name: value for name, value in validators.items() if value})
+
+
+def _is_error(result: Any) -> bool:
+    return isinstance(result, str) and result.startswith(("Error", "ERROR", "Failed"))
+
+
+class TTLPolicy:
+    """Results stay valid for `ttl` seconds"""
+    
+    shared = True
+    
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+    
+    def arguments(self, arguments: Dict) -> Dict:
+        """Arguments as they go into the key"""
+        return arguments
+    
+    def validator(self, arguments: Dict) -> Optional[Any]:
+        """State the result depends on, taken before the call; None when the call cannot be cached"""
+        return True
+    
+    def is_fresh(self, entry: Dict, validator: Any, now: float) -> bool:
+        return now - entry["stored_at"] < self.ttl
+    
+    def revalidate(self, entry: Dict, arguments: Dict) -> bool:
+        """Whether a stale entry is confirmed unchanged (without refetching the result)"""
+        return False
+
+
+class FilePolicy(TTLPolicy):
+    """Results stay valid while the file at argument `path_arg` is unchanged (and at most `ttl`)"""
+    
+    shared = False
+    
+    def __init__(self, path_arg: str, ttl: float = 3600):
+        super().__init__(ttl)
+        self.path_arg = path_arg
+    
+    def arguments(self, arguments: Dict) -> Dict:
+        return {**arguments, self.path_arg: os.path.abspath(str(arguments[self.path_arg]))}
+    
+    def validator(self, arguments: Dict) -> Optional[Any]:
+        try:
+            stat = os.stat(arguments[self.path_arg])
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+    
+    def is_fresh(self, entry: Dict, validator: Any, now: float) -> bool:
+        return entry["validator"] == validator and super().is_fresh(entry, validator, now)
+
+
+class RevalidatePolicy(TTLPolicy):
+    """
+    Results are fresh for `max_age` seconds, then checked with `revalidate(arguments,
+    validators)` (True when unchanged, e.g. HTTP 304) until `ttl` expires.
+    """
+    
+    def __init__(self, revalidate: Callable[[Dict, Dict], bool], max_age: float, ttl: float = 86400):
+        super().__init__(ttl)
+        self.max_age = max_age
+        self._revalidate = revalidate
+    
+    def is_fresh(self, entry: Dict, validator: Any, now: float) -> bool:
+        return now - entry["stored_at"] < self.max_age
+    
+    def revalidate(self, entry: Dict, arguments: Dict) -> bool:
+        if not entry.get("validators") or time.time() - entry["created_at"] >= self.ttl:
+            return False
+        return self._revalidate(arguments, entry["validators"])
+
+
+class ToolCache:
+    """
+    Per-process LRU of tool results with an optional Redis tier.
+    
+    Thread-safe: tools run in executor threads.
+    """
+    
+    def __init__(self, redis_client=None, max_entries: int = TOOL_CACHE_MAX_ENTRIES,
+                 max_bytes: int = TOOL_CACHE_MAX_BYTES):
+        self.redis = redis_client
+        self.cache_key = "tool_cache"
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Dict, int]]" = OrderedDict()
+        self._bytes = 0
+        self._signatures: Dict[Callable, inspect.Signature] = {}
+        self._stats = {"hits": 0, "revalidated": 0, "misses": 0, "stores": 0, "redis_hits": 0,
+                       "evictions": 0, "errors": 0}
+    
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+    
+    def _key(self, tool_name: str, arguments: Dict) -> str:
+        payload = json.dumps([tool_name, arguments], sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _arguments(self, func: Callable, args: tuple, kwargs: Dict) -> Dict:
+        signature = self._signatures.get(func)
+        if signature is None:
+            signature = self._signatures[func] = inspect.signature(func)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return dict(bound.arguments)
+    
+    def _get(self, key: str, shared: bool) -> Optional[Dict]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+                return item[0]
+        if not shared or self.redis is None:
+            return None
+        try:
+            raw = self.redis.get(f"{self.cache_key}:{key}")
+        except Exception as e:
+            print(f"[DEBUG] Tool cache Redis read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        self._count("redis_hits")
+        self._put_local(key, entry, len(raw))
+        return entry
+    
+    def _put_local(self, key: str, entry: Dict, size: int):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (entry, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+    
+    def _put(self, key: str, entry: Dict, policy: TTLPolicy):
+        raw = json.dumps(entry, default=str, ensure_ascii=False)
+        if len(raw) > TOOL_CACHE_MAX_ENTRY_BYTES:
+            return
+        self._put_local(key, entry, len(raw))
+        self._count("stores")
+        if policy.shared and self.redis is not None:
+            ttl = max(1, int(policy.ttl - (time.time() - entry["created_at"])))
+            try:
+                self.redis.set(f"{self.cache_key}:{key}", raw, ex=ttl)
+            except Exception as e:
+                print(f"[DEBUG] Tool cache Redis write failed: {e}")
+    
+    def call(self, tool_name: str, policy: TTLPolicy, func: Callable, args: tuple, kwargs: Dict) -> Tuple[Any, Optional[str]]:
+        """
+        Run a tool through the cache.
+        
+        Args:
+            tool_name: Tool name (part of the key)
+            policy: The tool's cache policy
+            func: Undecorated tool function
+            args: Positional arguments of the call
+            kwargs: Keyword arguments of the call
+        
+        Returns:
+            (result, "hit" / "revalidated" when served from the cache, else None)
+        """
+        try:
+            arguments = policy.arguments(self._arguments(func, args, kwargs))
+            validator = policy.validator(arguments)
+        except Exception:
+            # Arguments the tool itself will reject; let it report the error
+            return func(*args, **kwargs), None
+        if validator is None:
+            return func(*args, **kwargs), None
+        
+        key = self._key(tool_name, arguments)
+        now = time.time()
+        entry = self._get(key, policy.shared)
+        if entry is not None:
+            if policy.is_fresh(entry, validator, now):
+                self._count("hits")
+                return entry["value"], "hit"
+            try:
+                unchanged = policy.revalidate(entry, arguments)
+            except Exception as e:
+                print(f"[DEBUG] Tool cache revalidation of {tool_name} failed: {e}")
+                self._count("errors")
+                unchanged = False
+            if unchanged:
+                self._count("revalidated")
+                self._put(key, {**entry, "stored_at": now}, policy)
+                return entry["value"], "revalidated"
+        
+        self._count("misses")
+        validators: Dict = {}
+        token = _validators_var.set(validators)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _validators_var.reset(token)
+        if not _is_error(result):
+            self._put(key, {
+                "value": result,
+                "validator": validator,
+                "validators": validators,
+                "stored_at": now,
+                "created_at": now,
+            }, policy)
+        return result, None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size of this process's cache"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["revalidated"] + self._stats["misses"]
+            served = self._stats["hits"] + self._stats["revalidated"]
+            return {
+                **self._stats,
+                "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "approx_bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "redis": self.redis is not None,
+            }
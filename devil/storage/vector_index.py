@@ -0,0 +1,387 @@
+"""
+Append-only top-k cosine index persisted to disk.
+
+Layout of an index directory (row i of every file describes the same entry):
+    index.json    header: dim, embedder name, code bits
+    vectors.f16   L2-normalized vectors, float16 (dim * 2 bytes per row)
+    codes.u8      SimHash sign bits of a fixed random projection (code_bits / 8 bytes per row)
+    sessions.u64  64-bit hash of the entry's session, for session-scoped queries
+    kinds.u8      entry kind (message / tool_call)
+    offsets.u64   byte offset of the entry's metadata line in meta.jsonl
+    meta.jsonl    one JSON object per entry
+
+Appends take an exclusive flock so the API and worker processes can share an
+index; readers memory-map the files and pick up new rows on the next query.
+The row count is the minimum across files, so a torn append is invisible and
+gets truncated by the next writer.
+
+Entries are deleted by setting their kind to 0 in place (a tombstone); every
+append deletes the oldest entries of a session beyond max_session_rows.
+compact() rewrites the files without tombstoned rows and without the leading
+rows older than a cutoff (rows are appended in time order), replacing each file
+while holding the exclusive lock. Readers map files under a shared lock, so
+they never see a mix of old and new files, and remap when the inode changes.
+
+Queries over up to VECTOR_EXACT_MAX_ROWS candidates are scored exactly. Larger
+scans first rank rows by Hamming distance between SimHash codes (32 bytes per
+row instead of 512) and only rerank the closest VECTOR_RERANK_FACTOR * k rows
+with the stored vectors, which keeps queries over millions of rows fast on a
+single core.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Candidate count up to which queries skip the SimHash prefilter
+VECTOR_EXACT_MAX_ROWS = int(os.getenv("VECTOR_EXACT_MAX_ROWS", 100000))
+# Rows reranked exactly per requested result when the prefilter is used
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", 50))
+# SimHash code length in bits (multiple of 64)
+VECTOR_CODE_BITS = int(os.getenv("VECTOR_CODE_BITS", 256))
+# Rows scored per vectorized step; bounds temporary memory during scans
+SCAN_CHUNK_ROWS = 65536
+
+KINDS = {"message": 1, "tool_call": 2}
+# Kind of deleted rows
+TOMBSTONE = 0
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def session_hash(session_id: str) -> int:
+    """Stable 64-bit hash of a session ID"""
+    return int.from_bytes(hashlib.blake2b(session_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _top_k(scores: np.ndarray, k: int, largest: bool = True) -> np.ndarray:
+    """Positions of the k best scores, best first"""
+    keyed = -scores if largest else scores
+    if len(keyed) > k:
+        positions = np.argpartition(keyed, k)[:k]
+    else:
+        positions = np.arange(len(keyed))
+    return positions[np.argsort(keyed[positions], kind="stable")]
+
+
+class VectorIndex:
+    """Disk-persisted cosine index (see module docstring)"""
+    
+    def __init__(self, path: str, dim: int, embedder_name: str, code_bits: int = VECTOR_CODE_BITS,
+                 max_session_rows: int = 0):
+        if code_bits % 64:
+            raise ValueError("VECTOR_CODE_BITS must be a multiple of 64")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.code_bits = code_bits
+        self.code_bytes = code_bits // 8
+        # Live entries kept per session (0 keeps all)
+        self.max_session_rows = max_session_rows
+        self._check_header(embedder_name)
+        
+        # Fixed seed: codes stay comparable across processes and restarts
+        self._projection = np.random.default_rng(0).standard_normal((dim, code_bits)).astype(np.float32)
+        self._row_sizes = {
+            "vectors.f16": dim * 2,
+            "codes.u8": self.code_bytes,
+            "sessions.u64": 8,
+            "kinds.u8": 1,
+            "offsets.u64": 8,
+        }
+        self._refresh_lock = threading.Lock()
+        self._rows = 0
+        self._inode = None
+        self._maps: Dict[str, np.ndarray] = {}
+    
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+    
+    @contextmanager
+    def _locked(self, mode: int) -> Iterator[None]:
+        """Hold the index flock (LOCK_EX to change files, LOCK_SH to map them)"""
+        with open(self._file("lock"), "a") as lock:
+            fcntl.flock(lock, mode)
+            yield
+    
+    def _check_header(self, embedder_name: str):
+        header = {"dim": self.dim, "embedder": embedder_name, "code_bits": self.code_bits}
+        header_path = self._file("index.json")
+        if not os.path.exists(header_path):
+            with open(header_path, "w") as f:
+                json.dump(header, f)
+            return
+        
+        with open(header_path) as f:
+            existing = json.load(f)
+        if existing != header:
+            raise ValueError(
+                f"Vector index at {self.path} was built with {existing}, not {header}; "
+                f"remove it or point VECTOR_INDEX_DIR elsewhere"
+            )
+    
+    def _rows_on_disk(self) -> int:
+        """Number of complete rows (minimum over all fixed-width files)"""
+        rows = []
+        for name, size in self._row_sizes.items():
+            try:
+                rows.append(os.path.getsize(self._file(name)) // size)
+            except FileNotFoundError:
+                return 0
+        return min(rows)
+    
+    def __len__(self) -> int:
+        return self._rows_on_disk()
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """SimHash codes of normalized vectors, shape (n, code_bytes)"""
+        return np.packbits(vectors @ self._projection > 0, axis=1)
+    
+    def add(self, vectors: np.ndarray, metadata: List[Dict]):
+        """
+        Append entries.
+        
+        Args:
+            vectors: float32 array (n, dim) with L2-normalized rows
+            metadata: One dict per row; needs "session_id" and "kind"
+        """
+        if not len(metadata):
+            return
+        codes = self.encode(vectors)
+        sessions = np.array([session_hash(m["session_id"]) for m in metadata], dtype=np.uint64)
+        kinds = np.array([KINDS[m["kind"]] for m in metadata], dtype=np.uint8)
+        lines = [(json.dumps(m, default=str) + "\n").encode("utf-8") for m in metadata]
+        
+        with self._locked(fcntl.LOCK_EX):
+            rows = self._repair()
+            
+            meta_path = self._file("meta.jsonl")
+            offset = os.path.getsize(meta_path) if os.path.exists(meta_path) else 0
+            offsets = np.empty(len(lines), dtype=np.uint64)
+            for i, line in enumerate(lines):
+                offsets[i] = offset
+                offset += len(line)
+            
+            # vectors.f16 goes last: until it is written the new rows do not count
+            with open(meta_path, "ab") as f:
+                f.write(b"".join(lines))
+            for name, data in (
+                ("offsets.u64", offsets),
+                ("sessions.u64", sessions),
+                ("kinds.u8", kinds),
+                ("codes.u8", codes),
+                ("vectors.f16", vectors.astype(np.float16)),
+            ):
+                with open(self._file(name), "ab") as f:
+                    f.write(np.ascontiguousarray(data).tobytes())
+            
+            if self.max_session_rows:
+                self._cap_sessions(set(sessions.tolist()), rows + len(metadata))
+    
+    def _cap_sessions(self, hashes: Iterable[int], rows: int):
+        """Tombstone the oldest live rows of sessions holding more than max_session_rows (lock held)"""
+        sessions = np.memmap(self._file("sessions.u64"), dtype=np.uint64, mode="r", shape=(rows,))
+        kinds = np.memmap(self._file("kinds.u8"), dtype=np.uint8, mode="r", shape=(rows,))
+        live = kinds != TOMBSTONE
+        excess = []
+        for session in hashes:
+            session_rows = np.flatnonzero(live & (sessions == np.uint64(session)))
+            if len(session_rows) > self.max_session_rows:
+                excess.append(session_rows[:len(session_rows) - self.max_session_rows])
+        del sessions, kinds
+        if excess:
+            self.delete_rows(np.concatenate(excess))
+    
+    def delete_rows(self, rows: np.ndarray):
+        """Tombstone rows in place; readers' maps see the change on their next query (lock held)"""
+        with open(self._file("kinds.u8"), "r+b") as f:
+            for row in np.sort(rows):
+                f.seek(int(row))
+                f.write(bytes([TOMBSTONE]))
+    
+    def compact(self, expire_before: Optional[str] = None) -> int:
+        """
+        Rewrite the index without tombstoned rows and without the leading rows older than a cutoff.
+        
+        Args:
+            expire_before: ISO timestamp; entries are dropped from the start of the index
+                until the first one written at or after it
+        
+        Returns:
+            Number of rows removed
+        """
+        with self._locked(fcntl.LOCK_EX):
+            rows = self._repair()
+            if not rows:
+                return 0
+            offsets = np.fromfile(self._file("offsets.u64"), dtype=np.uint64)
+            keep = np.fromfile(self._file("kinds.u8"), dtype=np.uint8) != TOMBSTONE
+            if expire_before:
+                with open(self._file("meta.jsonl"), "rb") as f:
+                    for row in range(rows):
+                        f.seek(int(offsets[row]))
+                        timestamp = json.loads(f.readline()).get("timestamp")
+                        if timestamp and timestamp >= expire_before:
+                            break
+                        keep[row] = False
+            removed = rows - int(keep.sum())
+            if not removed:
+                return 0
+            
+            kept_rows = np.flatnonzero(keep)
+            new_offsets = np.empty(len(kept_rows), dtype=np.uint64)
+            with open(self._file("meta.jsonl"), "rb") as src, open(self._file("meta.jsonl.tmp"), "wb") as dst:
+                for i, row in enumerate(kept_rows):
+                    new_offsets[i] = dst.tell()
+                    src.seek(int(offsets[row]))
+                    dst.write(src.readline())
+            for name, size in self._row_sizes.items():
+                data = np.memmap(self._file(name), dtype=np.uint8, mode="r", shape=(rows, size))
+                with open(self._file(name + ".tmp"), "wb") as dst:
+                    if name == "offsets.u64":
+                        dst.write(new_offsets.tobytes())
+                        continue
+                    for start in range(0, len(kept_rows), SCAN_CHUNK_ROWS):
+                        dst.write(np.ascontiguousarray(data[kept_rows[start:start + SCAN_CHUNK_ROWS]]).tobytes())
+                del data
+            for name in ("meta.jsonl", *self._row_sizes):
+                os.replace(self._file(name + ".tmp"), self._file(name))
+            return removed
+    
+    def _repair(self) -> int:
+        """Truncate files left longer than the committed row count by a crashed writer (lock held)"""
+        rows = self._rows_on_disk()
+        for name, size in self._row_sizes.items():
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > rows * size:
+                os.truncate(path, rows * size)
+        
+        meta_path = self._file("meta.jsonl")
+        if os.path.exists(meta_path):
+            if rows:
+                offsets = np.fromfile(self._file("offsets.u64"), dtype=np.uint64)
+                with open(meta_path, "rb") as f:
+                    f.seek(int(offsets[rows - 1]))
+                    end = int(offsets[rows - 1]) + len(f.readline())
+            else:
+                end = 0
+            if os.path.getsize(meta_path) > end:
+                os.truncate(meta_path, end)
+        return rows
+    
+    def _refresh(self) -> Tuple[int, Dict[str, np.ndarray]]:
+        """Re-map the files if other writers appended since the last query"""
+        with self._refresh_lock, self._locked(fcntl.LOCK_SH):
+            rows = self._rows_on_disk()
+            try:
+                inode = os.stat(self._file("vectors.f16")).st_ino
+            except FileNotFoundError:
+                inode = None
+            if rows != self._rows or inode != self._inode:
+                self._maps = {
+                    "vectors": np.memmap(self._file("vectors.f16"), dtype=np.float16, mode="r", shape=(rows, self.dim)),
+                    "codes": np.memmap(self._file("codes.u8"), dtype=np.uint8, mode="r", shape=(rows, self.code_bytes)),
+                    "sessions": np.memmap(self._file("sessions.u64"), dtype=np.uint64, mode="r", shape=(rows,)),
+                    "kinds": np.memmap(self._file("kinds.u8"), dtype=np.uint8, mode="r", shape=(rows,)),
+                    "offsets": np.memmap(self._file("offsets.u64"), dtype=np.uint64, mode="r", shape=(rows,)),
+                    # Mapped too, so metadata reads stay consistent with the rows after a compaction
+                    "meta": np.memmap(self._file("meta.jsonl"), dtype=np.uint8, mode="r"),
+                } if rows else {}
+                self._rows = rows
+                self._inode = inode
+            return self._rows, self._maps
+    
+    def search(self, vector: np.ndarray, k: int = 5, session_id: Optional[str] = None,
+               kind: Optional[str] = None) -> List[Tuple[float, Dict]]:
+        """
+        Top-k entries by cosine similarity.
+        
+        Args:
+            vector: Normalized query vector (dim,)
+            k: Number of results
+            session_id: Only entries of this session
+            kind: Only entries of this kind ("message" or "tool_call")
+        
+        Returns:
+            List of (score, metadata), best first
+        """
+        rows, maps = self._refresh()
+        if not rows:
+            return []
+        
+        candidates = None
+        if session_id is not None or kind is not None or self._has_tombstones(maps["kinds"]):
+            mask = maps["kinds"] != TOMBSTONE
+            if session_id is not None:
+                mask &= maps["sessions"] == np.uint64(session_hash(session_id))
+            if kind is not None:
+                mask &= maps["kinds"] == KINDS[kind]
+            candidates = np.flatnonzero(mask)
+        
+        total = rows if candidates is None else len(candidates)
+        if total > VECTOR_EXACT_MAX_ROWS:
+            candidates = self._hamming_candidates(maps["codes"], vector, candidates, k * VECTOR_RERANK_FACTOR)
+        
+        vector = vector.astype(np.float32)
+        best_rows, best_scores = [], []
+        for row_ids in self._chunks(rows, candidates):
+            block = maps["vectors"][row_ids]
+            scores = block.astype(np.float32) @ vector
+            top = _top_k(scores, k)
+            best_rows.append(self._row_numbers(row_ids)[top])
+            best_scores.append(scores[top])
+        
+        if not best_rows:
+            return []
+        all_rows = np.concatenate(best_rows)
+        all_scores = np.concatenate(best_scores)
+        top = _top_k(all_scores, k)
+        return [(float(all_scores[i]), self._read_meta(maps, int(all_rows[i]))) for i in top]
+    
+    def _has_tombstones(self, kinds: np.ndarray) -> bool:
+        return any(
+            not kinds[start:start + SCAN_CHUNK_ROWS].all()
+            for start in range(0, len(kinds), SCAN_CHUNK_ROWS)
+        )
+    
+    def _chunks(self, rows: int, candidates: Optional[np.ndarray]):
+        """Yield row selectors (slices over all rows, or slices of the candidate array)"""
+        total = rows if candidates is None else len(candidates)
+        for start in range(0, total, SCAN_CHUNK_ROWS):
+            end = min(start + SCAN_CHUNK_ROWS, total)
+            yield slice(start, end) if candidates is None else candidates[start:end]
+    
+    def _row_numbers(self, row_ids) -> np.ndarray:
+        if isinstance(row_ids, slice):
+            return np.arange(row_ids.start, row_ids.stop)
+        return row_ids
+    
+    def _hamming_candidates(self, codes: np.ndarray, vector: np.ndarray,
+                            candidates: Optional[np.ndarray], n: int) -> np.ndarray:
+        """Rows whose SimHash codes are closest to the query's"""
+        query_code = self.encode(vector.astype(np.float32)[None, :])[0]
+        best_rows, best_distances = [], []
+        for row_ids in self._chunks(len(codes), candidates):
+            xor = np.bitwise_xor(codes[row_ids], query_code)
+            if hasattr(np, "bitwise_count"):
+                distances = np.bitwise_count(xor.view(np.uint64)).sum(axis=1, dtype=np.uint16)
+            else:
+                distances = _POPCOUNT[xor].sum(axis=1, dtype=np.uint16)
+            top = _top_k(distances, n, largest=False)
+            best_rows.append(self._row_numbers(row_ids)[top])
+            best_distances.append(distances[top])
+        
+        all_rows = np.concatenate(best_rows)
+        top = _top_k(np.concatenate(best_distances), n, largest=False)
+        return np.sort(all_rows[top])
+    
+    def _read_meta(self, maps: Dict[str, np.ndarray], row: int) -> Dict:
+        offsets, meta = maps["offsets"], maps["meta"]
+        end = int(offsets[row + 1]) if row + 1 < len(offsets) else len(meta)
+        line = meta[int(offsets[row]):end].tobytes()
+        return json.loads(line.split(b"\n", 1)[0])
@@ -0,0 +1,27 @@
+"""
+Shared fixtures. Tests run against fakeredis (with Lua, for the scripts) and never
+touch a real server; the storage package is imported with the process-local backend.
+"""
+import os
+
+os.environ.setdefault("MEMORY_BACKEND", "memory")
+os.environ.setdefault("SEMANTIC_MEMORY_ENABLED", "false")
+os.environ.setdefault("TOOL_CACHE_REDIS", "false")
+
+import fakeredis
+import pytest
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_client(redis_server):
+    return fakeredis.FakeRedis(server=redis_server, decode_responses=True)
+
+
+@pytest.fixture
+def async_redis_client(redis_server):
+    return fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from storage.keys import entity_key
+from storage.memory import RedisMemoryStore
+from storage.session_queue import SessionQueue, StaleTurnError
+
+
+@pytest.fixture
+def store(redis_client, async_redis_client):
+    return RedisMemoryStore(redis_client, async_redis_client)
+
+
+def _take_turns(async_redis_client, count: int) -> list:
+    """Fencing tokens of `count` consecutive turns of session s1"""
+    queue = SessionQueue(async_redis_client)
+
+    async def run():
+        tokens = []
+        for _ in range(count):
+            async with queue.turn("s1") as token:
+                tokens.append(token)
+        return tokens
+
+    return asyncio.run(run())
+
+
+def test_current_token_stores_the_turn(store, async_redis_client):
+    token, = _take_turns(async_redis_client, 1)
+    store.add_turn("s1", "hello redis", "hi there", fence_token=token)
+
+    assert [m["content"] for m in store.get_messages("s1")] == ["hello redis", "hi there"]
+    assert store.redis.zscore(store.sessions_key, "s1") is not None
+    assert store.redis.hget(store.session_previews_key, "s1") == "hi there"
+    assert [m["content"] for m in store.search_messages("redis", session_id="s1")] == ["hello redis"]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_stale_token_is_rejected_without_side_effects(store, redis_client, async_redis_client, use_async):
+    stale, current = _take_turns(async_redis_client, 2)
+    before = {key: redis_client.dump(key) for key in redis_client.keys("*")}
+
+    with pytest.raises(StaleTurnError):
+        if use_async:
+            asyncio.run(store.aadd_turn("s1", "hello redis", "hi there", fence_token=stale))
+        else:
+            store.add_turn("s1", "hello redis", "hi there", fence_token=stale)
+
+    # Only the fencing counter and lease keys exist; nothing was written for the turn
+    after = {key: redis_client.dump(key) for key in redis_client.keys("*")}
+    assert after == before
+    assert not redis_client.exists(entity_key(store.conversation_key, "s1"))
+    assert redis_client.zscore(store.sessions_key, "s1") is None
+    assert redis_client.hget(store.session_previews_key, "s1") is None
+    assert not redis_client.keys(f"{store.search_key}:*")
+
+    store.add_turn("s1", "hello again", "welcome back", fence_token=current)
+    assert len(store.get_messages("s1")) == 2
@@ -0,0 +1,112 @@
+import asyncio
+import importlib
+
+import pytest
+
+from storage.keys import entity_key
+from storage.session_queue import SessionBusyError, SessionQueue
+
+# The storage package exports a SessionQueue instance under the module's name
+session_queue_module = importlib.import_module("storage.session_queue")
+
+
+def test_turns_get_increasing_fencing_tokens(async_redis_client):
+    queue = SessionQueue(async_redis_client)
+
+    async def run():
+        tokens = []
+        for _ in range(3):
+            async with queue.turn("s1") as token:
+                tokens.append(token)
+        return tokens
+
+    assert asyncio.run(run()) == [1, 2, 3]
+
+
+def test_depth_returns_to_zero_after_cancelled_waiter(async_redis_client):
+    queue = SessionQueue(async_redis_client)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def first():
+            async with queue.turn("s1"):
+                await release.wait()
+
+        async def second():
+            async with queue.turn("s1"):
+                pass
+
+        running = asyncio.create_task(first())
+        await asyncio.sleep(0.05)
+        waiting = asyncio.create_task(second())
+        await asyncio.sleep(0.05)
+        assert await queue.depth("s1") == 2
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert await queue.depth("s1") == 1
+
+        release.set()
+        await running
+        return await queue.depth("s1")
+
+    assert asyncio.run(run()) == 0
+    assert queue._depths == {}
+    assert queue._locks == {}
+
+
+def test_failed_enter_leaves_no_local_depth(async_redis_client, monkeypatch):
+    queue = SessionQueue(async_redis_client)
+
+    def broken_pipeline(*args, **kwargs):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(async_redis_client, "pipeline", broken_pipeline)
+
+    async def run():
+        async with queue.turn("s1"):
+            pass
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+    assert queue._depths == {}
+
+
+def test_full_queue_is_rejected(async_redis_client, monkeypatch):
+    monkeypatch.setattr(session_queue_module, "SESSION_QUEUE_MAX_DEPTH", 1)
+    queue = SessionQueue(async_redis_client)
+
+    async def run():
+        async with queue.turn("s1"):
+            with pytest.raises(SessionBusyError):
+                async with queue.turn("s1"):
+                    pass
+        return await queue.depth("s1")
+
+    assert asyncio.run(run()) == 0
+
+
+def test_lease_is_renewed_during_a_long_turn(async_redis_client, monkeypatch):
+    monkeypatch.setattr(session_queue_module, "SESSION_LOCK_TTL_MS", 300)
+    monkeypatch.setattr(session_queue_module, "SESSION_LOCK_WAIT", 0.2)
+    queue = SessionQueue(async_redis_client)
+    # Another node: same Redis, separate in-process locks
+    other_node = SessionQueue(async_redis_client)
+    lock_key = entity_key(queue.lock_key, "s1")
+
+    async def run():
+        async with queue.turn("s1"):
+            # Three lease lifetimes: only renewal keeps the lock alive
+            await asyncio.sleep(0.9)
+            assert await async_redis_client.exists(lock_key)
+            with pytest.raises(SessionBusyError):
+                async with other_node.turn("s1"):
+                    pass
+        assert not await async_redis_client.exists(lock_key)
+
+        async with other_node.turn("s1") as token:
+            return token
+
+    assert asyncio.run(run()) == 2
@@ -1,21 +1,66 @@
+import importlib
 from langchain_core.tools import Tool, StructuredTool
 from pydantic import BaseModel, Field
-from typing import Optional
-from tools.search_web import web_search
-from tools.run_shell import run_shell
-from tools.web_scraper import web_scrape
-from tools.search_memory import search_memory
-from tools.get_tool_calls import get_tool_calls
-from tools.read_file import read_file
-from tools.write_file import write_file
-from tools.apply_patch import apply_patch
+from typing import Callable, Optional
+from utils.executor import make_async
 
+# Tool modules import their dependencies (ddgs, bs4, requests, storage) at import time
+TOOL_MODULES = ("search_web", "run_shell", "web_scraper", "search_memory", "recall", "get_tool_calls",
+                "read_file", "write_file", "apply_patch")
+
+
+def _lazy(module: str, name: str) -> Callable:
+    """Stand-in for a tool function that imports the tool's module on first call"""
+    function = None
+    
+    def call(*args, **kwargs):
+        nonlocal function
+        if function is None:
+            function = getattr(importlib.import_module(f"tools.{module}"), name)
+        return function(*args, **kwargs)
+    
+    call.__name__ = call.__qualname__ = name
+    return call
+
+
+def preload():
+    """Import every tool module now instead of on the first call of each tool"""
+    for module in TOOL_MODULES:
+        importlib.import_module(f"tools.{module}")
+
+
+web_search = _lazy("search_web", "web_search")
+run_shell = _lazy("run_shell", "run_shell")
+web_scrape = _lazy("web_scraper", "web_scrape")
+search_memory = _lazy("search_memory", "search_memory")
+recall = _lazy("recall", "recall")
+get_tool_calls = _lazy("get_tool_calls", "get_tool_calls")
+read_file = _lazy("read_file", "read_file")
+write_file = _lazy("write_file", "write_file")
+apply_patch = _lazy("apply_patch", "apply_patch")
 
 class SearchMemoryArgs(BaseModel):
     """Arguments for search_memory tool"""
     offset: int = Field(default=0, description='Number of messages to skip (for pagination, ignored if keyword used)')
     limit: int = Field(default=10, description='Maximum number of messages to return (max: 50)')
-    keyword: Optional[str] = Field(default=None, description='Optional keyword to search for in message content. When used, offset is ignored and limit applies to search results.')
+    keyword: Optional[str] = Field(default=None, description='Optional keywords to search for in message content. All words must match unless joined with OR. When used, results are ranked by relevance, offset is ignored and limit applies to search results.')
+    scope: str = Field(default='session', description='"session" searches the current conversation, "global" searches all conversations (keyword search only)')
+    since: Optional[str] = Field(default=None, description='Optional ISO date/datetime; only match messages from this time on (keyword search only)')
+    until: Optional[str] = Field(default=None, description='Optional ISO date/datetime; only match messages up to this time (keyword search only)')
+
+
+class RecallArgs(BaseModel):
+    """Arguments for recall tool"""
+    query: str = Field(description='What to look for, in natural language')
+    scope: str = Field(default='session', description='"session" for the current conversation, "global" for all conversations')
+    kind: str = Field(default='all', description='"message", "tool_call", or "all"')
+    limit: int = Field(default=5, description='Maximum number of results (max: 20)')
+
+
+class GetToolCallsArgs(BaseModel):
+    """Arguments for get_tool_calls tool"""
+    request_id: str = Field(description='The actual request ID (UUID) from search_memory or recall metadata')
+    index: Optional[int] = Field(default=None, description='Optional 1-based number of one tool call to return with its full output')
 
 
 class WebSearchArgs(BaseModel):
@@ -44,9 +89,13 @@ class ApplyPatchArgs(BaseModel):
     target_file: Optional[str] = Field(default=None, description='Optional target file path (if not specified in diff)')
 
 
+# Every tool also gets a coroutine that runs the blocking function in the bounded
+# executor, so agent.ainvoke never blocks the event loop on a tool call and several
+# calls of one step run concurrently (within TOOL_CONCURRENCY_LIMITS)
 tools = [
     StructuredTool.from_function(
         func=web_search,
+        coroutine=make_async(web_search, "duckduckgo_search"),
         name="duckduckgo_search",
         description="Use DuckDuckGo to search recent information on the internet",
         args_schema=WebSearchArgs
@@ -54,38 +103,53 @@ tools = [
     Tool(
         name="run_shell",
         func=run_shell,
+        coroutine=make_async(run_shell, "run_shell"),
         description="Execute shell commands on the system. Use this to run terminal commands, check system status, list files, etc. Be careful with destructive commands."
     ),
     Tool(
         name="web_page_scraper",
         func=web_scrape,
+        coroutine=make_async(web_scrape, "web_page_scraper"),
         description="Scrape content from any website URL. Returns the page title and text content. Use this to extract information from web pages."
     ),
     StructuredTool.from_function(
         func=search_memory,
+        coroutine=make_async(search_memory, "search_memory"),
         name="search_memory",
-        description="Search conversation memory/history. IMPORTANT: You already have direct access to the last 50 messages in the current conversation automatically. Only use this tool when you urgently need to recall specific past conversations beyond the last 50 messages, or when you need to recall specific messages beyond the last 50 messages. ",
+        description="Search conversation memory/history by keywords. IMPORTANT: Your context already holds the most recent messages of the current conversation that fit its token budget (long messages may be shortened), plus a summary of older ones when available. Use this tool to recall exact details from earlier messages that are only summarized or not in your context, or from other conversations.",
         args_schema=SearchMemoryArgs
     ),
-    Tool(
-        name="get_tool_calls",
+    StructuredTool.from_function(
+        func=recall,
+        coroutine=make_async(recall, "recall"),
+        name="recall",
+        description="Semantic search over past messages and tool results (matches meaning, not just keywords). Use it before re-running an expensive tool to check whether an earlier call already answered the question. Results include request IDs usable with get_tool_calls.",
+        args_schema=RecallArgs
+    ),
+    StructuredTool.from_function(
         func=get_tool_calls,
-        description="Get all tool calls (input/output) for a specific request ID. CRITICAL: You CANNOT make up the request_id. You MUST first use 'search_memory' tool to find messages, which will show request IDs in metadata (format: [Request ID: uuid-here]). Only use the actual request_id from search_memory results. Do NOT use tool names or invent IDs. Parameter: request_id (must be the actual UUID from search_memory metadata for a message)."
+        coroutine=make_async(get_tool_calls, "get_tool_calls"),
+        name="get_tool_calls",
+        description="Get all tool calls (input/output) for a specific request ID. CRITICAL: You CANNOT make up the request_id. You MUST first use 'search_memory' or 'recall' to find messages, which will show request IDs in metadata (format: [Request ID: uuid-here]). Only use the actual request_id from search_memory results. Do NOT use tool names or invent IDs. Parameter: request_id (must be the actual UUID from search_memory metadata for a message). Outputs are shown as previews; pass index to get one call's full output.",
+        args_schema=GetToolCallsArgs
     ),
     StructuredTool.from_function(
         func=read_file,
+        coroutine=make_async(read_file, "read_file"),
         name="read_file",
         description="Read file content. Can read entire file or specific line ranges.",
         args_schema=ReadFileArgs
     ),
     StructuredTool.from_function(
         func=write_file,
+        coroutine=make_async(write_file, "write_file"),
         name="write_file",
         description="Write content to a file. Creates directories if needed.",
         args_schema=WriteFileArgs
     ),
     StructuredTool.from_function(
         func=apply_patch,
+        coroutine=make_async(apply_patch, "apply_patch"),
         name="apply_patch",
         description="Apply a unified diff patch to a file.",
         args_schema=ApplyPatchArgs
@@ -1,8 +1,16 @@
+from typing import Optional
 from storage import memory_store
 from utils.logger import log_tool_call
 
+# Longest full output returned to the model in one call
+MAX_FULL_OUTPUT_CHARS = 20000
+
+def _cache_note(call: dict) -> str:
+    """Marks calls served from the tool result cache"""
+    return f" [cache {call['cache']}]" if call.get("cache") else ""
+
 @log_tool_call
-def get_tool_calls(request_id: str) -> str:
+def get_tool_calls(request_id: str, index: Optional[int] = None) -> str:
     """
     Get all tool calls (input/output) for a specific request ID.
     Use this to see what tools were executed and their results for a particular request.
@@ -11,8 +19,11 @@ def get_tool_calls(request_id: str) -> str:
     to find messages, which will return request IDs in the metadata (shown as [Request ID: ...]). 
     Only then can you use that actual request_id with this tool. Do NOT use tool names or make up IDs.
     
+    Outputs are listed as short previews; pass `index` to get the full output of one call.
+    
     Args:
         request_id: The actual request ID (UUID format) obtained from search_memory tool's metadata
+        index: Optional 1-based number of a tool call (as listed) to return in full
         
     Returns:
         Formatted string with all tool calls for the request
@@ -21,6 +32,20 @@ def get_tool_calls(request_id: str) -> str:
         return "Memory store not available (Redis not connected)"
     
     try:
+        if index is not None:
+            call = memory_store.get_tool_call(request_id, index)
+            if not call:
+                return f"No tool call {index} found for request ID: {request_id}"
+            
+            tool_output = call.get("output", "")
+            result = f"Tool call {index} for request ID '{request_id}': {call.get('tool_name', 'unknown').upper()} ({call.get('timestamp', '')}){_cache_note(call)}\n"
+            result += f"  Input: {call.get('input', '')}\n"
+            if len(tool_output) > MAX_FULL_OUTPUT_CHARS:
+                result += f"  Output (first {MAX_FULL_OUTPUT_CHARS} of {len(tool_output)} characters):\n{tool_output[:MAX_FULL_OUTPUT_CHARS]}\n"
+            else:
+                result += f"  Output:\n{tool_output}\n"
+            return result
+        
         tool_calls = memory_store.get_tool_calls(request_id)
         
         if not tool_calls:
@@ -35,9 +60,10 @@ def get_tool_calls(request_id: str) -> str:
             timestamp = call.get("timestamp", "")
             
             # Truncate long outputs
-            output_preview = tool_output[:300] + "..." if len(tool_output) > 300 else tool_output
+            truncated = len(tool_output) > 300 or call.get("truncated")
+            output_preview = tool_output[:300] + "..." if truncated else tool_output
             
-            result += f"[{i}] {tool_name.upper()} ({timestamp})\n"
+            result += f"[{i}] {tool_name.upper()} ({timestamp}){_cache_note(call)}\n"
             result += f"  Input: {tool_input[:200]}{'...' if len(tool_input) > 200 else ''}\n"
             result += f"  Output: {output_preview}\n\n"
         
@@ -1,7 +1,13 @@
+import os
 from typing import Optional
+from storage.tool_cache import FilePolicy
 from utils.logger import log_tool_call
 
-@log_tool_call
+# Longest a cached read is reused, even if the file looks unchanged (seconds)
+READ_FILE_CACHE_TTL = float(os.getenv("READ_FILE_CACHE_TTL", 3600))
+
+# Repeated reads are served from the cache while the file's mtime, size and inode are unchanged
+@log_tool_call(cache=FilePolicy("file_path", ttl=READ_FILE_CACHE_TTL))
 def read_file(file_path: str, start_line: Optional[int] = None, end_line: Optional[int] = None) -> str:
     """
     Read file content, optionally only specific lines.
@@ -0,0 +1,55 @@
+from storage import semantic_memory
+from utils.logger import log_tool_call, get_session_id
+
+@log_tool_call
+def recall(query: str, scope: str = "session", kind: str = "all", limit: int = 5) -> str:
+    """
+    Recall past messages and tool results that are semantically similar to a query.
+    Use this BEFORE re-running an expensive tool (web search, scraping, shell commands)
+    to check whether an earlier call already produced the answer, or to find earlier
+    discussion of a topic even when it was worded differently.
+    
+    Args:
+        query: What to look for, in natural language
+        scope: "session" for the current conversation, "global" for all conversations
+        kind: "message", "tool_call", or "all"
+        limit: Maximum number of results (default: 5, max: 20)
+        
+    Returns:
+        Formatted string with the most similar entries, best first
+    """
+    if not semantic_memory:
+        return "Semantic memory not available"
+    
+    limit = max(1, min(limit, 20))
+    session_id = None if scope == "global" else (get_session_id() or "default")
+    
+    try:
+        results = semantic_memory.recall(
+            query,
+            session_id=session_id,
+            kind=None if kind == "all" else kind,
+            limit=limit,
+        )
+        
+        if not results:
+            return f"Nothing similar to '{query}' found in memory"
+        
+        result = f"Found {len(results)} entries similar to '{query}':\n\n"
+        for i, entry in enumerate(results, start=1):
+            request_id = entry.get("request_id") or "N/A"
+            header = f"[{i}] score={entry['score']} ({entry.get('timestamp', '')}) [Request ID: {request_id}]"
+            if scope == "global":
+                header += f" [Session: {entry.get('session_id')}]"
+            
+            if entry["kind"] == "tool_call":
+                result += f"{header} TOOL {entry.get('tool_name', 'unknown').upper()}\n"
+                result += f"  Input: {entry.get('input', '')}\n"
+                result += f"  Output: {entry.get('text', '')}\n\n"
+            else:
+                result += f"{header} {entry.get('role', 'unknown').upper()}: {entry.get('text', '')}\n\n"
+        
+        return result
+        
+    except Exception as e:
+        return f"Error recalling memory: {str(e)}"
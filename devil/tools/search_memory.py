@@ -1,25 +1,52 @@
+from datetime import datetime
+from typing import Optional
 from storage import memory_store
-from utils.logger import log_tool_call
+from utils.logger import log_tool_call, get_session_id
+
+
+def _parse_date_ms(value: Optional[str]) -> Optional[int]:
+    """Parse an ISO date/datetime into epoch milliseconds"""
+    if not value:
+        return None
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def _format_message(index: int, msg: dict, show_session: bool = False) -> str:
+    role = msg.get("role", "unknown")
+    content = msg.get("content", "")
+    timestamp = msg.get("timestamp", "")
+    metadata = msg.get("metadata", {})
+    request_id = metadata.get("request_id", "N/A")
+    session = f" [Session: {msg.get('session_id')}]" if show_session else ""
+    return f"[{index}] {role.upper()} ({timestamp}){session} [Request ID: {request_id}]: {content}\n\n"
+
 
 @log_tool_call
-def search_memory( offset: int = 0, limit: int = 10, keyword: str = None) -> str:
+def search_memory(offset: int = 0, limit: int = 10, keyword: str = None, scope: str = "session",
+                  since: str = None, until: str = None) -> str:
     """
     Search conversation memory/history.
     Use this tool ONLY when you need to recall specific past conversations 
     or when the user specifically asks about previous conversations about specific topics.
     
-    Note: You already have direct access to the last 50 messages in the current conversation,
-    so only use this tool if you need to search beyond that or need to recall past conversation about specific topics.
+    Note: Your context already holds the most recent messages of the current conversation that fit
+    its token budget (long messages may be shortened), plus a summary of older ones when available,
+    so only use this tool to recall exact details that are only summarized or not in your context,
+    or past conversations about specific topics.
     
     Args:
         offset: Number of messages to skip (for pagination, default: 0). Ignored if keyword is provided.
         limit: Maximum number of messages to return (default: 10, max: 50)
-        keyword: Optional keyword to search for in message content. If provided, searches all messages and returns matching results up to limit (offset is ignored).
+        keyword: Optional keywords to search for in message content. All words must match unless
+            joined with OR (e.g. "redis OR postgres"). Results are ranked by relevance (offset is ignored).
+        scope: "session" to search the current conversation, "global" to search all conversations
+        since: Optional ISO date/datetime; only match messages from then on (keyword search only)
+        until: Optional ISO date/datetime; only match messages up to then (keyword search only)
         
     Returns:
         Formatted string with conversation history
     """
-    session_id = "default"
+    session_id = get_session_id() or "default"
     if not memory_store:
         return "Memory store not available (Redis not connected)"
     
@@ -28,31 +55,24 @@ def search_memory( offset: int = 0, limit: int = 10, keyword: str = None) -> str
     
     try:
         if keyword:
-            # Keyword search: get all messages and filter by keyword
-            all_messages = memory_store.get_messages(session_id, 10000)  # Get more for search
-            
-            # Filter messages containing keyword (case-insensitive)
-            keyword_lower = keyword.lower()
-            matching_messages = []
-            for msg in all_messages:
-                content = msg.get("content", "").lower()
-                if keyword_lower in content:
-                    matching_messages.append(msg)
-                    if len(matching_messages) >= limit:
-                        break
+            # Ranked lookup in the inverted index instead of scanning history
+            search_session = None if scope == "global" else session_id
+            matching_messages = memory_store.search_messages(
+                keyword,
+                session_id=search_session,
+                limit=limit,
+                since_ms=_parse_date_ms(since),
+                until_ms=_parse_date_ms(until),
+            )
+            where = "all sessions" if search_session is None else f"session '{session_id}'"
             
             if not matching_messages:
-                return f"No messages found containing keyword '{keyword}' for session '{session_id}'"
+                return f"No messages found matching '{keyword}' in {where}"
             
             # Format response
-            result = f"Found {len(matching_messages)} messages containing '{keyword}' for session '{session_id}':\n\n"
+            result = f"Found {len(matching_messages)} messages matching '{keyword}' in {where}:\n\n"
             for i, msg in enumerate(matching_messages, start=1):
-                role = msg.get("role", "unknown")
-                content = msg.get("content", "")
-                timestamp = msg.get("timestamp", "")
-                metadata = msg.get("metadata", {})
-                request_id = metadata.get("request_id", "N/A")
-                result += f"[{i}] {role.upper()} ({timestamp}) [Request ID: {request_id}]: {content}\n\n"
+                result += _format_message(i, msg, show_session=search_session is None)
             
             return result
         else:
@@ -68,15 +88,9 @@ def search_memory( offset: int = 0, limit: int = 10, keyword: str = None) -> str
             # Format response
             result = f"Found {len(messages)} messages for session '{session_id}':\n\n"
             for i, msg in enumerate(messages, start=offset + 1):
-                role = msg.get("role", "unknown")
-                content = msg.get("content", "")
-                timestamp = msg.get("timestamp", "")
-                metadata = msg.get("metadata", {})
-                request_id = metadata.get("request_id", "N/A")
-                result += f"[{i}] {role.upper()} ({timestamp}) [Request ID: {request_id}]: {content}\n\n"
+                result += _format_message(i, msg)
             
             return result
         
     except Exception as e:
         return f"Error searching memory: {str(e)}"
-
@@ -1,8 +1,13 @@
 # tools.py
+import os
 from ddgs import DDGS
+from storage.tool_cache import TTLPolicy
 from utils.logger import log_tool_call
 
-@log_tool_call
+# Seconds identical searches are answered from the cache
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", 900))
+
+@log_tool_call(cache=TTLPolicy(WEB_SEARCH_CACHE_TTL))
 def web_search(query: str, max_results: int = 10):
     """
     Simple DuckDuckGo search function.
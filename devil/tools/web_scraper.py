@@ -1,3 +1,4 @@
+import os
 import random
 import requests
 import warnings
@@ -5,10 +6,16 @@ from typing import Dict, Any
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+from storage.tool_cache import RevalidatePolicy, record_validators
 from utils.logger import log_tool_call
 
 warnings.filterwarnings("ignore")
 
+# Seconds a scraped page is reused without asking the server
+WEB_SCRAPE_CACHE_MAX_AGE = float(os.getenv("WEB_SCRAPE_CACHE_MAX_AGE", 300))
+# Seconds a scraped page may be kept by revalidating it (ETag / Last-Modified)
+WEB_SCRAPE_CACHE_TTL = float(os.getenv("WEB_SCRAPE_CACHE_TTL", 86400))
+
 # Define a list of rotating user agents
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36",
@@ -71,6 +78,9 @@ def scrape_url(url: str, timeout: int = 30) -> Dict[str, Any]:
         result["status_code"] = response.status_code
         
         if response.status_code == 200:
+            # Lets the tool result cache revalidate this page later
+            record_validators(etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
+            
             soup = BeautifulSoup(response.text, "html.parser")
             
             # Extract title
@@ -100,7 +110,27 @@ def scrape_url(url: str, timeout: int = 30) -> Dict[str, Any]:
     return result
 
 
-@log_tool_call
+def revalidate(arguments: Dict[str, Any], validators: Dict[str, str]) -> bool:
+    """
+    Conditional request for a cached page.
+    
+    Args:
+        arguments: Arguments of the cached web_scrape call
+        validators: ETag / Last-Modified recorded when the page was scraped
+    
+    Returns:
+        True if the server answered 304 Not Modified (the body is never downloaded)
+    """
+    headers = {"User-Agent": random.choice(USER_AGENTS)}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    with get_session().get(arguments["url"], headers=headers, timeout=10, stream=True) as response:
+        return response.status_code == 304
+
+
+@log_tool_call(cache=RevalidatePolicy(revalidate, max_age=WEB_SCRAPE_CACHE_MAX_AGE, ttl=WEB_SCRAPE_CACHE_TTL))
 def web_scrape(url: str) -> str:
     """
     Web scraping tool function for LangChain agent.
@@ -0,0 +1,138 @@
+"""
+Bounded thread pool for blocking work called from async code.
+
+Tools (subprocess, HTTP scraping, file I/O, sync Redis) are blocking. The async
+request path offloads them here instead of the event loop's unbounded default
+executor, so a burst of tool calls cannot exhaust threads needed elsewhere.
+
+When the model emits several tool calls in one step, the agent awaits their
+coroutines together, so independent calls run concurrently. Per-tool limits
+(TOOL_CONCURRENCY_LIMITS) keep that safe: e.g. shell commands and file writes of a
+session run one at a time while page scrapes fan out. Session turns never overlap
+across nodes (storage.session_queue), so per-session limits only need to hold
+within a process.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from utils.logger import get_session_id
+
+# Maximum number of blocking calls running at once in this process
+MAX_WORKERS = int(os.getenv("TOOL_EXECUTOR_MAX_WORKERS", 32))
+# Concurrent calls per tool, comma-separated: "tool=N" per process, "tool=session:N" per session
+TOOL_CONCURRENCY_LIMITS = os.getenv(
+    "TOOL_CONCURRENCY_LIMITS",
+    "run_shell=session:1,write_file=session:1,apply_patch=session:1,web_page_scraper=8,duckduckgo_search=4",
+)
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="tool")
+
+
+def parse_limits(value: str) -> Dict[str, Tuple[int, bool]]:
+    """Parse TOOL_CONCURRENCY_LIMITS into tool name -> (max concurrent calls, per session)"""
+    limits = {}
+    for item in value.split(","):
+        name, _, limit = item.strip().partition("=")
+        if not name or not limit:
+            continue
+        per_session = limit.startswith("session:")
+        limits[name.strip()] = (max(1, int(limit.split(":")[-1])), per_session)
+    return limits
+
+
+class ToolLimiter:
+    """
+    Caps concurrent calls of each tool, per process or per session.
+    
+    Semaphores are created on first use and per-session ones are dropped once no
+    call of that session holds or waits for them.
+    """
+    
+    def __init__(self, limits: Dict[str, Tuple[int, bool]]):
+        self.limits = limits
+        self._semaphores: Dict[Tuple[str, Optional[str]], asyncio.Semaphore] = {}
+        self._users: Dict[Tuple[str, Optional[str]], int] = {}
+    
+    async def acquire(self, tool_name: str) -> Optional[Callable[[], None]]:
+        """
+        Take one of the tool's slots.
+        
+        Returns:
+            Function giving the slot back (call it on the event loop), or None for unlimited tools
+        """
+        limit = self.limits.get(tool_name)
+        if limit is None:
+            return None
+        
+        count, per_session = limit
+        key = (tool_name, (get_session_id() or "default") if per_session else None)
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(count)
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            await semaphore.acquire()
+        except BaseException:
+            self._leave(key, per_session)
+            raise
+        
+        def release():
+            semaphore.release()
+            self._leave(key, per_session)
+        
+        return release
+    
+    def _leave(self, key: Tuple[str, Optional[str]], per_session: bool):
+        self._users[key] -= 1
+        if not self._users[key] and per_session:
+            del self._users[key]
+            del self._semaphores[key]
+
+
+tool_limiter = ToolLimiter(parse_limits(TOOL_CONCURRENCY_LIMITS))
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking function in the bounded executor and await its result.
+    
+    The caller's context (e.g. the request ID ContextVar) is copied into the
+    worker thread so tool-call logging is attributed to the right request.
+    """
+    return await asyncio.wrap_future(_submit(func, *args, **kwargs))
+
+
+def _submit(func: Callable, *args, **kwargs) -> Future:
+    ctx = contextvars.copy_context()
+    return _executor.submit(ctx.run, func, *args, **kwargs)
+
+
+def make_async(func: Callable, tool_name: Optional[str] = None) -> Callable:
+    """
+    Wrap a blocking function into a coroutine function that runs it via run_blocking.
+    
+    A limited tool's slot is given back when its thread finishes, not when the
+    awaiting task is cancelled: the thread keeps running either way.
+    
+    Args:
+        func: Blocking function
+        tool_name: Tool name whose TOOL_CONCURRENCY_LIMITS entry applies to the calls
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        release = await tool_limiter.acquire(tool_name) if tool_name is not None else None
+        if release is None:
+            return await run_blocking(func, *args, **kwargs)
+        try:
+            future = _submit(func, *args, **kwargs)
+        except BaseException:
+            release()
+            raise
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+        return await asyncio.wrap_future(future)
+    
+    return wrapper
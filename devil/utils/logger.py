@@ -23,18 +23,81 @@ def get_request_id() -> Optional[str]:
     """Get the current request ID from context variable"""
     return _request_id_var.get()
 
+# Context variable for the session of the current request, so tools can scope to it
+_session_id_var: ContextVar[Optional[str]] = ContextVar('session_id', default=None)
 
-def log_tool_call(func: Callable) -> Callable:
+def set_session_id(session_id: str):
+    """Set the current session ID in context variable"""
+    _session_id_var.set(session_id)
+
+def get_session_id() -> Optional[str]:
+    """Get the current session ID from context variable"""
+    return _session_id_var.get()
+
+# Names of tools run by the current request. Holds a mutable set so tools running
+# in executor threads (with a copy of the context) add to the same object.
+_tools_used_var: ContextVar[Optional[set]] = ContextVar('tools_used', default=None)
+
+def track_tools_used() -> set:
+    """Start recording tool names used by the current request and return the live set"""
+    tools_used = set()
+    _tools_used_var.set(tools_used)
+    return tools_used
+
+
+def _publish_tool_event(request_id: Optional[str], event: dict):
+    """Publish a live tool event on the request's Redis channel (best effort)"""
+    if not request_id:
+        return
+    try:
+        from storage import memory_store
+        if memory_store:
+            memory_store.publish_tool_event(request_id, event)
+    except Exception as e:
+        logger.error(f"[TOOL PUBLISH ERROR] Failed to publish tool event: {e}")
+
+
+def _index_tool_call(request_id: str, tool_call: dict):
+    """Add a successful tool call to the semantic recall index (errors are only logged)"""
+    try:
+        from storage import semantic_memory
+        if semantic_memory:
+            semantic_memory.add_tool_call(get_session_id() or "default", request_id, tool_call)
+    except Exception as e:
+        logger.error(f"[TOOL INDEX ERROR] Failed to index tool call: {e}")
+
+
+def _call_tool(func: Callable, cache: Any, tool_name: str, args: tuple, kwargs: dict) -> tuple:
+    """Run a tool, through the tool result cache when it has a cache policy"""
+    if cache is not None:
+        from storage import tool_cache
+        if tool_cache is not None:
+            return tool_cache.call(tool_name, cache, func, args, kwargs)
+    return func(*args, **kwargs), None
+
+
+def log_tool_call(func: Optional[Callable] = None, *, cache: Any = None) -> Callable:
     """
     Decorator to automatically log tool calls.
     Logs [TOOL START], [TOOL END], and [TOOL ERROR] for all tool functions.
-    Also stores tool calls in Redis if request_id is available.
+    Also stores tool calls in Redis if request_id is available and publishes
+    tool_start/tool_call events on the request's pub/sub channel.
+    
+    Use as `@log_tool_call`, or `@log_tool_call(cache=policy)` to serve repeated
+    calls from the tool result cache (storage/tool_cache.py).
     """
+    if func is None:
+        return functools.partial(log_tool_call, cache=cache)
+    
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         tool_name = func.__name__
         request_id = get_request_id()
         
+        tools_used = _tools_used_var.get()
+        if tools_used is not None:
+            tools_used.add(tool_name)
+        
         # Format arguments for logging
         args_str = ", ".join([str(arg) for arg in args])
         kwargs_str = ", ".join([f"{k}={v}" for k, v in kwargs.items()])
@@ -42,22 +105,32 @@ def log_tool_call(func: Callable) -> Callable:
         
         # Log tool start
         logger.info(f"[TOOL START] {tool_name}: {all_args}")
+        _publish_tool_event(request_id, {
+            "type": "tool_start",
+            "tool_name": tool_name,
+            "input": all_args,
+            "timestamp": datetime.now().isoformat()
+        })
         
         try:
-            # Execute the tool function
-            result = func(*args, **kwargs)
+            # Execute the tool function ("hit" / "revalidated" when served from the cache)
+            result, cache_status = _call_tool(func, cache, tool_name, args, kwargs)
             
             result_str = str(result)
             len_result_str = len(result_str)
             # Log tool end
-            logger.info(f"[TOOL END] {tool_name}: {result_str[:100]} {'(truncated)' if len_result_str > 100 else ''}")
+            cached = f" (cache {cache_status})" if cache_status else ""
+            logger.info(f"[TOOL END] {tool_name}{cached}: {result_str[:100]} {'(truncated)' if len_result_str > 100 else ''}")
             
             # Store tool call in Redis if request_id is available
             if request_id:
                 try:
                     from storage import memory_store
                     if memory_store:
-                        memory_store.add_tool_call(request_id, tool_name, all_args, str(result))
+                        tool_call = memory_store.add_tool_call(request_id, tool_name, all_args, result_str, cache=cache_status)
+                        _publish_tool_event(request_id, {"type": "tool_call", **tool_call})
+                        # The stored record may only hold a preview; index the full output
+                        _index_tool_call(request_id, {**tool_call, "output": result_str})
                     else:
                         logger.warning(f"[TOOL STORE FAILED] memory_store is None for request_id: {request_id}")
                 except Exception as e:
@@ -76,7 +149,8 @@ def log_tool_call(func: Callable) -> Callable:
                 try:
                     from storage import memory_store
                     if memory_store:
-                        memory_store.add_tool_call(request_id, tool_name, all_args, f"ERROR: {str(e)}")
+                        tool_call = memory_store.add_tool_call(request_id, tool_name, all_args, f"ERROR: {str(e)}")
+                        _publish_tool_event(request_id, {"type": "tool_call", **tool_call})
                 except Exception:
                     pass
             
@@ -0,0 +1,87 @@
+"""
+Local token counting for prompt budgeting.
+
+Uses tiktoken (installed with langchain-openai) when its encoding can be loaded,
+otherwise estimates about four characters per token. Counts only need to be
+close: they size the context sent to the LLM, they are not billed.
+"""
+import os
+import threading
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# tiktoken encoding used for counting (cl100k_base matches most OpenAI-compatible chat models)
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# Tokens a chat message costs beyond its content (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Characters per token of the fallback estimate
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """tiktoken encoding, or None if unavailable (loading may need a download once)"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                if tiktoken is not None:
+                    try:
+                        _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                    except Exception as e:
+                        print(f"[DEBUG] Tokenizer {TOKENIZER_ENCODING} unavailable, estimating token counts: {e}")
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """Number of tokens in a text"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(content: Optional[str]) -> int:
+    """Tokens a chat message with this content adds to a prompt"""
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_tokens(text: str, max_tokens: int, marker: str = "\n[... {omitted} tokens omitted ...]\n") -> str:
+    """
+    Shorten a text to about max_tokens, keeping its head and tail.
+    
+    Args:
+        text: Text to shorten
+        max_tokens: Token budget for the result
+        marker: Placed between head and tail; {omitted} is replaced by the tokens cut
+    
+    Returns:
+        The text unchanged if it fits, otherwise head + marker + tail
+    """
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    # Logs and tracebacks carry most information at their end, so the tail gets more
+    head_tokens = max_tokens // 3
+    tail_tokens = max_tokens - head_tokens
+    omitted = total - head_tokens - tail_tokens
+    if encoding is None:
+        head = text[:head_tokens * CHARS_PER_TOKEN]
+        tail = text[len(text) - tail_tokens * CHARS_PER_TOKEN:]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        head = encoding.decode(tokens[:head_tokens])
+        tail = encoding.decode(tokens[-tail_tokens:]) if tail_tokens else ""
+    return head + marker.format(omitted=omitted) + tail
@@ -0,0 +1,111 @@
+"""
+Agent worker fleet for background jobs.
+
+Each worker process runs one event loop with JOB_WORKER_CONCURRENCY consumer tasks
+reading from the Redis Stream consumer group (see storage/jobs.py). Jobs are run
+through the same process_query used by /api/v1/chat, so API nodes and agent nodes
+can be scaled independently.
+"""
+import asyncio
+import os
+import signal
+import socket
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Consumer tasks per worker process
+WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", 4))
+# Attempts before a job is marked as failed
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+# Pending entries idle for longer than this are reclaimed from dead workers
+CLAIM_IDLE_MS = int(os.getenv("JOB_CLAIM_IDLE_MS", 60000))
+
+
+async def _keep_alive(job_queue, consumer: str, entry_id: str):
+    """Periodically reset the entry's idle time while the job is running"""
+    while True:
+        await asyncio.sleep(CLAIM_IDLE_MS / 3000)
+        try:
+            await job_queue.heartbeat(consumer, entry_id)
+        except Exception as e:
+            print(f"[WORKER] Heartbeat failed for {entry_id}: {e}")
+
+
+async def handle_job(job_queue, consumer: str, entry_id: str, fields: dict):
+    """Run a single job and record its outcome (Redis errors propagate; see consume)"""
+    from controllers.ask import process_query
+    
+    request_id = fields["request_id"]
+    attempts = await job_queue.start_attempt(request_id, consumer)
+    if attempts > MAX_ATTEMPTS:
+        await job_queue.fail(entry_id, request_id, f"Gave up after {MAX_ATTEMPTS} attempts")
+        return
+    
+    keep_alive = asyncio.create_task(_keep_alive(job_queue, consumer, entry_id))
+    try:
+        use_cache = fields.get("use_cache")
+        response, _, _ = await process_query(
+            fields["session_id"], fields["query"], request_id=request_id,
+            use_cache=None if use_cache is None else use_cache == "true",
+            history=fields.get("history"),
+        )
+    except Exception as e:
+        print(f"[WORKER] Job {request_id} attempt {attempts} failed: {e}")
+        if attempts >= MAX_ATTEMPTS:
+            await job_queue.fail(entry_id, request_id, str(e))
+        else:
+            await job_queue.retry_later(request_id, str(e))
+        return
+    finally:
+        keep_alive.cancel()
+    
+    await job_queue.complete(entry_id, request_id, response)
+
+
+async def consume(job_queue, consumer: str, stop: asyncio.Event):
+    """Consumer loop: reclaim stale jobs first, otherwise block for new ones"""
+    while not stop.is_set():
+        try:
+            entries = await job_queue.claim_stale(consumer, CLAIM_IDLE_MS)
+            if not entries:
+                entries = await job_queue.read(consumer, block_ms=2000)
+        except Exception as e:
+            print(f"[WORKER] {consumer} failed to read jobs: {e}")
+            await asyncio.sleep(1)
+            continue
+        
+        for entry_id, fields in entries:
+            try:
+                await handle_job(job_queue, consumer, entry_id, fields)
+            except Exception as e:
+                # Left pending (unacknowledged), so XAUTOCLAIM hands it out again after CLAIM_IDLE_MS
+                print(f"[WORKER] {consumer} failed to record job {fields.get('request_id')} ({entry_id}): {e}")
+
+
+async def run_worker(worker_name: str):
+    """Run WORKER_CONCURRENCY consumers until SIGINT/SIGTERM, letting in-flight jobs finish"""
+    from storage import job_queue
+    
+    if not job_queue:
+        raise RuntimeError("Redis not available; job workers need Redis")
+    
+    await job_queue.ensure_group()
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    consumers = [
+        consume(job_queue, f"{worker_name}-{i}", stop)
+        for i in range(WORKER_CONCURRENCY)
+    ]
+    print(f"[WORKER] {worker_name} started with {WORKER_CONCURRENCY} consumers")
+    await asyncio.gather(*consumers)
+    print(f"[WORKER] {worker_name} stopped")
+
+
+def worker_main(index: int):
+    """Process entry point"""
+    asyncio.run(run_worker(f"{socket.gethostname()}-{os.getpid()}-{index}"))
@@ -0,0 +1,38 @@
+"""
+Start the agent worker pool:
+    
+    python -m workers [--processes N]
+"""
+import argparse
+import multiprocessing
+import os
+from workers import worker_main
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background agent job workers")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=int(os.getenv("JOB_WORKER_PROCESSES", 2)),
+        help="Number of worker processes (default: JOB_WORKER_PROCESSES or 2)",
+    )
+    args = parser.parse_args()
+    
+    # Spawn fresh interpreters so no Redis connection or event loop is shared across processes
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=worker_main, args=(i,)) for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Children received SIGINT too and drain their in-flight jobs
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Retention worker: applies the policies in storage/retention.py every RETENTION_INTERVAL seconds.
+    
+    python -m workers.retention
+
+Safe to run on several nodes; only one pass runs at a time.
+"""
+import asyncio
+import signal
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+async def run_retention():
+    """Run passes until SIGINT/SIGTERM"""
+    from storage import memory_store, session_queue
+    from storage.memory import RedisMemoryStore
+    from storage.retention import RetentionWorker, RETENTION_INTERVAL
+    
+    if not isinstance(memory_store, RedisMemoryStore):
+        raise RuntimeError("Redis not available; the retention worker needs Redis")
+    
+    worker = RetentionWorker(memory_store, session_queue)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    print(f"[RETENTION] Started, one pass every {RETENTION_INTERVAL:g}s")
+    while not stop.is_set():
+        try:
+            if await worker.run_once() is None:
+                print("[RETENTION] Another node is running a pass")
+        except Exception as e:
+            print(f"[RETENTION] Pass failed: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=RETENTION_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+    print("[RETENTION] Stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_retention())
@@ -1,9 +1,9 @@
 'use client'
 
 import { Message } from '@/types'
-import { useState, useEffect, useRef, useCallback } from 'react'
+import { useState, useEffect, useCallback } from 'react'
 import ReactMarkdown from 'react-markdown'
-import { getToolCalls, ToolCall } from '@/lib/api-utils'
+import { getToolCalls, subscribeToolCalls, ToolCall } from '@/lib/api-utils'
 import ToolCalls from './ToolCalls'
 
 interface ChatMessageProps {
@@ -17,7 +17,6 @@ export default function ChatMessage({ message, isActive = false, requestId }: Ch
   const [showLogs, setShowLogs] = useState(false)
   const [toolCalls, setToolCalls] = useState<ToolCall[]>([])
   const [loadingLogs, setLoadingLogs] = useState(false)
-  const pollingIntervalRef = useRef<NodeJS.Timeout | null>(null)
   const effectiveRequestId = requestId || message.requestId
 
   const fetchToolCalls = useCallback(async () => {
@@ -37,34 +36,24 @@ export default function ChatMessage({ message, isActive = false, requestId }: Ch
     }
   }, [effectiveRequestId, isActive])
 
-  // Auto-poll when isActive is true
+  // Subscribe to live tool-call events while the request is active
   useEffect(() => {
-    if (isActive && effectiveRequestId) {
-      // Fetch immediately
-      fetchToolCalls()
-      
-      // Start polling every 1 second
-      pollingIntervalRef.current = setInterval(() => {
-        fetchToolCalls()
-      }, 1000)
-
-      // Auto-show logs
-      setShowLogs(true)
-
-      return () => {
-        if (pollingIntervalRef.current) {
-          clearInterval(pollingIntervalRef.current)
-          pollingIntervalRef.current = null
-        }
-      }
-    } else {
-      // Stop polling when not active
-      if (pollingIntervalRef.current) {
-        clearInterval(pollingIntervalRef.current)
-        pollingIntervalRef.current = null
-      }
-    }
-  }, [isActive, effectiveRequestId, fetchToolCalls])
+    if (!isActive || !effectiveRequestId) return
+
+    // Auto-show logs
+    setShowLogs(true)
+
+    return subscribeToolCalls(effectiveRequestId, {
+      onSnapshot: (calls) => setToolCalls(calls),
+      onToolCall: (call) =>
+        setToolCalls((prev) =>
+          call.index !== undefined && prev.some((c) => c.index === call.index)
+            ? prev
+            : [...prev, call]
+        ),
+      onError: (error) => console.error('Tool call stream error:', error),
+    })
+  }, [isActive, effectiveRequestId])
 
   const copyToClipboard = () => {
     navigator.clipboard.writeText(message.content)
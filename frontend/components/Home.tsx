@@ -9,6 +9,7 @@ import EmptyState from '@/components/EmptyState'
 import ThemeToggle from '@/components/ThemeToggle'
 import { Message } from '@/types'
 import { sendMessage, getHistory } from '@/lib/api-utils'
+import { HistoryResponse } from '@/lib/api-utils/types'
 
 // Generate UUID v4
 function generateUUID(): string {
@@ -27,6 +28,8 @@ export default function Home() {
   const [sessionId, setSessionId] = useState<string | null>(null)
   const [sidebarOpen, setSidebarOpen] = useState(false)
   const [currentRequestId, setCurrentRequestId] = useState<string | null>(null)
+  // Cursor for the page before the oldest loaded message (null when all are loaded)
+  const [olderCursor, setOlderCursor] = useState<string | null>(null)
   const messagesEndRef = useRef<HTMLDivElement>(null)
 
   useEffect(() => {
@@ -118,35 +121,51 @@ export default function Home() {
     }
   }
 
+  // Convert API messages to frontend Message format with unique IDs
+  const convertHistory = (sessionIdToLoad: string, history: HistoryResponse): Message[] =>
+    history.messages.map((msg, index) => {
+      // Stored message ID when present, else timestamp + index + role to ensure uniqueness
+      const uniqueId = msg.id
+        ?? (msg.metadata?.request_id
+          ? `${msg.metadata.request_id}-${msg.role}-${index}`
+          : `${sessionIdToLoad}-${msg.timestamp}-${index}-${msg.role}`)
+      
+      return {
+        id: uniqueId,
+        role: msg.role as 'user' | 'assistant',
+        content: msg.content,
+        timestamp: msg.timestamp,
+        requestId: msg.metadata?.request_id
+      }
+    })
+
   const loadSession = async (sessionIdToLoad: string) => {
     setSessionId(sessionIdToLoad)
     setIsLoading(true)
     try {
       const history = await getHistory(sessionIdToLoad)
-      // Convert API messages to frontend Message format with unique IDs
-      const convertedMessages: Message[] = history.messages.map((msg, index) => {
-        // Use timestamp + index + role to ensure uniqueness
-        const uniqueId = msg.metadata?.request_id 
-          ? `${msg.metadata.request_id}-${msg.role}-${index}`
-          : `${sessionIdToLoad}-${msg.timestamp}-${index}-${msg.role}`
-        
-        return {
-          id: uniqueId,
-          role: msg.role as 'user' | 'assistant',
-          content: msg.content,
-          timestamp: msg.timestamp,
-          requestId: msg.metadata?.request_id
-        }
-      })
-      setMessages(convertedMessages)
+      setMessages(convertHistory(sessionIdToLoad, history))
+      setOlderCursor(history.older_cursor)
     } catch (error) {
       console.error('Failed to load session history:', error)
       setMessages([])
+      setOlderCursor(null)
     } finally {
       setIsLoading(false)
     }
   }
 
+  const loadEarlierMessages = async () => {
+    if (!sessionId || !olderCursor) return
+    try {
+      const history = await getHistory(sessionId, 100, olderCursor)
+      setMessages(prev => [...convertHistory(sessionId, history), ...prev])
+      setOlderCursor(history.older_cursor)
+    } catch (error) {
+      console.error('Failed to load earlier messages:', error)
+    }
+  }
+
   const updateSessionInUrl = (newSessionId: string) => {
     const params = new URLSearchParams(searchParams.toString())
     params.set('session', newSessionId)
@@ -155,6 +174,7 @@ export default function Home() {
 
   const handleNewChat = () => {
     setMessages([])
+    setOlderCursor(null)
     setSessionId(null)
     window.location.href = '/'
   }
@@ -199,6 +219,16 @@ export default function Home() {
               <EmptyState onSuggestionClick={handleSuggestionClick} />
             ) : (
               <div className="space-y-6">
+                {olderCursor && (
+                  <div className="flex justify-center">
+                    <button
+                      onClick={loadEarlierMessages}
+                      className="px-3 py-1 text-sm text-muted-foreground hover:bg-muted rounded-lg transition-colors"
+                    >
+                      Load earlier messages
+                    </button>
+                  </div>
+                )}
                 {messages.map((message, index) => {
                   // Check if this is the last message and we're loading
                   const isLastMessage = index === messages.length - 1
@@ -1,6 +1,7 @@
 'use client'
 
 import { ToolCall } from '@/lib/api-utils/types'
+import { getToolCall } from '@/lib/api-utils/tool-calls'
 import { useState } from 'react'
 
 interface ToolCallsProps {
@@ -11,6 +12,21 @@ interface ToolCallsProps {
 
 export default function ToolCalls({ toolCalls, requestId, isActive = false }: ToolCallsProps) {
   const [expandedIndex, setExpandedIndex] = useState<number | null>(null)
+  // Full outputs of truncated calls, loaded on demand, keyed by position
+  const [fullOutputs, setFullOutputs] = useState<Record<number, string>>({})
+  const [loadingIndex, setLoadingIndex] = useState<number | null>(null)
+
+  const loadFullOutput = async (call: ToolCall, position: number) => {
+    setLoadingIndex(position)
+    try {
+      const data = await getToolCall(requestId, call.index ?? position + 1)
+      setFullOutputs((prev) => ({ ...prev, [position]: data.tool_call.output }))
+    } catch (error) {
+      console.error('Error loading full tool output:', error)
+    } finally {
+      setLoadingIndex(null)
+    }
+  }
 
   if (!toolCalls || toolCalls.length === 0) {
     if(isActive) return null;
@@ -76,8 +92,19 @@ export default function ToolCalls({ toolCalls, requestId, isActive = false }: To
               <div>
                 <div className="text-xs font-medium text-muted-foreground mb-1">Output:</div>
                 <pre className="text-xs text-foreground bg-background p-2 rounded border border-border whitespace-pre-wrap break-words max-h-64 overflow-y-auto">
-                  {call.output}
+                  {fullOutputs[index] ?? call.output}
                 </pre>
+                {call.truncated && fullOutputs[index] === undefined && (
+                  <button
+                    onClick={() => loadFullOutput(call, index)}
+                    disabled={loadingIndex === index}
+                    className="mt-1 text-xs text-muted-foreground underline hover:text-foreground disabled:opacity-50"
+                  >
+                    {loadingIndex === index
+                      ? 'Loading...'
+                      : `Show full output${call.output_size ? ` (${Math.ceil(call.output_size / 1024)} KB)` : ''}`}
+                  </button>
+                )}
               </div>
               <div className="text-xs text-muted-foreground">
                 {new Date(call.timestamp).toLocaleString()}
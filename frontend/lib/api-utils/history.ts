@@ -1,18 +1,38 @@
 import { HistoryResponse } from './types'
 import { API_BASE_URL } from '@/constant'
 
+// Last response per URL with its ETag; revalidated with If-None-Match on every call,
+// so switching back to a session only transfers its history again if it changed
+const historyCache = new Map<string, { etag: string; data: HistoryResponse }>()
+
 export async function getHistory(
   sessionId: string,
-  limit: number = 100
+  limit: number = 100,
+  before?: string
 ): Promise<HistoryResponse> {
-  const response = await fetch(
-    `${API_BASE_URL}/history/${sessionId}?limit=${limit}`
-  )
+  const params = new URLSearchParams({ limit: String(limit) })
+  if (before) {
+    params.set('before', before)
+  }
+  const url = `${API_BASE_URL}/history/${sessionId}?${params.toString()}`
+  const cached = historyCache.get(url)
+
+  const response = await fetch(url, {
+    headers: cached ? { 'If-None-Match': cached.etag } : {},
+  })
+
+  if (response.status === 304 && cached) {
+    return cached.data
+  }
 
   if (!response.ok) {
     throw new Error('Failed to get history')
   }
 
-  return response.json()
+  const data: HistoryResponse = await response.json()
+  const etag = response.headers.get('ETag')
+  if (etag) {
+    historyCache.set(url, { etag, data })
+  }
+  return data
 }
-
@@ -1,8 +1,14 @@
 import { SessionsResponse } from './types'
 import { API_BASE_URL } from '@/constant'
 
-export async function getSessions(): Promise<SessionsResponse> {
-  const response = await fetch(`${API_BASE_URL}/sessions`)
+export async function getSessions(
+  cursor?: number | null,
+  limit: number = 100
+): Promise<SessionsResponse> {
+  const params = new URLSearchParams({ limit: String(limit) })
+  if (cursor != null) params.set('cursor', String(cursor))
+
+  const response = await fetch(`${API_BASE_URL}/sessions?${params}`)
 
   if (!response.ok) {
     throw new Error('Failed to get sessions')
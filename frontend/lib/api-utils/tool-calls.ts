@@ -1,4 +1,4 @@
-import { ToolCallsResponse } from './types'
+import { ToolCall, ToolCallResponse, ToolCallsResponse } from './types'
 import { API_BASE_URL } from '@/constant'
 
 export async function getToolCalls(requestId: string): Promise<ToolCallsResponse> {
@@ -16,3 +16,57 @@ export async function getToolCalls(requestId: string): Promise<ToolCallsResponse
   return response.json()
 }
 
+// Fetch one tool call (1-based index) with its full output
+export async function getToolCall(requestId: string, index: number): Promise<ToolCallResponse> {
+  const response = await fetch(`${API_BASE_URL}/tool-calls/${requestId}/${index}`, {
+    method: 'GET',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+  })
+
+  if (!response.ok) {
+    throw new Error('Failed to fetch tool call')
+  }
+
+  return response.json()
+}
+
+
+export interface ToolCallsSubscriptionHandlers {
+  onSnapshot: (toolCalls: ToolCall[]) => void
+  onToolCall: (toolCall: ToolCall) => void
+  onDone?: () => void
+  onError?: (error: Event) => void
+}
+
+// Subscribe to live tool-call events for a request (snapshot first, then deltas).
+// Returns a function that closes the subscription.
+export function subscribeToolCalls(
+  requestId: string,
+  handlers: ToolCallsSubscriptionHandlers
+): () => void {
+  const source = new EventSource(`${API_BASE_URL}/tool-calls/${requestId}/stream`)
+
+  source.addEventListener('snapshot', (event) => {
+    const data: ToolCallsResponse = JSON.parse((event as MessageEvent).data)
+    handlers.onSnapshot(data.tool_calls || [])
+  })
+
+  source.addEventListener('tool_call', (event) => {
+    handlers.onToolCall(JSON.parse((event as MessageEvent).data))
+  })
+
+  source.addEventListener('done', () => {
+    source.close()
+    handlers.onDone?.()
+  })
+
+  source.onerror = (error) => {
+    // Server closed the stream or the connection dropped; don't auto-reconnect
+    source.close()
+    handlers.onError?.(error)
+  }
+
+  return () => source.close()
+}
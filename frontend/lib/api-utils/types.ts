@@ -1,10 +1,12 @@
 export interface Session {
   session_id: string
   last_message: string
+  last_activity?: number
 }
 
 export interface SessionsResponse {
   sessions: Session[]
+  next_cursor?: number | null
 }
 
 export interface QueryRequest {
@@ -20,6 +22,7 @@ export interface QueryResponse {
 }
 
 export interface Message {
+  id?: string
   role: 'user' | 'assistant'
   content: string
   timestamp: string
@@ -31,12 +34,21 @@ export interface Message {
 export interface HistoryResponse {
   messages: Message[]
   session_id: string
+  count: number
+  version: number
+  // Pass as `before` to load the previous page; null when there are no older messages
+  older_cursor: string | null
+  newer_cursor: string | null
 }
 
 export interface ToolCall {
+  index?: number
   tool_name: string
   input: string
   output: string
+  // Set when output is only a preview of a large, compressed output
+  truncated?: boolean
+  output_size?: number
   timestamp: string
 }
 
@@ -45,3 +57,8 @@ export interface ToolCallsResponse {
   tool_calls: ToolCall[]
 }
 
+export interface ToolCallResponse {
+  request_id: string
+  tool_call: ToolCall
+}
+